@@ -0,0 +1,261 @@
+"""Time and memory-profile the Python modules of the pipeline on synthetic data.
+
+Usage:
+    python -m benchmarks.run_benchmarks [--scales 1 10 100] [-o results.json]
+    python -m benchmarks.run_benchmarks --compare base.json results.json
+
+Each benchmark runs on data generated at each scale (see `BASE_SIZES`). The
+time is the fastest of `--repeat` runs, and the peak memory is that traced by
+`tracemalloc` (Python and numpy allocations) in one more run, because tracing
+slows the code down. The results are saved as JSON with the commit they were
+measured on, so the results of two commits can be compared.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.synthetic import (synthetic_alignments, write_best_blast,
+                                  write_diamond_tabular, write_diamond_xml,
+                                  write_match_enzyme_results)
+from biopathpred.modules.batch_scoring import start_batch_match_enzyme
+from biopathpred.modules.best_blast import find_best_blast
+from biopathpred.modules.match_enzyme import (match_enzyme_existence,
+                                              reset_enzyme_and_pathway,
+                                              traverse_enzyme_reaction)
+from biopathpred.modules.parse_blastp_tabular import parse_blast_tabular
+from biopathpred.modules.parse_blastp_xml import (parse_blast,
+                                                  parse_blast_iterparse)
+from biopathpred.modules.pathway import enzyme_dict, pathway_dict
+from biopathpred.modules.result_summary import result_summary
+
+# The data sizes at scale 1
+BASE_SIZES = {"queries": 2000,     # proteins of the genome aligned by diamond
+              "genomes": 20,       # best_blast tables scored by match_enzyme
+              "genes": 50,         # alignments in each best_blast table
+              "results": 200}      # match_enzyme results summarized
+# The slowdown reported as a regression by --compare
+REGRESSION_THRESHOLD = 1.2
+
+
+def prepare_alignments(data_dir: Path, scale: int) -> Dict[str, Path]:
+    """Generate the diamond outputs of a genome and its parsed hit table."""
+    paths = {"xml": data_dir / "alignments.xml", "tabular": data_dir / "alignments.tsv",
+             "hits": data_dir / "hits.csv"}
+    if not all(path.is_file() for path in paths.values()):
+        queries, alignments = synthetic_alignments(BASE_SIZES["queries"] * scale, seed=scale)
+        write_diamond_xml(paths["xml"], queries, alignments, seed=scale)
+        write_diamond_tabular(paths["tabular"], alignments)
+        parse_blast_tabular(paths["tabular"], paths["hits"])
+    return paths
+
+
+def prepare_best_blast(data_dir: Path, scale: int) -> List[Path]:
+    """Generate the best_blast tables of several genomes."""
+    directory = data_dir / "best_blast"
+    paths = [directory / f"GCF_{i:09d}.1_SYN_genomic.csv"
+             for i in range(BASE_SIZES["genomes"] * scale)]
+    if not all(path.is_file() for path in paths):
+        directory.mkdir(exist_ok=True)
+        for i, path in enumerate(paths):
+            write_best_blast(path, BASE_SIZES["genes"], seed=i)
+    return paths
+
+
+def prepare_results(data_dir: Path, scale: int) -> Path:
+    """Generate the match_enzyme results of many genomes."""
+    directory = data_dir / "match_enzyme_result"
+    if len(list(directory.glob("*.txt"))) != BASE_SIZES["results"] * scale:
+        write_match_enzyme_results(directory, BASE_SIZES["results"] * scale, seed=scale)
+    return directory
+
+
+def match_enzyme_objects(filepaths: List[Path]):
+    """Score genomes on the PathwayNode and Enzyme objects."""
+    for filepath in filepaths:
+        match_enzyme_existence(filepath, enzyme_dict)
+        traverse_enzyme_reaction(pathway_dict[1], enzyme_dict, pathway_dict)
+        reset_enzyme_and_pathway(enzyme_dict, pathway_dict)
+
+
+def benchmark_cases(data_dir: Path, output_dir: Path,
+                    scale: int) -> Dict[str, Tuple[Callable[[], None], dict]]:
+    """Prepare the data of each benchmark at a scale.
+
+    Returns:
+        A dictionary of benchmark names and tuples of the function to run and
+        the size of its input.
+    """
+    alignments = prepare_alignments(data_dir, scale)
+    best_blast_paths = prepare_best_blast(data_dir, scale)
+    results_dir = prepare_results(data_dir, scale)
+    alignment_size = {"queries": BASE_SIZES["queries"] * scale,
+                      "alignments": sum(1 for _ in open(alignments["tabular"]))}
+    genome_size = {"genomes": len(best_blast_paths), "genes": BASE_SIZES["genes"]}
+    match_outputs = [output_dir / path.with_suffix(".txt").name for path in best_blast_paths]
+
+    return {
+        "parse_blast_iterparse": (
+            lambda: parse_blast_iterparse(alignments["xml"], output_dir / "iterparse.csv"),
+            alignment_size),
+        "parse_blast_biopython": (
+            lambda: parse_blast(alignments["xml"], output_dir / "biopython.csv"),
+            alignment_size),
+        "parse_blast_tabular": (
+            lambda: parse_blast_tabular(alignments["tabular"], output_dir / "tabular.csv"),
+            alignment_size),
+        "find_best_blast": (
+            lambda: find_best_blast(alignments["hits"], output_dir / "best.csv",
+                                    "score", ["coverage=50"]),
+            alignment_size),
+        "match_enzyme_objects": (lambda: match_enzyme_objects(best_blast_paths), genome_size),
+        "match_enzyme_batch": (
+            lambda: start_batch_match_enzyme(best_blast_paths, match_outputs, "prob", False),
+            genome_size),
+        "result_summary": (lambda: result_summary(results_dir, output_dir),
+                           {"results": BASE_SIZES["results"] * scale}),
+    }
+
+
+def measure(func: Callable[[], None], repeat: int, memory: bool = True) -> dict:
+    """Time a function and trace its peak memory."""
+    seconds = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    result = {"seconds": min(seconds), "seconds_all": seconds, "peak_memory_mb": None}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 3)
+        tracemalloc.stop()
+
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(scales: List[int], data_dir: Path, names: List[str] = None,
+                   repeat: int = 3, memory: bool = True) -> dict:
+    """Run the benchmarks at each scale.
+
+    Args:
+        scales: The multiples of `BASE_SIZES`.
+        data_dir: The folder of the generated data, reused when it exists.
+        names: The benchmarks to run, all by default.
+        repeat: The number of timed runs.
+        memory: Whether to trace the peak memory in one more run.
+
+    Returns:
+        A dictionary of the environment and the results of each benchmark.
+    """
+    results = []
+    for scale in scales:
+        scale_dir = data_dir / f"scale_{scale}"
+        scale_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory() as output_dir:
+            cases = benchmark_cases(scale_dir, Path(output_dir), scale)
+            for name, (func, size) in cases.items():
+                if names and name not in names:
+                    continue
+                result = {"benchmark": name, "scale": scale, "size": size,
+                          **measure(func, repeat, memory)}
+                peak = result["peak_memory_mb"]
+                print(f"{name} x{scale}: {result['seconds']:.3f} s"
+                      + (f", {peak:.1f} MB" if peak is not None else ""), flush=True)
+                results.append(result)
+
+    return {"commit": git_commit(), "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "repeat": repeat, "base_sizes": BASE_SIZES,
+            "results": results}
+
+
+def compare_results(base: dict, new: dict,
+                    threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Compare the results of two runs.
+
+    Returns:
+        The benchmarks that are slower than `threshold` times the base.
+    """
+    base_results = {(result["benchmark"], result["scale"]): result for result in base["results"]}
+    regressions = []
+    print(f"{'benchmark':<24}{'scale':>6}{'base s':>10}{'new s':>10}{'ratio':>8}"
+          f"{'base MB':>10}{'new MB':>10}")
+    for result in new["results"]:
+        key = (result["benchmark"], result["scale"])
+        if key not in base_results:
+            continue
+        base_result = base_results[key]
+        ratio = result["seconds"] / base_result["seconds"] if base_result["seconds"] else 1
+        flag = ""
+        if ratio > threshold:
+            flag = "  slower"
+            regressions.append(f"{key[0]} x{key[1]}")
+        memories = [f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+                    for value in (base_result["peak_memory_mb"], result["peak_memory_mb"])]
+        print(f"{key[0]:<24}{key[1]:>6}{base_result['seconds']:>10.3f}{result['seconds']:>10.3f}"
+              f"{ratio:>8.2f}{''.join(memories)}{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline modules.")
+    parser.add_argument("--scales", nargs="+", type=int, default=[1, 10, 100],
+                        help="multiples of the base data sizes")
+    parser.add_argument("--benchmarks", nargs="+", type=str,
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not trace the peak memory, which takes one slower run")
+    parser.add_argument("--data-dir", type=str,
+                        help="folder of the generated data, reused between runs "
+                             "(default: a temporary folder)")
+    parser.add_argument("-o", "--output", type=str, default="benchmark_results.json",
+                        help="JSON file of the results")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="compare two result files instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown ratio reported as a regression by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        base, new = (json.loads(Path(path).read_text()) for path in args.compare)
+        regressions = compare_results(base, new, args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    if args.data_dir is not None:
+        results = run_benchmarks(args.scales, Path(args.data_dir), args.benchmarks,
+                                 args.repeat, not args.no_memory)
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results = run_benchmarks(args.scales, Path(data_dir), args.benchmarks,
+                                     args.repeat, not args.no_memory)
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Save results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
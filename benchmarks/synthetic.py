@@ -0,0 +1,268 @@
+"""Generators of synthetic pipeline data at a configurable scale.
+
+The data have the formats of the real files (prodigal FASTA headers, diamond
+XML and tabular outputs, best_blast tables and match_enzyme results) with
+random values drawn from a seeded generator, so the same arguments always
+give the same files. No external program is needed.
+"""
+from pathlib import Path
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from biopathpred.modules.batch_scoring import match_enzyme_results
+from biopathpred.modules.parse_blastp_xml import HEADER_ELEMENT
+from biopathpred.modules.pathway import CompiledPathway, compiled_pathway
+
+AMINO_ACIDS = np.array(list("ACDEFGHIKLMNPQRSTVWY"))
+BASES = np.array(list("ACGT"))
+# The share of the database sequences without an enzyme label
+UNLABELED_FRACTION = 0.1
+
+XML_HEADER = """<?xml version="1.0"?>
+<!DOCTYPE BlastOutput PUBLIC "-//NCBI//NCBI BlastOutput/EN" "http://www.ncbi.nlm.nih.gov/dtd/NCBI_BlastOutput.dtd">
+<BlastOutput>
+  <BlastOutput_program>blastp</BlastOutput_program>
+  <BlastOutput_version>diamond 2.1.8</BlastOutput_version>
+  <BlastOutput_db>synthetic</BlastOutput_db>
+  <BlastOutput_query-ID>Query_1</BlastOutput_query-ID>
+  <BlastOutput_query-def>{query}</BlastOutput_query-def>
+  <BlastOutput_query-len>{query_len}</BlastOutput_query-len>
+  <BlastOutput_param>
+    <Parameters>
+      <Parameters_matrix>BLOSUM62</Parameters_matrix>
+      <Parameters_expect>0.001</Parameters_expect>
+      <Parameters_gap-open>11</Parameters_gap-open>
+      <Parameters_gap-extend>1</Parameters_gap-extend>
+      <Parameters_filter>F</Parameters_filter>
+    </Parameters>
+  </BlastOutput_param>
+<BlastOutput_iterations>
+"""
+XML_ITERATION = """<Iteration>
+  <Iteration_iter-num>{num}</Iteration_iter-num>
+  <Iteration_query-ID>Query_{num}</Iteration_query-ID>
+  <Iteration_query-def>{query}</Iteration_query-def>
+  <Iteration_query-len>{query_len}</Iteration_query-len>
+<Iteration_hits>
+{hits}</Iteration_hits>
+</Iteration>
+"""
+XML_HIT = """<Hit>
+  <Hit_num>{num}</Hit_num>
+  <Hit_id>gnl|BL_ORD_ID|{subject}</Hit_id>
+  <Hit_def>{title}</Hit_def>
+  <Hit_accession>{subject}</Hit_accession>
+  <Hit_len>{subject_len}</Hit_len>
+  <Hit_hsps>
+    <Hsp>
+      <Hsp_num>1</Hsp_num>
+      <Hsp_bit-score>{score}</Hsp_bit-score>
+      <Hsp_evalue>{evalue}</Hsp_evalue>
+      <Hsp_query-from>1</Hsp_query-from>
+      <Hsp_query-to>{align_len}</Hsp_query-to>
+      <Hsp_identity>{nident}</Hsp_identity>
+      <Hsp_gaps>{gaps}</Hsp_gaps>
+      <Hsp_align-len>{align_len}</Hsp_align-len>
+      <Hsp_qseq>{qseq}</Hsp_qseq>
+      <Hsp_hseq>{hseq}</Hsp_hseq>
+    </Hsp>
+  </Hit_hsps>
+</Hit>
+"""
+XML_FOOTER = "</BlastOutput_iterations>\n</BlastOutput>\n"
+
+
+def protein_headers(query_num: int, rng: np.random.Generator) -> List[str]:
+    """Make prodigal protein headers of genes on a few contigs."""
+    headers = []
+    contig, gene, position = 1, 0, 1
+    for _ in range(query_num):
+        if gene and rng.random() < 0.002:
+            contig, gene, position = contig + 1, 0, 1
+        gene += 1
+        start = position + int(rng.integers(10, 300))
+        end = start + 3 * int(rng.integers(50, 600)) - 1
+        position = end
+        strand = 1 if rng.random() < 0.5 else -1
+        headers.append(f"NZ_SYN{contig:06d}.1_{gene} # {start} # {end} # {strand} # "
+                       f"ID={contig}_{gene};partial=00;start_type=ATG;"
+                       f"rbs_motif=GGAG/GAGG;rbs_spacer=5-10bp;gc_cont=0.{rng.integers(400, 700)}")
+
+    return headers
+
+
+def subject_titles(subject_num: int, rng: np.random.Generator,
+                   pathway: CompiledPathway = compiled_pathway) -> List[str]:
+    """Make database FASTA headers labeled with the enzymes of the pathway."""
+    titles = []
+    for i in range(subject_num):
+        product = f"Synthetic protein {i}"
+        if rng.random() >= UNLABELED_FRACTION:
+            column = int(rng.integers(len(pathway.enzyme_ids)))
+            product = f"{pathway.enzyme_ids[column]}~~~{pathway.enzyme_names[column].upper()}" \
+                      f"~~~{product}"
+        titles.append(f"sp|S{i:05d}|SYN{i}_BACSU {product} OS=Bacillus synthetica "
+                      f"OX={1000 + i} GN=syn{i} PE={rng.integers(1, 6)} SV=1")
+
+    return titles
+
+
+def random_sequence(length: int, rng: np.random.Generator, alphabet=AMINO_ACIDS) -> str:
+    return "".join(alphabet[rng.integers(len(alphabet), size=length)])
+
+
+def write_genome(path: Union[str, Path], contig_num: int, contig_len: int, seed: int = 0):
+    """Write a genome FASTA file of random contigs of about `contig_len` bases."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as f:
+        for i in range(1, contig_num + 1):
+            length = int(contig_len * rng.uniform(0.5, 1.5))
+            sequence = random_sequence(length, rng, BASES)
+            f.write(f">NZ_SYN{i:06d}.1 Bacillus synthetica contig {i}\n")
+            for start in range(0, length, 80):
+                f.write(sequence[start:start + 80] + "\n")
+
+
+def write_proteins(path: Union[str, Path], query_num: int, seed: int = 0):
+    """Write a prodigal-style protein FASTA file (prodigal -a)."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w") as f:
+        for header in protein_headers(query_num, rng):
+            start, end = (int(field) for field in header.split(" # ")[1:3])
+            sequence = random_sequence((end - start + 1) // 3, rng)
+            f.write(f">{header}\n")
+            for start in range(0, len(sequence), 60):
+                f.write(sequence[start:start + 60] + "\n")
+
+
+def synthetic_alignments(query_num: int, hit_fraction: float = 0.3,
+                         max_hits: int = 5, subject_num: int = 500,
+                         seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Draw the alignments of a genome against a labeled database.
+
+    Returns:
+        A tuple of a DataFrame of the queries (`query` and `query_len`), and a
+        DataFrame with one row per alignment and the columns `query`,
+        `query_len`, `subject`, `title`, `subject_len`, `score`, `evalue`,
+        `nident`, `gaps` and `align_len`, the queries in order.
+    """
+    rng = np.random.default_rng(seed)
+    headers = protein_headers(query_num, rng)
+    titles = subject_titles(subject_num, rng)
+    hit_counts = np.where(rng.random(query_num) < hit_fraction,
+                          rng.integers(1, max_hits + 1, size=query_num), 0)
+    query_index = np.repeat(np.arange(query_num), hit_counts)
+    query_len = rng.integers(50, 600, size=query_num)
+    hit_num = len(query_index)
+
+    align_len = np.minimum(query_len[query_index], rng.integers(30, 600, size=hit_num))
+    gaps = rng.integers(0, 20, size=hit_num)
+    nident = (align_len * rng.uniform(0.2, 1.0, size=hit_num)).astype(np.int64)
+    score = np.round(nident * rng.uniform(0.8, 2.2, size=hit_num), 3)
+    # diamond prints the e-values with 5 significant digits
+    evalue = np.array([float(f"{value:.5g}")
+                       for value in 10.0 ** -rng.uniform(3, 150, size=hit_num)])
+    subject = rng.integers(subject_num, size=hit_num)
+
+    queries = pd.DataFrame({"query": headers, "query_len": query_len})
+    alignments = pd.DataFrame({"query": np.array(headers, dtype=object)[query_index],
+                               "query_len": query_len[query_index],
+                               "subject": subject,
+                               "title": np.array(titles, dtype=object)[subject],
+                               "subject_len": rng.integers(100, 800, size=hit_num),
+                               "score": score, "evalue": evalue, "nident": nident,
+                               "gaps": gaps, "align_len": align_len})
+
+    return queries, alignments
+
+
+def write_diamond_xml(path: Union[str, Path], queries: pd.DataFrame,
+                      alignments: pd.DataFrame, seed: int = 0):
+    """Write alignments as a diamond XML output (--outfmt 5).
+
+    The alignments are in the order of the queries, and the queries without
+    alignments are written as empty iterations.
+    """
+    rng = np.random.default_rng(seed)
+    # The aligned sequences are only read by biopython, so they are slices of one sequence
+    pool = random_sequence(4096, rng)
+    columns = ["query", "subject", "title", "subject_len", "score", "evalue", "nident",
+               "gaps", "align_len"]
+    rows = iter(zip(*(alignments[column].tolist() for column in columns)))
+    row = next(rows, None)
+    with open(path, "w") as f:
+        f.write(XML_HEADER.format(query=queries["query"].iloc[0],
+                                  query_len=queries["query_len"].iloc[0]))
+        for num, (query, query_len) in enumerate(zip(queries["query"], queries["query_len"]), 1):
+            hits = []
+            while row is not None and row[0] == query:
+                _, subject, title, subject_len, score, evalue, nident, gaps, align_len = row
+                offset = int(rng.integers(len(pool) - 60))
+                hits.append(XML_HIT.format(num=len(hits) + 1, subject=subject, title=title,
+                                           subject_len=subject_len, score=score,
+                                           evalue=evalue, nident=nident, gaps=gaps,
+                                           align_len=align_len,
+                                           qseq=pool[offset:offset + min(align_len, 60)],
+                                           hseq=pool[offset + 1:offset + 1 + min(align_len, 60)]))
+                row = next(rows, None)
+            f.write(XML_ITERATION.format(num=num, query=query, query_len=query_len,
+                                         hits="".join(hits)))
+        f.write(XML_FOOTER)
+
+
+def write_diamond_tabular(path: Union[str, Path], alignments: pd.DataFrame):
+    """Write alignments as a diamond tabular output (see `DIAMOND_TABULAR_OPTIONS`)."""
+    columns = ["query", "title", "score", "evalue", "nident", "align_len", "gaps", "query_len"]
+    alignments[columns].to_csv(path, sep="\t", header=False, index=False)
+
+
+def write_best_blast(path: Union[str, Path], gene_num: int, seed: int = 0,
+                     pathway: CompiledPathway = compiled_pathway):
+    """Write a best_blast table with one alignment for each of `gene_num` genes."""
+    rng = np.random.default_rng(seed)
+    enzyme_ids = np.array(pathway.enzyme_ids)[rng.integers(len(pathway.enzyme_ids), size=gene_num)]
+    start = np.cumsum(rng.integers(100, 2000, size=gene_num))
+    data = pd.DataFrame({
+        "id": [f"NZ_SYN000001.1_{i}" for i in range(1, gene_num + 1)],
+        "start": start, "end": start + rng.integers(150, 1800, size=gene_num),
+        "alignment_id": [f"S{i:05d}" for i in rng.integers(100000, size=gene_num)],
+        "enzyme_id": np.where(rng.random(gene_num) < UNLABELED_FRACTION, "-",
+                              enzyme_ids.astype(str)),
+        "enzyme_code": "SYN", "product": "Synthetic protein",
+        "organism": "Bacillus synthetica", "existence": rng.integers(1, 6, size=gene_num),
+        "gene": "syn", "score": np.round(rng.uniform(30, 800, size=gene_num), 3),
+        "evalue": 10.0 ** -rng.uniform(3, 150, size=gene_num),
+        "identity": np.round(rng.uniform(20, 100, size=gene_num), 3),
+        "coverage": np.round(rng.uniform(50, 100, size=gene_num), 3)},
+        columns=HEADER_ELEMENT)
+    data.to_csv(path, index=False)
+
+
+def write_match_enzyme_results(directory: Union[str, Path], genome_num: int,
+                               gene_num: int = 50, seed: int = 0,
+                               model: str = "prob",
+                               pathway: CompiledPathway = compiled_pathway) -> List[Path]:
+    """Write the match_enzyme results of `genome_num` synthetic genomes.
+
+    The results are scored from synthetic best_blast tables, so they have the
+    values of real results.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(genome_num):
+        size = int(rng.integers(1, gene_num + 1))
+        frames.append(pd.DataFrame({
+            "enzyme_id": np.array(pathway.enzyme_ids)[rng.integers(len(pathway.enzyme_ids),
+                                                                   size=size)],
+            "identity": np.round(rng.uniform(20, 100, size=size), 3)}))
+    paths = []
+    for i, result in enumerate(match_enzyme_results(frames, model, pathway)):
+        path = directory / f"GCF_{i:09d}.1_SYN_genomic.txt"
+        path.write_text("".join(result))
+        paths.append(path)
+
+    return paths
@@ -1,30 +1,77 @@
 import argparse
+import contextvars
+import os
 import multiprocessing as mp
+import shutil
 import subprocess
+import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from functools import partial
 from pathlib import Path
-from typing import Literal
+from typing import List, Literal, Optional
 
+import tomli
 from tqdm import tqdm
 
+from biopathpred.modules.batch_scoring import (BATCH_SIZE,
+                                               start_batch_match_enzyme)
 from biopathpred.modules.best_blast import find_best_blast
+from biopathpred.modules.blast_batch import (split_batch_tabular,
+                                             split_batch_xml,
+                                             write_batch_query)
+from biopathpred.modules.compression import (COMPRESSION_SUFFIXES, copy_file,
+                                             get_compression, open_text,
+                                             strip_compression)
 from biopathpred.modules.configuration import Configuration
-from biopathpred.modules.database_building import build_blast_db
+from biopathpred.modules.database_building import (build_blast_db,
+                                                   make_diamond_db)
+from biopathpred.modules.database_catalog import DatabaseCatalog
+from biopathpred.modules.events import job_items, timed_call
+from biopathpred.modules.job_order import (MAX_CHUNKSIZE, adaptive_chunksize,
+                                           estimate_makespan, job_cost,
+                                           longest_first)
 from biopathpred.modules.match_enzyme import start_match_enzyme
-from biopathpred.modules.parse_blastp_xml import parse_blast
-from biopathpred.modules.result_summary import result_summary
+from biopathpred.modules.parse_blastp_tabular import parse_blast_tabular
+from biopathpred.modules.parse_blastp_xml import (parse_blast,
+                                                  parse_blast_iterparse)
+from biopathpred.modules.post_alignment import start_post_alignment
+from biopathpred.modules.profiler import wait_child
+from biopathpred.modules.prodigal_shard import (count_contig_bases,
+                                                merge_shards, plan_shards,
+                                                write_shards)
+from biopathpred.modules.resources import detect_cpus
+from biopathpred.modules.result_summary import (STATE_FILENAME, merge_summaries,
+                                                result_summary)
+from biopathpred.modules.scheduler import Stage, StreamingScheduler
+from biopathpred.modules.service import ScoringError, ScoringService, make_server
+from biopathpred.modules.table_io import TABLE_FORMATS, parse_blast_table
 
 
 # Run whole pipeline
 def pipeline(config: Configuration):
     time_start = time.perf_counter()
 
-    run_prodigal(config)
-    run_blast(config)
-    run_parse_blast(config)
-    run_find_best_blast(config)
-    run_match_enzyme(config)
+    fused = config.args.fused
+    if fused is None:
+        fused = config.default.get("pipeline", {}).get("fused", True)
+
+    if config.scheduler == "stream":
+        run_streaming(config, fused=fused)
+    else:
+        file_list = None
+        if config.resume:
+            file_list = plan_stage_resume(config, pipeline_modules(fused))
+        run_prodigal(config, file_list=file_list)
+        run_blast(config)
+        if fused:
+            run_post_alignment(config)
+        else:
+            run_parse_blast(config)
+            run_find_best_blast(config)
+            run_match_enzyme(config)
     run_result_summary(config)
 
     if not config.args.debug:
@@ -35,36 +82,299 @@ def pipeline(config: Configuration):
     config.logger.info(f"Elapsed time: {round(time_end - time_start, 2)}sec")
 
 
-def multiprocess_dispatch(config: Configuration, func, thread_num=None, **kwargs):
+def run_streaming(config: Configuration, fused: bool = False):
+    """Run the per-genome modules with the streaming scheduler.
+
+    Each genome moves to the next module as soon as it finishes the previous
+    one. The external programs run in their own worker threads, and the Python
+    modules share a process pool.
+
+    Args:
+        config: The pipeline configuration.
+        fused: Whether to run parse_blast, best_blast and match_enzyme as a
+            single post_alignment stage.
+    """
+    modules = pipeline_modules(fused)
+    config.check_stream_io(modules)
+    prodigal_executable = Path(config.default["executable"]["prodigal_path"]).resolve()
+    blast_executable = Path(config.default["executable"]["diamond_path"])
+    config.logger.info("Start streaming pipeline")
+
+    jobs = {"prodigal": partial(single_job_executable, module="prodigal",
+                                executable=prodigal_executable),
+            "blast": partial(single_job_executable, module="blast",
+                             executable=blast_executable),
+            "parse_blast": partial(single_job_module,
+                                   module=partial(parse_blast_table,
+                                                  parser=get_blast_parser(config)),
+                                   stage="parse_blast"),
+            "best_blast": partial(single_job_module,
+                                  module=partial(find_best_blast,
+                                                 criteria=config.criteria,
+                                                 filter=config.filter,
+                                                 top_n=config.top_n,
+                                                 tie_breaker=config.tie_breaker),
+                                  stage="best_blast"),
+            "match_enzyme": partial(single_job_module,
+                                    module=partial(start_match_enzyme,
+                                                   model=config.model,
+                                                   verbose=config.args.verbose,
+                                                   pathway=config.pathway),
+                                    stage="match_enzyme"),
+            "post_alignment": post_alignment_job}
+    workers = {"prodigal": config.resources.prodigal_workers,
+               "blast": config.resources.diamond_jobs,
+               "parse_blast": config.thread_num,
+               "best_blast": config.thread_num,
+               "match_enzyme": config.thread_num,
+               "post_alignment": config.thread_num}
+    stages = [Stage(module,
+                    partial(cached_job, module=module, job=jobs[module], config=config),
+                    workers=workers[module],
+                    executor="thread" if module in ("prodigal", "blast") else "process")
+              for module in modules]
+    if config.blast_batch_size > 1:
+        stages[1] = Stage("blast",
+                          partial(cached_batch_job, module="blast",
+                                  job=partial(batch_job_executable,
+                                              executable=blast_executable),
+                                  config=config),
+                          workers=workers["blast"],
+                          batch_size=config.blast_batch_size)
+
+    file_list, start_stages = config.file_list, None
+    if config.resume:
+        _, file_list, start_stages = plan_resume(config, modules)
+    # The largest genomes enter first, so that none is left alone in a stage at the end
+    order = longest_first([job_cost(file) for file in file_list])
+    file_list = [file_list[i] for i in order]
+    if start_stages is not None:
+        start_stages = [start_stages[i] for i in order]
+    if config.training_cache is not None:
+        config.training_cache.reset_statistics()
+    StreamingScheduler(stages, process_workers=config.resources.python_workers,
+                       events=config.events).run(file_list, start_stages=start_stages)
+
+    log_training_cache(config)
+    config.logger.info("Finish streaming pipeline")
+
+
+def pipeline_modules(fused: bool = False) -> List[str]:
+    """List the per-genome modules of the pipeline, in order."""
+    if fused:
+        return ["prodigal", "blast", "post_alignment"]
+    return ["prodigal", "blast", "parse_blast", "best_blast", "match_enzyme"]
+
+
+def plan_resume(config: Configuration, modules: List[str]):
+    """Find the module each genome should restart from.
+
+    The keys of all module outputs are derived from the genome file, so
+    a genome whose last output is up to date is skipped even if the
+    intermediate files were removed after the previous run.
+
+    Returns:
+        A tuple of the genome files to be processed, the file each enters
+        with and the index of the module it enters at.
+    """
+    def plan(file):
+        key = config.cache.input_key(file)
+        savepath, entry, start = file, file, 0
+        for index, module in enumerate(modules):
+            key = config.cache.stage_key(module, key, config.get_stage_params(module))
+            savepath = config.create_savepath(savepath, module=module)
+            if config.cache.is_fresh(savepath, key):
+                entry, start = savepath, index + 1
+        return file, entry, start
+
+    with ThreadPoolExecutor(config.thread_num) as executor:
+        plans = [plan for plan in executor.map(plan, config.file_list)
+                 if plan[2] < len(modules)]
+    config.logger.info(f"Resume {len(plans)} of {len(config.file_list)} genome(s)")
+
+    return tuple([plan[i] for plan in plans] for i in range(3))
+
+
+def plan_stage_resume(config: Configuration, modules: List[str]) -> List[Path]:
+    """Find the genomes a stage-mode run with `--resume` has to process.
+
+    A finished run removes the intermediate files, so the genomes whose last
+    output is up to date are left out from the first module, as with the
+    streaming scheduler (see `plan_resume`). The other genomes reuse their
+    outputs that are up to date in each module.
+
+    Returns:
+        The genome files to be processed.
+    """
+    config.check_stream_io(modules)
+    file_list, _, _ = plan_resume(config, modules)
+    # The modules then start again from the input path
+    config.type = "main"
+
+    return file_list
+
+
+def cached_job(file, module, job, config: Configuration):
+    """Run a single job of a module unless its output is up to date.
+
+    With `--resume`, the output is reused if its recorded key matches the key
+    derived from the input and the module parameters. The key is recorded
+    only after the job succeeds.
+    """
+    savepath = config.create_savepath(file, module=module)
+    key = config.cache.stage_key(module, config.cache.input_key(file),
+                                 config.get_stage_params(module))
+    if config.resume and config.cache.is_fresh(savepath, key):
+        return savepath
+
+    config.cache.invalidate(savepath)
+    with profiled_job(module, [file], config) as record:
+        output = job(file, config=config)
+        record["outputs"] = [output]
+    if output is not None:
+        config.cache.record(output, key)
+
+    return output
+
+
+def cached_batch_job(files, module, job, config: Configuration):
+    """Run a batch job of a module on the files whose outputs are not up to date.
+
+    See `cached_job`. `job` takes a list of files and returns a list of
+    outputs in the same order.
+    """
+    savepaths = [config.create_savepath(file, module=module) for file in files]
+    keys = [config.cache.stage_key(module, config.cache.input_key(file),
+                                   config.get_stage_params(module))
+            for file in files]
+    outputs = [None] * len(files)
+    stale = []
+    for i, (savepath, key) in enumerate(zip(savepaths, keys)):
+        if config.resume and config.cache.is_fresh(savepath, key):
+            outputs[i] = savepath
+        else:
+            config.cache.invalidate(savepath)
+            stale.append(i)
+
+    if stale:
+        stale_files = [files[i] for i in stale]
+        with profiled_job(module, stale_files, config) as record:
+            stale_outputs = job(stale_files, config=config)
+            record["outputs"] = stale_outputs
+        for i, output in zip(stale, stale_outputs):
+            outputs[i] = output
+            if output is not None:
+                config.cache.record(output, keys[i])
+
+    return outputs
+
+
+def profiled_job(module, files, config: Configuration):
+    """Profile a job with `--profile` (see `Profiler.job`)."""
+    if config.profiler is None:
+        return nullcontext({})
+    return config.profiler.job(module, files)
+
+
+def multiprocess_dispatch(config: Configuration, func, thread_num=None,
+                          items=None, chunksize=None, **kwargs):
+    """Run a job on each item in a process pool, or in this process with one thread.
+
+    In a pool, the largest jobs are sent first (see `job_cost`), so that no
+    large job is left running alone at the end, and the estimated makespans
+    of this order and of the input order are logged.
+
+    With `--events`, the jobs are timed in the workers, and the genomes of
+    each job are reported as its result comes back.
+
+    Args:
+        chunksize: The number of jobs sent to a worker at a time. It is
+            chosen from the numbers of jobs and workers if not given.
+    """
     thread_num = thread_num if thread_num is not None else config.thread_num
-    with mp.Pool(thread_num) as p:
+    items = items if items is not None else config.file_list
+    if thread_num != 1:
+        chunksize = chunksize or adaptive_chunksize(len(items), thread_num)
+        items = order_jobs(config, items, thread_num, chunksize, kwargs.get("module"))
+    job = partial(func, config=config, **kwargs)
+    events, stage = config.events, kwargs.get("module")
+    start = time.perf_counter()
+    if events is not None:
+        job = partial(timed_call, job)
+        waiting = sum(len(job_items(item)) for item in items)
+        events.stage_started(stage, waiting)
+
+    with mp.Pool(thread_num) if thread_num != 1 else nullcontext() as p:
         # https://stackoverflow.com/questions/32515389/does-multiprocessing-pool-imap-has-a-variant-like-starmap-that-allows-for-mult
         # https://stackoverflow.com/questions/41920124/multiprocessing-use-tqdm-to-display-a-progress-bar
-        list(
-            tqdm(
-                p.imap(partial(func, config=config, **kwargs),
-                       config.file_list,
-                       chunksize=10),
-                total=len(config.file_list)
-            )
-        )
+        results = p.imap(job, items, chunksize=chunksize) if p is not None else map(job, items)
+        done = 0
+        try:
+            for result in tqdm(results, total=len(items)):
+                if events is not None:
+                    # The results come back in the order of the items
+                    output, seconds = result
+                    files = job_items(items[done])
+                    waiting -= len(files)
+                    events.genomes_finished(stage, files,
+                                            output if isinstance(items[done], list) else [output],
+                                            seconds, queued={stage: waiting})
+                done += 1
+        except BaseException as err:
+            if events is not None:
+                events.job_failed(stage, job_items(items[done]), err)
+            raise
+
+    if thread_num != 1:
+        config.logger.info(f"Makespan of the {stage} jobs: "
+                           f"{round(time.perf_counter() - start, 2)}sec")
+    if events is not None:
+        events.stage_finished(stage)
+
+
+def order_jobs(config: Configuration, items: list, workers: int, chunksize: int,
+               stage: str) -> list:
+    """Order the jobs largest first, and log the estimated gain in makespan.
+
+    The makespan of the input order is estimated with the former fixed chunks
+    of `MAX_CHUNKSIZE` jobs.
+    """
+    costs = [job_cost(item) for item in items]
+    order = longest_first(costs, chunksize)
+    before = estimate_makespan(costs, workers, MAX_CHUNKSIZE)
+    after = estimate_makespan([costs[i] for i in order], workers, chunksize)
+    if before > 0:
+        config.logger.info(f"Dispatch {len(items)} {stage} job(s) largest first in chunks of "
+                           f"{chunksize}: estimated makespan {after / before:.0%} of the "
+                           "input order")
+
+    return [items[i] for i in order]
 
 
 # Run individual module
-def run_prodigal(config: Configuration):
-    """Call the executable to run progidal gene prediction."""
+def run_prodigal(config: Configuration, file_list: Optional[List[Path]] = None):
+    """Call the executable to run progidal gene prediction.
+
+    Args:
+        config: The pipeline configuration.
+        file_list: The genome files to predict, all those in the input path
+            if not given.
+    """
     config.check_io(module="prodigal")
+    if file_list is not None:
+        config.file_list = file_list
     prodigal_executable = Path(config.default["executable"]["prodigal_path"]).resolve()
     config.logger.info("Start prodigal gene prediction")
+    if config.training_cache is not None:
+        config.training_cache.reset_statistics()
+    job = partial(single_job_executable, module="prodigal",
+                  executable=prodigal_executable)
 
-    if config.thread_num != 1:
-        multiprocess_dispatch(config, single_job_executable,
-                              module="prodigal",
-                              executable=prodigal_executable)
-    else:
-        for file in tqdm(config.file_list):
-            single_job_executable(file, "prodigal", prodigal_executable, config)
+    # prodigal jobs are long, so they are sent one at a time
+    multiprocess_dispatch(config, cached_job, module="prodigal", job=job,
+                          thread_num=config.resources.prodigal_workers, chunksize=1)
 
+    log_training_cache(config)
     config.logger.info("Finish prodigal gene prediction")
 
 
@@ -73,42 +383,289 @@ def run_blast(config: Configuration):
     config.check_io(module="blast")
     blast_executable = Path(config.default["executable"]["diamond_path"])
     config.logger.info("Start blastp alignment")
+    job = partial(single_job_executable, module="blast",
+                  executable=blast_executable)
 
-    if config.thread_num != 1:
-        # Diamond already adopts multithreading, so use less threads here
-        multiprocess_dispatch(config, single_job_executable,
-                              module="blast",
-                              thread_num=config.thread_num // 2,
-                              executable=blast_executable)
+    if config.blast_batch_size > 1:
+        batch_size = config.blast_batch_size
+        batches = [config.file_list[i:i + batch_size]
+                   for i in range(0, len(config.file_list), batch_size)]
+        config.logger.info(f"Align {len(config.file_list)} genome(s) in "
+                           f"{len(batches)} batch(es)")
+        job = partial(batch_job_executable, executable=blast_executable)
+        multiprocess_dispatch(config, cached_batch_job, module="blast", job=job,
+                              thread_num=config.resources.diamond_jobs,
+                              items=batches, chunksize=1)
     else:
-        for file in tqdm(config.file_list):
-            single_job_executable(file, "blast", blast_executable, config)
+        # Diamond already adopts multithreading, so fewer jobs run at once
+        multiprocess_dispatch(config, cached_job, module="blast", job=job,
+                              thread_num=config.resources.diamond_jobs, chunksize=1)
 
     config.logger.info("Finish blastp alignment")
 
 
 def single_job_executable(file, module, executable, config: Configuration):
-    savepath = config.create_savepath(file)
+    savepath = config.create_savepath(file, module=module)
+
+    contig_counts = None
+    if module == "prodigal" and config.prodigal_shards > 1 \
+            and Path(file).stat().st_size >= config.prodigal_shard_min_size:
+        contig_counts = plan_shards(count_contig_bases(file), config.prodigal_shards)
+        if len(contig_counts) == 1:
+            contig_counts = None
+    training_path = None
+    # prodigal cannot write a training file and predict the genes in one run,
+    # so a genome is trained ahead on a cache miss, and predicted with the
+    # cached training file on later runs
+    if module == "prodigal" and config.training_cache is not None:
+        training_path = cached_training_file(file, executable, config)
+        if training_path is None:
+            return None
+    if contig_counts is not None:
+        return sharded_prodigal_job(file, savepath, executable, contig_counts,
+                                    config, training_path=training_path)
 
+    # The executables write uncompressed files, which are compressed afterwards
+    output_path = savepath
+    if get_compression(savepath) is not None:
+        output_path = savepath.with_name(f".{strip_compression(savepath).name}")
     if module == "prodigal":
-        output = subprocess.run([executable,
-                                 "-i", file,
-                                 "-a", savepath],
-                                stdout=subprocess.DEVNULL,
-                                stderr=subprocess.PIPE,
-                                text=True)
+        training_options = [] if training_path is None else ["-t", training_path]
+        output = run_executable([executable,
+                                 *prodigal_input_options(file),
+                                 *training_options,
+                                 "-a", output_path],
+                                input_file=file)
     elif module == "blast":
-        output = subprocess.run([executable,
+        with uncompressed_file(file, savepath.parent) as query:
+            output = run_executable([executable,
+                                     "blastp",
+                                     "-d", config.database,
+                                     "-q", query,
+                                     "-o", output_path,
+                                     *config.blast_options,
+                                     *config.blast_tuning_options])
+
+    if not check_executable_output(output, module, config):
+        return None
+    if output_path != savepath:
+        copy_file(output_path, savepath)
+        output_path.unlink()
+
+    return savepath
+
+
+def train_prodigal(file, training_path, executable, config: Configuration) -> bool:
+    """Run prodigal to write the training file of a genome without predicting genes.
+
+    Returns:
+        Whether prodigal succeeded.
+    """
+    output = run_executable([executable,
+                             *prodigal_input_options(file),
+                             "-t", training_path],
+                            input_file=file)
+
+    return check_executable_output(output, "prodigal", config)
+
+
+def cached_training_file(file, executable, config: Configuration):
+    """Get the training file of a genome from the cache, training it on a miss.
+
+    Returns:
+        The path of the training file, or `None` if prodigal failed.
+    """
+    training_path, hit = config.training_cache.lookup(file)
+    if not hit:
+        temporary_path = config.training_cache.temporary_path(training_path)
+        if not train_prodigal(file, temporary_path, executable, config):
+            return None
+        config.training_cache.store(temporary_path, training_path)
+
+    return training_path
+
+
+def log_training_cache(config: Configuration):
+    """Log the hits and misses of the prodigal training cache in this run."""
+    if config.training_cache is None:
+        return
+    hits, misses = config.training_cache.statistics()
+    config.logger.info(f"prodigal training cache: {hits} hit(s), {misses} miss(es)")
+
+
+def run_executable(command: list, input_file=None):
+    """Run an executable, and pipe a compressed input file into it.
+
+    Args:
+        command: The command line.
+        input_file: If it is compressed, it is decompressed into the standard
+            input of the executable, which must then read from it.
+
+    Returns:
+        A `CompletedProcess` with the standard error as text.
+    """
+    if input_file is None or get_compression(input_file) is None:
+        process = subprocess.Popen(command,
+                                   stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE)
+        with process.stderr:
+            stderr = process.stderr.read()
+        # The child is waited for here, so that its resources are profiled
+        returncode = wait_child(process)
+        return subprocess.CompletedProcess(command, returncode,
+                                           stderr=stderr.decode(errors="replace"))
+
+    process = subprocess.Popen(command,
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE)
+
+    def feed():
+        try:
+            with open_text(input_file, "rb") as f:
+                shutil.copyfileobj(f, process.stdin, 1024 * 1024)
+        except BrokenPipeError:
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    # The input is fed from a thread, so that the standard error is read at
+    # the same time and neither pipe fills up
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    with process.stderr:
+        stderr = process.stderr.read()
+    feeder.join()
+    returncode = wait_child(process)
+
+    return subprocess.CompletedProcess(command, returncode,
+                                       stderr=stderr.decode(errors="replace"))
+
+
+def prodigal_input_options(file) -> List[str]:
+    """Give prodigal the input file, unless it is compressed and piped in."""
+    if get_compression(file) is not None:
+        return []
+    return ["-i", file]
+
+
+@contextmanager
+def uncompressed_file(file, directory):
+    """Decompress a file that diamond cannot read into a temporary file.
+
+    diamond reads gzip files itself, so only the other compressions are
+    decompressed.
+    """
+    if get_compression(file) in (None, "gzip"):
+        yield file
+        return
+    with tempfile.TemporaryDirectory(prefix=".decompress_", dir=directory) as temp_dir:
+        temp_path = Path(temp_dir, strip_compression(file).name)
+        copy_file(file, temp_path)
+        yield temp_path
+
+
+def sharded_prodigal_job(file, savepath, executable, contig_counts: List[int],
+                         config: Configuration, training_path=None):
+    """Run prodigal on the contig shards of a large genome in parallel.
+
+    The genome is trained once as a whole, and each shard is predicted with
+    the training file, so the merged proteins are the same as the output of
+    a single prodigal run on the genome.
+
+    Args:
+        contig_counts: The number of contigs in each shard (see `plan_shards`).
+        training_path: The training file of the genome. If not given, the
+            genome is trained first.
+
+    Returns:
+        The output path, or `None` if prodigal failed.
+    """
+    with tempfile.TemporaryDirectory(prefix=".shard_",
+                                     dir=savepath.parent) as shard_dir:
+        if training_path is None:
+            training_path = Path(shard_dir, "training.trn")
+            if not train_prodigal(file, training_path, executable, config):
+                return None
+
+        shard_paths = [Path(shard_dir, f"shard_{i}.fna") for i in range(len(contig_counts))]
+        faa_paths = [path.with_suffix(".faa") for path in shard_paths]
+        write_shards(file, shard_paths, contig_counts)
+
+        def predict(paths):
+            shard_path, faa_path = paths
+            return run_executable([executable,
+                                   "-i", shard_path,
+                                   "-t", training_path,
+                                   "-a", faa_path])
+
+        # Each shard runs in a copy of the context, so that the profiled job
+        # of the genome is shared by the threads
+        with ThreadPoolExecutor(min(len(shard_paths),
+                                    config.resources.prodigal_threads)) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, predict, paths)
+                       for paths in zip(shard_paths, faa_paths)]
+            outputs = [future.result() for future in futures]
+        for output in outputs:
+            if not check_executable_output(output, "prodigal", config):
+                return None
+        merge_shards(faa_paths, contig_counts, savepath)
+
+    return savepath
+
+
+def batch_job_executable(files, executable, config: Configuration):
+    """Run diamond once on the proteins of several genomes.
+
+    The proteins are tagged with the index of their genome, and the output is
+    split back into one file per genome.
+
+    Returns:
+        A list of the output paths, with `None` for genomes without proteins.
+    """
+    savepaths = [config.create_savepath(file, module="blast") for file in files]
+
+    with tempfile.TemporaryDirectory(prefix=".batch_",
+                                     dir=savepaths[0].parent) as batch_dir:
+        query_path = Path(batch_dir, "query.faa")
+        result_path = Path(batch_dir, "result")
+        protein_counts = write_batch_query(files, query_path)
+        if sum(protein_counts) == 0:
+            return [None] * len(files)
+
+        output = run_executable([executable,
                                  "blastp",
                                  "-d", config.database,
-                                 "-q", file,
-                                 "-o", savepath,
-                                 "--outfmt", "5",
-                                 "--xml-blord-format"],
-                                stdout=subprocess.DEVNULL,
-                                stderr=subprocess.PIPE,
-                                text=True)
+                                 "-q", query_path,
+                                 "-o", result_path,
+                                 *config.blast_options,
+                                 *config.blast_tuning_options])
+        check_executable_output(output, "blast", config)
+        if config.blast_outfmt == "xml":
+            split_batch_xml(result_path, savepaths)
+        else:
+            split_batch_tabular(result_path, savepaths)
+
+    for i, count in enumerate(protein_counts):
+        if count == 0:
+            savepaths[i].unlink()
+            savepaths[i] = None
+
+    return savepaths
 
+
+def check_executable_output(output, module, config: Configuration):
+    """Check the return code of an executable.
+
+    Returns:
+        False if diamond was given an empty input file, True otherwise.
+
+    Raises:
+        SystemExit: The executable failed.
+    """
     if output.returncode != 0:
         # Diamond will raise an error if the input file is empty
         msg = "Error: Error detecting input file format. First line seems to be blank."
@@ -116,70 +673,291 @@ def single_job_executable(file, module, executable, config: Configuration):
             print(output.stderr)
             config.logger.error(f"{module} runtime error!")
             raise SystemExit
+        return False
+
+    return True
 
 
 def run_parse_blast(config: Configuration):
     """Run parse_blastp_xml module to parse the blastp result."""
     config.check_io(module="parse_blast")
     config.logger.info("Parse blastp result")
+    job = partial(single_job_module,
+                  module=partial(parse_blast_table, parser=get_blast_parser(config)))
 
-    if config.thread_num != 1:
-        multiprocess_dispatch(config, single_job_module,
-                              module=parse_blast)
-    else:
-        for file in tqdm(config.file_list):
-            savepath = config.create_savepath(file)
-            parse_blast(filepath=file, output_filepath=savepath)
+    multiprocess_dispatch(config, cached_job, module="parse_blast", job=job)
+
+
+def get_blast_parser(config: Configuration):
+    """Get the parser for the diamond output format."""
+    if config.blast_outfmt == "tabular":
+        return parse_blast_tabular
+    if config.xml_parser == "biopython":
+        return parse_blast
+    return parse_blast_iterparse
 
 
 def run_find_best_blast(config: Configuration):
     """Run the best_blast module to get the best blastp result of each alignment hit."""
     config.check_io(module="best_blast")
     config.logger.info("Select the best blastp result based on the configuration")
+    job = partial(single_job_module,
+                  module=partial(find_best_blast,
+                                 criteria=config.criteria,
+                                 filter=config.filter,
+                                 top_n=config.top_n,
+                                 tie_breaker=config.tie_breaker))
 
-    if config.thread_num != 1:
-        multiprocess_dispatch(config, single_job_module,
-                              module=partial(
-                                  find_best_blast,
-                                  criteria=config.criteria,
-                                  filter=config.filter
-                              ))
-    else:
-        for file in tqdm(config.file_list):
-            savepath = config.create_savepath(file)
-            find_best_blast(filepath=file, output_filepath=savepath,
-                            criteria=config.criteria, filter=config.filter)
+    multiprocess_dispatch(config, cached_job, module="best_blast", job=job)
 
 
 def run_match_enzyme(config: Configuration):
-    """Run the match_enzyme module to map the best alignment hit to the pathway of interest."""
+    """Run the match_enzyme module to map the best alignment hit to the pathway of interest.
+
+    The genomes are scored together in batches with whole-array operations.
+    """
     config.check_io(module="match_enzyme")
     config.logger.info("Match the best blastp result to the pathway")
+    job = partial(batch_job_module,
+                  module=partial(start_batch_match_enzyme,
+                                 model=config.model,
+                                 verbose=config.args.verbose,
+                                 pathway=config.pathway))
 
-    if config.thread_num != 1:
-        multiprocess_dispatch(config, single_job_module,
-                              module=partial(
-                                  start_match_enzyme,
-                                  model=config.model,
-                                  verbose=config.args.verbose
-                              ))
-    else:
-        for file in tqdm(config.file_list):
-            savepath = config.create_savepath(file)
-            start_match_enzyme(filepath=file, output_filepath=savepath,
-                               model=config.model, verbose=config.args.verbose)
+    batches = [config.file_list[i:i + BATCH_SIZE]
+               for i in range(0, len(config.file_list), BATCH_SIZE)]
+    multiprocess_dispatch(config, cached_batch_job, module="match_enzyme", job=job,
+                          thread_num=1, items=batches)
+
+
+def run_post_alignment(config: Configuration):
+    """Run parse_blast, best_blast and match_enzyme in memory for each diamond output."""
+    config.check_io(module="post_alignment")
+    config.logger.info("Parse, select and match the blastp result to the pathway")
+
+    multiprocess_dispatch(config, cached_job, module="post_alignment",
+                          job=post_alignment_job)
+
+
+def post_alignment_job(file, config: Configuration):
+    savepath = config.create_savepath(file, module="post_alignment")
+    parse_blast_savepath = best_blast_savepath = None
+    if config.keep_intermediate:
+        parse_blast_savepath = config.create_savepath(file, module="parse_blast")
+        best_blast_savepath = config.create_savepath(file, module="best_blast")
+    start_post_alignment(file, savepath,
+                         parser=get_blast_parser(config),
+                         criteria=config.criteria,
+                         filter=config.filter,
+                         model=config.model,
+                         verbose=config.args.verbose,
+                         pathway=config.pathway,
+                         parse_blast_filepath=parse_blast_savepath,
+                         best_blast_filepath=best_blast_savepath,
+                         top_n=config.top_n,
+                         tie_breaker=config.tie_breaker)
 
+    return savepath
 
-def single_job_module(file, module, config: Configuration):
-    savepath = config.create_savepath(file)
+
+def single_job_module(file, module, config: Configuration, stage=None):
+    savepath = config.create_savepath(file, module=stage)
     module(filepath=file, output_filepath=savepath)
 
+    return savepath
+
+
+def batch_job_module(files, module, config: Configuration, stage=None):
+    savepaths = [config.create_savepath(file, module=stage) for file in files]
+    module(filepaths=files, output_filepaths=savepaths)
+
+    return savepaths
+
 
 def run_result_summary(config: Configuration):
     """Parse the result from match_enzyme module"""
     config.check_io(module="result_summary")
     config.logger.info("Parse the prediction result")
-    result_summary(path=config.input_path, output_path=config.output_path)
+    if config.events is not None:
+        config.events.stage_started("result_summary", len(config.file_list))
+    with profiled_job("result_summary", config.file_list, config):
+        result_summary(path=config.input_path, output_path=config.output_path,
+                       target=config.pathway.target, processes=config.thread_num,
+                       shard=config.shard)
+    if config.events is not None:
+        config.events.stage_finished("result_summary", done=len(config.file_list))
+
+
+def run_serve(config: Configuration):
+    """Score the genomes submitted over HTTP with a warm pipeline.
+
+    The configuration, the compiled pathway and the database are loaded and
+    checked once. The database file is also read ahead into the page cache,
+    since diamond loads it again for every batch of submissions.
+    """
+    modules = ["prodigal", "blast", "post_alignment"]
+    config.check_serve_io(modules)
+    prodigal_executable = Path(config.default["executable"]["prodigal_path"]).resolve()
+    blast_executable = Path(config.default["executable"]["diamond_path"])
+    if hasattr(os, "posix_fadvise"):
+        with open(config.database, "rb") as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+
+    serve_config = config.default.get("serve", {})
+    batch_size = config.args.batch_size or serve_config.get("batch_size", 8)
+    batch_wait = config.args.batch_wait
+    if batch_wait is None:
+        batch_wait = serve_config.get("batch_wait", 0.2)
+    service = ScoringService(partial(score_submissions,
+                                     prodigal_executable=prodigal_executable,
+                                     blast_executable=blast_executable,
+                                     config=config),
+                             target=config.pathway.target,
+                             workers=config.resources.diamond_jobs,
+                             batch_size=batch_size, batch_wait=batch_wait,
+                             queue_size=serve_config.get("queue_size", 64),
+                             timeout=serve_config.get("timeout", 600) or None,
+                             keep_files=config.args.debug)
+    server = make_server(service, config.input_path, socket_path=config.args.socket,
+                         host=config.args.host, port=config.args.port)
+    address = config.args.socket or f"http://{config.args.host}:{server.server_address[1]}"
+    config.logger.info(f"Serve on {address} with batches of up to {batch_size} genome(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        config.logger.info("Stop serving")
+
+
+def score_submissions(submissions, prodigal_executable, blast_executable,
+                      config: Configuration):
+    """Score a batch of genomes submitted to the service.
+
+    The genomes are predicted in parallel, the proteins of the batch are
+    aligned in one diamond run, and each diamond output is scored in memory.
+    A genome that prodigal or the scoring fails on only fails its own
+    submission.
+
+    Returns:
+        The match_enzyme output path of each submission, `None` if no
+        protein was found, or the `ScoringError` of the submission.
+
+    Raises:
+        ScoringError: diamond failed on the batch.
+    """
+    def predict(submission):
+        if submission.sequence_type == "protein":
+            return submission.path
+        try:
+            return single_job_executable(submission.path, "prodigal", prodigal_executable,
+                                         config)
+        except SystemExit:
+            return ScoringError(f"prodigal failed on {submission.name}")
+
+    intermediates = []
+    outputs = []
+    try:
+        with ThreadPoolExecutor(config.resources.prodigal_workers) as executor:
+            proteins = list(executor.map(predict, submissions))
+        queries = [path for path in proteins if isinstance(path, Path)]
+        intermediates.extend(path for path, submission in zip(proteins, submissions)
+                             if isinstance(path, Path) and path != submission.path)
+        alignments = {}
+        if queries:
+            try:
+                alignments = dict(zip(queries, batch_job_executable(queries, blast_executable,
+                                                                    config)))
+            except SystemExit:
+                raise ScoringError("diamond failed on the batch") from None
+        intermediates.extend(path for path in alignments.values() if path is not None)
+
+        for submission, path in zip(submissions, proteins):
+            alignment = alignments.get(path)
+            if isinstance(path, Exception) or alignment is None:
+                outputs.append(path if isinstance(path, Exception) else None)
+                continue
+            try:
+                outputs.append(post_alignment_job(alignment, config))
+            except Exception as err:
+                outputs.append(ScoringError(f"Scoring {submission.name} failed: "
+                                            f"{type(err).__name__}: {err}"))
+    finally:
+        if not config.args.debug:
+            for path in intermediates:
+                Path(path).unlink(missing_ok=True)
+
+    return outputs
+
+
+def run_merge(args):
+    """Merge the result summaries of the shards of a run."""
+    filepaths = sorted(Path(args.input).glob(f"**/{STATE_FILENAME}"))
+    if not filepaths:
+        raise ValueError(f"No {STATE_FILENAME} found in {args.input}")
+    output_path = Path(args.output or "./biopathpred_output").joinpath("result_summary")
+    output_path.mkdir(parents=True, exist_ok=True)
+    count = merge_summaries(filepaths, output_path)
+    print(f"Merge {len(filepaths)} summaries of {count} genome(s) into {output_path}")
+
+
+def run_build_db(args):
+    """Build the database FASTA file and the diamond database from enzyme files."""
+    if args.output is None:
+        raise ValueError("Set the path of the database FASTA file with -o")
+    cpus = build_db_cpus(args)
+    build_blast_db(args.input, args.output, filter_fragment=args.no_fragment,
+                   workers=cpus, deduplicate=not args.keep_duplicates,
+                   drop_conflicts=args.drop_conflicts)
+    if args.makedb:
+        db_path = make_diamond_db(args.output, build_db_diamond_path(args), threads=cpus)
+        print(f"Diamond database: {db_path}")
+
+
+def run_catalog(args):
+    """Update the enzyme families of a database catalog and export the database."""
+    with DatabaseCatalog(args.input) as catalog:
+        for enzyme_id_name in args.remove or []:
+            catalog.remove_enzyme(enzyme_id_name)
+            print(f"Remove {enzyme_id_name}")
+        for filepath in args.add or []:
+            print(f"Add {Path(filepath).name}: {catalog.add_enzyme(filepath)} entries")
+        for filepath in args.replace or []:
+            print(f"Replace {Path(filepath).name}: "
+                  f"{catalog.add_enzyme(filepath, replace=True)} entries")
+        if args.list:
+            for enzyme_id_name, count in catalog.enzymes():
+                print(f"{enzyme_id_name}\t{count}")
+        if args.output is None:
+            return
+        stats = catalog.export_fasta(args.output, filter_fragment=args.no_fragment,
+                                     deduplicate=not args.keep_duplicates,
+                                     drop_conflicts=args.drop_conflicts)
+    db_path = Path(args.output).with_suffix(".dmnd")
+    if args.makedb and (stats is not None or not db_path.is_file()):
+        make_diamond_db(args.output, build_db_diamond_path(args), db_path,
+                        threads=build_db_cpus(args))
+        print(f"Diamond database: {db_path}")
+
+
+def build_db_cpus(args) -> int:
+    cpus = detect_cpus()
+    if 0 < args.cpus < cpus:
+        cpus = args.cpus
+    return cpus
+
+
+def build_db_diamond_path(args) -> str:
+    """Get the diamond executable from --diamond or config.toml."""
+    if args.diamond is not None:
+        return args.diamond
+    diamond_path = "diamond"
+    if Path("./config.toml").is_file():
+        with open("./config.toml", "rb") as f:
+            diamond_path = tomli.load(f).get("executable", {}).get("diamond_path", diamond_path)
+    return diamond_path
 
 
 def parse_arguments():
@@ -233,7 +1011,28 @@ def parse_arguments():
         parents=[parent_arguments(), optional_arguments(case="build_db")],
         conflict_handler="resolve")
     build_db_parser.set_defaults(
-        func=build_blast_db, type="build_db")
+        func=run_build_db, type="build_db")
+
+    catalog_parser = subparser.add_parser(
+        "catalog",
+        parents=[parent_arguments(), optional_arguments(case="catalog")],
+        conflict_handler="resolve")
+    catalog_parser.set_defaults(
+        func=run_catalog, type="catalog")
+
+    merge_parser = subparser.add_parser(
+        "merge",
+        parents=[parent_arguments(), optional_arguments(case="merge")],
+        conflict_handler="resolve")
+    merge_parser.set_defaults(
+        func=run_merge, type="merge")
+
+    serve_parser = subparser.add_parser(
+        "serve",
+        parents=[parent_arguments(), optional_arguments(), optional_arguments(case="serve")],
+        conflict_handler="resolve")
+    serve_parser.set_defaults(
+        func=run_serve, type="serve")
 
     args = parser.parse_args()
 
@@ -247,52 +1046,167 @@ def parent_arguments():
                                help="input a file or directory path")
     parent_parser.add_argument("-o", "--output", type=str, help="output path")
     parent_parser.add_argument("--cpus", type=int, default=0,
-                               help="number of processes to be created (default: available_threads / 2)")
+                               help="number of CPUs to be used (default: detected from the CPU affinity and cgroup quota)")
+    parent_parser.add_argument("--memory", type=str,
+                               help="memory to be used, e.g. 16G (default: detected available memory)")
+    parent_parser.add_argument("--resume", action="store_true",
+                               help="reuse the outputs that are up to date with the inputs and parameters")
 
     return parent_parser
 
 
-def optional_arguments(case: Literal["main", "prodigal", "blast",
+def optional_arguments(case: Literal["main", "prodigal", "blast", "parse_xml",
                                      "parse_blast", "best_blast",
                                      "match_enzyme", "result_summary",
-                                     "build_db"] = "main"):
+                                     "build_db", "catalog", "merge",
+                                     "serve"] = "main"):
     optional_parser = argparse.ArgumentParser(description="Optional parser.",
                                               add_help=False)
     if case == "main":
         optional_parser.add_argument("-i", "--input", type=str, required=False,
                                      help="input a file or directory path")
+        optional_parser.add_argument(
+            "--prodigal-shards", type=int,
+            help="number of contig shards predicted in parallel for a large genome")
         optional_parser.add_argument(
             "-d", "--database", type=str, help="database path")
+        optional_parser.add_argument(
+            "--batch-size", type=int, help="number of genomes aligned in one diamond run")
+        optional_parser.add_argument(
+            "--outfmt", choices=["xml", "tabular"], help="diamond output format")
         optional_parser.add_argument(
             "-c", "--criteria", type=str, help="selection criteria")
         optional_parser.add_argument(
             "-f", "--filter", nargs="*", type=str, help="filter options")
+        optional_parser.add_argument(
+            "--top-n", type=int, help="number of best alignments kept for each gene")
+        optional_parser.add_argument(
+            "--tie-breaker", type=str, help="column ranking the alignments with the same criteria")
         optional_parser.add_argument(
             "-m", "--model", type=str, help="model name")
+        optional_parser.add_argument(
+            "-p", "--pathway", type=str, help="pathway definition file")
+        optional_parser.add_argument(
+            "--intermediate-format", choices=TABLE_FORMATS,
+            help="format of the parse_blast and best_blast outputs")
         optional_parser.add_argument("--verbose", action="store_true",
                                      help="print match_enzyme result to screen")
         optional_parser.add_argument("--debug", action="store_true",
                                      help="keep all intermediate files if specified")
+        optional_parser.add_argument(
+            "--compression", choices=list(COMPRESSION_SUFFIXES),
+            help="compression of the intermediate files")
+        optional_parser.add_argument("--scheduler", choices=["stage", "stream"],
+                                     help="run the modules one after another (stage) "
+                                          "or stream each genome through them (stream, "
+                                          "default)")
+        optional_parser.add_argument("--fused", action=argparse.BooleanOptionalAction,
+                                     help="parse, select and match the blastp results in "
+                                          "memory without intermediate files (default; they are "
+                                          "kept with --debug)")
+    elif case == "prodigal":
+        optional_parser.add_argument(
+            "--prodigal-shards", type=int,
+            help="number of contig shards predicted in parallel for a large genome")
+        optional_parser.add_argument(
+            "--compression", choices=list(COMPRESSION_SUFFIXES),
+            help="compression of the intermediate files")
     elif case == "blast":
         optional_parser.add_argument(
             "-d", "--database", type=str, help="database path")
+        optional_parser.add_argument(
+            "--batch-size", type=int, help="number of genomes aligned in one diamond run")
+        optional_parser.add_argument(
+            "--outfmt", choices=["xml", "tabular"], help="diamond output format")
+        optional_parser.add_argument(
+            "--compression", choices=list(COMPRESSION_SUFFIXES),
+            help="compression of the intermediate files")
+    elif case == "parse_xml":
+        optional_parser.add_argument(
+            "--outfmt", choices=["xml", "tabular"], help="diamond output format")
+        optional_parser.add_argument(
+            "--intermediate-format", choices=TABLE_FORMATS,
+            help="format of the parse_blast and best_blast outputs")
+        optional_parser.add_argument(
+            "--compression", choices=list(COMPRESSION_SUFFIXES),
+            help="compression of the intermediate files")
     elif case == "best_blast":
         optional_parser.add_argument(
             "-c", "--criteria", type=str, help="selection criteria")
         optional_parser.add_argument(
             "-f", "--filter", nargs="*", type=str, help="filter options")
+        optional_parser.add_argument(
+            "--top-n", type=int, help="number of best alignments kept for each gene")
+        optional_parser.add_argument(
+            "--tie-breaker", type=str, help="column ranking the alignments with the same criteria")
+        optional_parser.add_argument(
+            "--intermediate-format", choices=TABLE_FORMATS,
+            help="format of the parse_blast and best_blast outputs")
+        optional_parser.add_argument(
+            "--compression", choices=list(COMPRESSION_SUFFIXES),
+            help="compression of the intermediate files")
     elif case == "match_enzyme":
         optional_parser.add_argument("param_start", type=int)
         optional_parser.add_argument("param_end", type=int)
         optional_parser.add_argument(
             "-m", "--model", type=str, help="model name")
+        optional_parser.add_argument(
+            "-p", "--pathway", type=str, help="pathway definition file")
+        optional_parser.add_argument(
+            "--intermediate-format", choices=TABLE_FORMATS,
+            help="format of the parse_blast and best_blast outputs")
         optional_parser.add_argument("--verbose", action="store_true",
                                      help="print match_enzyme result to screen")
-    elif case == "build_db":
+    elif case == "result_summary":
+        optional_parser.add_argument(
+            "-p", "--pathway", type=str, help="pathway definition file")
+    elif case == "serve":
+        optional_parser.add_argument("-i", "--input", type=str, required=False,
+                                     help="not used: the genomes are submitted to the service")
+        optional_parser.add_argument("--socket", type=str,
+                                     help="serve on this Unix socket instead of a TCP port")
+        optional_parser.add_argument("--host", type=str, default="127.0.0.1",
+                                     help="host of the TCP port (default: 127.0.0.1)")
+        optional_parser.add_argument("--port", type=int, default=8000,
+                                     help="TCP port (default: 8000)")
+        optional_parser.add_argument("--batch-wait", type=float,
+                                     help="seconds to wait for more genomes to score in a batch")
+    elif case in ("build_db", "catalog"):
+        if case == "catalog":
+            optional_parser.add_argument("--add", nargs="+", type=str,
+                                         help="add the enzyme files [int]_[str].fasta")
+            optional_parser.add_argument("--replace", nargs="+", type=str,
+                                         help="replace the enzymes with these enzyme files")
+            optional_parser.add_argument("--remove", nargs="+", type=str,
+                                         help="remove the enzymes, e.g. 1_iam1")
+            optional_parser.add_argument("--list", action="store_true",
+                                         help="list the enzymes and their numbers of sequences")
         optional_parser.add_argument("--no_fragment", action="store_true",
                                      help="do not keep fragment sequences")
+        optional_parser.add_argument("--keep-duplicates", action="store_true",
+                                     help="keep the duplicate sequences of an enzyme")
+        optional_parser.add_argument("--drop-conflicts", action="store_true",
+                                     help="drop the sequences already collected for another enzyme")
+        optional_parser.add_argument("--makedb", action=argparse.BooleanOptionalAction,
+                                     default=True,
+                                     help="run diamond makedb on the database FASTA file")
+        optional_parser.add_argument("--diamond", type=str,
+                                     help="diamond executable (default: diamond_path in config.toml)")
     else:
         pass
+    # serve takes these options from the main parser
+    if case not in ("build_db", "catalog", "merge", "serve"):
+        optional_parser.add_argument(
+            "--shard", type=str,
+            help="process only the K-th of N shards of the input genomes, given as K/N")
+        optional_parser.add_argument(
+            "--profile", action="store_true",
+            help="record the time and resources of each job into profile.json "
+                 "in the output directory")
+        optional_parser.add_argument(
+            "--events", type=str,
+            help="write the progress events as JSON lines to a file, "
+                 "or to a Unix socket given as unix:PATH")
 
     return optional_parser
 
@@ -300,11 +1214,17 @@ def optional_arguments(case: Literal["main", "prodigal", "blast",
 def main():
     args = parse_arguments()
 
-    if args.type != "build_db":
+    if args.type not in ("build_db", "catalog", "merge"):
         config = Configuration(args)
-        args.func(config)
+        if config.events is None:
+            args.func(config)
+        else:
+            with config.events.run(config.type):
+                args.func(config)
+        if config.profiler is not None:
+            config.write_profile()
     else:
-        args.func(args.input, args.output)
+        args.func(args)
 
 
 if __name__ == "__main__":
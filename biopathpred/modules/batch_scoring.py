@@ -0,0 +1,166 @@
+from pathlib import Path
+from typing import List, Literal, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from biopathpred.modules.existence_score_model import existence_score_model
+from biopathpred.modules.pathway import CompiledPathway, compiled_pathway
+from biopathpred.modules.table_io import read_table
+
+# The number of genomes scored at once, which bounds the memory of the matrices
+BATCH_SIZE = 10000
+
+
+def score_enzyme_matrix(genome_index: np.ndarray,
+                        enzyme_id: np.ndarray,
+                        identity: np.ndarray,
+                        genome_num: int,
+                        enzyme_ids: Sequence[int]
+                        ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Count the enzymes of each genome and combine their existence scores.
+
+    This is the vectorized version of `match_enzyme_existence` for many
+    genomes at once. The scores of the same enzyme in a genome are combined
+    by 1 - prod(1 - score) in the order of the rows, like `np.nanprod` in
+    the groupby of `match_enzyme_existence`, so the results are identical.
+
+    Args:
+        genome_index: The index of the genome of each best alignment.
+        enzyme_id: The enzyme id of each best alignment (as float, NaN if
+            the alignment is not labeled).
+        identity: The identity of each best alignment.
+        genome_num: The number of genomes.
+        enzyme_ids: The enzyme ids of the matrix columns.
+
+    Returns:
+        A tuple of genomes x enzymes matrices of the counts and probabilities.
+    """
+    # Enzyme ids are converted like int() in `match_enzyme_existence`, and
+    # the alignments of other ids (e.g. 0 for unlabeled) are left out
+    enzyme_column = pd.Index(enzyme_ids).get_indexer(np.trunc(enzyme_id))
+    keep = enzyme_column >= 0
+    genome_index = genome_index[keep]
+    enzyme_column = enzyme_column[keep].astype(np.int64)
+    score = existence_score_model(identity[keep])
+
+    counts = np.zeros((genome_num, len(enzyme_ids)), dtype=np.int64)
+    prob = np.zeros((genome_num, len(enzyme_ids)), dtype=np.float64)
+    if len(score) == 0:
+        return counts, prob
+
+    cell = genome_index * len(enzyme_ids) + enzyme_column
+    # A stable sort keeps the rows of each cell in their original order
+    order = np.argsort(cell, kind="stable")
+    cell = cell[order]
+    complement = 1 - score[order]
+    complement[np.isnan(complement)] = 1
+    starts = np.flatnonzero(np.r_[True, cell[1:] != cell[:-1]])
+    counts.flat[cell[starts]] = np.diff(np.r_[starts, len(cell)])
+    prob.flat[cell[starts]] = 1 - np.multiply.reduceat(complement, starts)
+
+    return counts, prob
+
+
+def format_match_enzyme_result(compound_names: Sequence[str],
+                               compound_result: list,
+                               enzyme_names: Sequence[str],
+                               enzyme_result: list) -> List[str]:
+    """
+    Format the result of a genome like `get_pathway_result` and
+    `get_enzyme_result`.
+
+    Args:
+        compound_names: The names of the compounds.
+        compound_result: The rounded probabilities or visited flags of the
+            compounds of the genome.
+        enzyme_names: The names of the enzymes.
+        enzyme_result: The rounded probabilities (an int 0 for enzymes that are
+            not found) or existence flags of the enzymes of the genome.
+
+    Returns:
+        A list of strings containing the pathway mapping result.
+    """
+    result = ["Compound list:\n"]
+    result.extend(f"{name}: {value}\n"
+                  for name, value in zip(compound_names, compound_result))
+    result.append("\n")
+    result.append("Enzyme list:\n")
+    result.extend(f"{name}: {value}\n"
+                  for name, value in zip(enzyme_names, enzyme_result))
+
+    return result
+
+
+def match_enzyme_results(frames: List[pd.DataFrame],
+                         model: Literal["prob", "binary"],
+                         pathway: CompiledPathway = compiled_pathway) -> List[List[str]]:
+    """
+    Perform pathway mapping for the best alignment results of many genomes.
+
+    Args:
+        frames: The best alignment results of each genome, with "enzyme_id"
+            and "identity" columns.
+        model: See parameter `model` in `start_match_enzyme`.
+        pathway: See parameter `pathway` in `start_match_enzyme`.
+
+    Returns:
+        A list of the result lines of each genome, the same as those of
+        `start_match_enzyme`.
+    """
+    if model not in ("prob", "binary"):
+        raise NameError("Model name error")
+
+    genome_index = np.repeat(np.arange(len(frames)), [len(data) for data in frames])
+    data = pd.concat([data[["enzyme_id", "identity"]] for data in frames],
+                     ignore_index=True)
+    enzyme_id = pd.to_numeric(data["enzyme_id"], errors="coerce").to_numpy(np.float64)
+    identity = data["identity"].to_numpy(np.float64)
+
+    counts, enzyme_prob = score_enzyme_matrix(genome_index, enzyme_id, identity,
+                                              len(frames), pathway.enzyme_ids)
+    enzyme_exist = counts > 0
+    compound_prob, compound_visited = pathway.evaluate(enzyme_prob, enzyme_exist)
+
+    if model == "prob":
+        compound_result = np.round(compound_prob, 6)
+        # Enzymes that are not found keep the initial probability 0 (an int)
+        enzyme_result = np.round(enzyme_prob, 6).astype(object)
+        enzyme_result[~enzyme_exist] = 0
+    else:
+        compound_result = compound_visited
+        enzyme_result = enzyme_exist
+
+    return [format_match_enzyme_result(pathway.compound_names, compound_row,
+                                       pathway.enzyme_names, enzyme_row)
+            for compound_row, enzyme_row in zip(compound_result.tolist(),
+                                                enzyme_result.tolist())]
+
+
+def start_batch_match_enzyme(filepaths: List[Union[str, Path]],
+                             output_filepaths: List[Union[str, Path]],
+                             model: Literal["prob", "binary"],
+                             verbose: bool,
+                             pathway: CompiledPathway = compiled_pathway):
+    """
+    Perform pathway mapping for many genomes at once.
+
+    The output of each genome is the same as that of `start_match_enzyme`.
+
+    Args:
+        filepaths: The paths to the files containing best alignment results,
+            one per genome (see `start_match_enzyme`).
+        output_filepaths: The paths for saving the output of each genome.
+        model: See parameter `model` in `start_match_enzyme`.
+        verbose: See parameter `verbose` in `start_match_enzyme`.
+        pathway: See parameter `pathway` in `start_match_enzyme`.
+    """
+    frames = [read_table(filepath, columns=["enzyme_id", "identity"])
+              for filepath in filepaths]
+    results = match_enzyme_results(frames, model, pathway)
+    for result, output_filepath in zip(results, output_filepaths):
+        if verbose:
+            print("".join(result), end="")
+        with open(output_filepath, "w") as f:
+            f.writelines(result)
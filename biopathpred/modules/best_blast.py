@@ -1,25 +1,165 @@
+import re
+from typing import List, Optional
+
+import numpy as np
 import pandas as pd
 
+from biopathpred.modules.compression import strip_compression
+from biopathpred.modules.table_io import (cast_csv_dtypes, iter_table,
+                                          update_csv_dtypes, write_table)
+
+# The number of alignments read at a time by `find_best_blast`
+CHUNK_SIZE = 200000
+
+REGEX_FILTER = re.compile(r"(\w+)(<=|>=|=)(.+)")
+
+# The diamond options that drop the alignments below a threshold, with the
+# slack for the rounding of the values in the diamond output. The bit score
+# is left out, because --min-score overrides the e-value cutoff of diamond.
+DIAMOND_FILTER_OPTIONS = {"identity": ("--id", 0.001),
+                          "coverage": ("--query-cover", 0.001)}
+# The default e-value cutoff of diamond
+DIAMOND_EVALUE = 0.001
+
 
 def parse_filter(filter):
+    """Parse the filter strings into a list of (column, operator, threshold).
+
+    A filter is "[column]=[threshold]" or "[column]>=[threshold]" for a
+    minimum, or "[column]<=[threshold]" for a maximum (e.g. "evalue<=1e-5").
+    """
     if not isinstance(filter, list):
         raise Exception("The filter for best_blast should be in a list format")
-    filter_dict = {}
+    filter_list = []
     for filter_item in filter:
+        match = REGEX_FILTER.fullmatch(filter_item)
         try:
-            column, threshold = filter_item.split("=")
-            filter_dict[column] = float(threshold)
-        except ValueError:
+            column, operator, threshold = match.groups()
+            filter_list.append((column, "<=" if operator == "<=" else ">=", float(threshold)))
+        except (AttributeError, ValueError):
             print("The filter should have the following format '[column]=[threshold]'")
-    return filter_dict
+    return filter_list
+
+
+def diamond_filter_options(criteria: str, filter: List[str]) -> List[str]:
+    """Translate the filters that cannot change the selected alignments into diamond options.
+
+    The filters are applied to the best alignments of each gene, so a filter
+    applied by diamond before the selection would usually let a worse
+    alignment replace a best alignment that fails it (e.g. a coverage filter
+    with the score criteria). It is safe in two cases:
+
+    - A minimum of the criteria column itself (identity or coverage), since
+      the alignments below it are ranked below all the others. The query
+      cover of diamond is never below the coverage, which leaves out gaps.
+    - A maximum e-value with the score criteria, since the e-value of the
+      alignments of a gene decreases with their bit score. It is only given
+      to diamond if it is lower than the default cutoff.
+
+    The filters are still applied by `find_best_blast`.
+
+    Args:
+        criteria: See parameter `criteria` in `find_best_blast`.
+        filter: See parameter `filter` in `find_best_blast`.
+
+    Returns:
+        A list of diamond options.
+    """
+    options = []
+    for column, operator, threshold in parse_filter(filter):
+        if operator == ">=" and column == criteria and column in DIAMOND_FILTER_OPTIONS:
+            option, slack = DIAMOND_FILTER_OPTIONS[column]
+            options.extend([option, str(max(threshold - slack, 0))])
+        elif operator == "<=" and column == "evalue" and criteria == "score":
+            # The e-values in the diamond output have 3 significant digits
+            evalue = threshold * 1.01
+            if evalue < DIAMOND_EVALUE:
+                options.extend(["--evalue", str(evalue)])
+
+    return options
+
 
+def find_best_blast(filepath, output_filepath, criteria="score", filter=None,
+                    top_n=1, tie_breaker=None):
+    """Select the best alignments of each predicted gene from a parse_blast table.
 
-def find_best_blast(filepath, output_filepath, criteria="score", filter=None):
-    file = pd.read_csv(filepath)
-    # filter the best result in each group (gene_prediction_id)
-    data = file.loc[file.groupby(["id"])[criteria].idxmax()]
+    The table is read in chunks of `CHUNK_SIZE` alignments, and only the
+    best alignments of each gene seen so far are kept between chunks, so the
+    memory grows with the number of genes, not the number of alignments. The
+    output is the same as `select_best_blast` on the whole table, and a csv
+    output has the values of a csv table read at once (e.g. an enzyme_id of
+    `5.0` if some alignments have no enzyme_id).
+
+    Args:
+        filepath: The path to the parse_blast table.
+        output_filepath: The path for saving the best alignments.
+        criteria: The column to rank the alignments of each gene by (the
+            largest first), e.g. "score".
+        filter: A list of filter strings (see `parse_filter`). The selected
+            alignments that fail any of them are removed.
+        top_n: The number of alignments kept for each gene.
+        tie_breaker: The column used to rank alignments with the same
+            `criteria` (the largest first). Without it, the first alignment
+            in the table wins.
+    """
     filter = parse_filter(filter)
-    if filter:
-        for filter_key, filter_value in filter.items():
-            data = data.loc[data[filter_key] >= filter_value]
-    data.to_csv(output_filepath, index=False)
+    numeric_columns = {criteria, tie_breaker, *(column for column, _, _ in filter)}
+    is_csv = strip_compression(filepath).suffix == ".csv"
+    best, dtypes = None, {}
+    for chunk in iter_table(filepath, CHUNK_SIZE, numeric_columns=numeric_columns):
+        if is_csv:
+            dtypes = update_csv_dtypes(dtypes, chunk)
+        if best is not None:
+            # Only the genes in this chunk can have a new best alignment
+            touched = best["id"].isin(chunk["id"].unique())
+            chunk = pd.concat([best[touched], chunk])
+            best = pd.concat([best[~touched], _top_alignments(chunk, criteria, top_n, tie_breaker)])
+        else:
+            best = _top_alignments(chunk, criteria, top_n, tie_breaker)
+
+    data = _sort_alignments(best, criteria, tie_breaker)
+    data = data[_filter_mask(data, filter)]
+    if is_csv:
+        data = cast_csv_dtypes(data, dtypes)
+    write_table(data, output_filepath)
+
+
+def select_best_blast(file, criteria="score", filter=None, top_n=1, tie_breaker=None):
+    """Select the best alignment of each predicted gene from parsed blastp results.
+
+    See `find_best_blast` for the parameters.
+    """
+    data = _top_alignments(file, criteria, top_n, tie_breaker)
+
+    return data[_filter_mask(data, parse_filter(filter))]
+
+
+def _sort_alignments(data: pd.DataFrame, criteria: str,
+                     tie_breaker: Optional[str] = None) -> pd.DataFrame:
+    # The sort is stable, so alignments with the same values keep their order
+    columns = [column for column in ("id", criteria, tie_breaker) if column is not None]
+    ascending = [True] + [False] * (len(columns) - 1)
+
+    return data.sort_values(columns, ascending=ascending, kind="mergesort")
+
+
+def _top_alignments(data: pd.DataFrame, criteria: str, top_n: int = 1,
+                    tie_breaker: Optional[str] = None) -> pd.DataFrame:
+    """Keep the `top_n` alignments of each gene, ordered by gene and rank."""
+    data = _sort_alignments(data[data["id"].notna()], criteria, tie_breaker)
+    if top_n == 1:
+        return data.drop_duplicates("id")
+
+    return data.groupby("id", sort=False).head(top_n)
+
+
+def _filter_mask(data: pd.DataFrame, filter: list) -> np.ndarray:
+    """Combine the thresholds of all filters into one mask."""
+    mask = np.ones(len(data), dtype=bool)
+    for column, operator, threshold in filter:
+        if operator == "<=":
+            mask &= (data[column] <= threshold).to_numpy()
+        else:
+            mask &= (data[column] >= threshold).to_numpy()
+
+    return mask
@@ -0,0 +1,114 @@
+import re
+from pathlib import Path
+from typing import List, Union
+
+from biopathpred.modules.compression import open_text
+
+# The proteins of each genome in a batch are tagged as "{genome_index}|{header}"
+TAG_SEPARATOR = "|"
+REGEX_QUERY_DEF = re.compile(r"^(\s*<(?:Iteration|BlastOutput)_query-def>)(\d+)\|")
+
+
+def tag_header(header: str, genome_index: int) -> str:
+    """Tag a FASTA header line with the index of its genome in the batch."""
+    return f">{genome_index}{TAG_SEPARATOR}{header[1:]}"
+
+
+def write_batch_query(faa_files: List[Union[str, Path]],
+                      query_path: Union[str, Path]) -> List[int]:
+    """Concatenate the proteins of several genomes into a single query file.
+
+    Args:
+        faa_files: The protein FASTA files of the genomes in the batch.
+        query_path: The path for saving the concatenated query.
+
+    Returns:
+        A list of the number of proteins in each genome.
+    """
+    protein_counts = []
+    with open(query_path, "w") as query:
+        for genome_index, faa_file in enumerate(faa_files):
+            count = 0
+            with open_text(faa_file, "r") as f:
+                for line in f:
+                    if line.startswith(">"):
+                        line = tag_header(line, genome_index)
+                        count += 1
+                    query.write(line)
+            protein_counts.append(count)
+
+    return protein_counts
+
+
+def split_batch_xml(xml_path: Union[str, Path],
+                    output_paths: List[Union[str, Path]]):
+    """Split the diamond XML output of a batch into one file per genome.
+
+    The header and footer of the batch output are copied to every file, and
+    each <Iteration> block is routed to the genome given by the tag of its
+    query, with the tag removed. The output files are therefore the same as
+    if diamond had been run on each genome separately.
+
+    Args:
+        xml_path: The diamond output of the batch (--outfmt 5).
+        output_paths: The paths for saving the output of each genome, in the
+            order of the genomes in the batch query. They are compressed if
+            their extension is that of a compression.
+    """
+    outputs = [open_text(path, "w") for path in output_paths]
+    try:
+        with open(xml_path, "r") as f:
+            for line in f:
+                line = _untag(line)
+                for output in outputs:
+                    output.write(line)
+                if line.strip() == "<BlastOutput_iterations>":
+                    break
+
+            block, genome_index = [], None
+            for line in f:
+                stripped = line.strip()
+                if stripped == "<Iteration>":
+                    block, genome_index = [line], None
+                elif block:
+                    match = REGEX_QUERY_DEF.search(line)
+                    if match is not None:
+                        genome_index = int(match.group(2))
+                        line = _untag(line)
+                    block.append(line)
+                    if stripped == "</Iteration>":
+                        outputs[genome_index].writelines(block)
+                        block = []
+                else:
+                    # The footer after the last iteration
+                    for output in outputs:
+                        output.write(line)
+    finally:
+        for output in outputs:
+            output.close()
+
+
+def _untag(line: str) -> str:
+    return REGEX_QUERY_DEF.sub(r"\1", line, count=1)
+
+
+def split_batch_tabular(tabular_path: Union[str, Path],
+                        output_paths: List[Union[str, Path]]):
+    """Split the diamond tabular output of a batch into one file per genome.
+
+    Each line starts with the tagged query title and is routed to its genome
+    with the tag removed.
+
+    Args:
+        tabular_path: The diamond output of the batch (--outfmt 6).
+        output_paths: See parameter `output_paths` in `split_batch_xml`.
+    """
+    outputs = [open_text(path, "w") for path in output_paths]
+    try:
+        with open(tabular_path, "r") as f:
+            for line in f:
+                genome_index, line = line.split(TAG_SEPARATOR, 1)
+                outputs[int(genome_index)].write(line)
+    finally:
+        for output in outputs:
+            output.close()
@@ -0,0 +1,75 @@
+import gzip
+import importlib.util
+import shutil
+from pathlib import Path
+from typing import Optional, Union
+
+# The compressions of the input and intermediate files, by file extension
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+# Like `gzip -6`, much faster than the default level 9 for little larger files
+GZIP_LEVEL = 6
+
+
+def get_compression(filepath: Union[str, Path]) -> Optional[str]:
+    """Get the compression of a file from its extension, or `None`."""
+    suffix = Path(filepath).suffix
+    for compression, compression_suffix in COMPRESSION_SUFFIXES.items():
+        if suffix == compression_suffix:
+            return compression
+    return None
+
+
+def strip_compression(filepath: Union[str, Path]) -> Path:
+    """Remove the compression extension of a path, e.g. `a.fna.gz` to `a.fna`."""
+    filepath = Path(filepath)
+    if get_compression(filepath) is not None:
+        return filepath.with_suffix("")
+    return filepath
+
+
+def check_compression(compression: Optional[str]):
+    """Check that a compression is known and its optional dependency is installed.
+
+    Raises:
+        ValueError: If the compression is unknown.
+        ImportError: If zstandard is needed but not installed.
+    """
+    if compression is not None and compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression: {compression}")
+    if compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+        raise ImportError("The zstd compression requires zstandard "
+                          "(pip install biopathpred[zstd])")
+
+
+def open_text(filepath: Union[str, Path], mode: str = "r"):
+    """Open a file that may be compressed, as given by its extension.
+
+    Args:
+        filepath: The path to the file.
+        mode: "r" or "w" for text, "rb" or "wb" for bytes.
+
+    Returns:
+        A file object that (de)compresses the data as it is read or written.
+    """
+    compression = get_compression(filepath)
+    if compression == "gzip":
+        return gzip.open(filepath, mode if "b" in mode else f"{mode}t",
+                         compresslevel=GZIP_LEVEL)
+    elif compression == "zstd":
+        check_compression(compression)
+        import zstandard
+
+        return zstandard.open(filepath, mode)
+    return open(filepath, mode)
+
+
+def is_empty(filepath: Union[str, Path]) -> bool:
+    """Check whether a file that may be compressed has no content."""
+    with open_text(filepath, "rb") as f:
+        return f.read(1) == b""
+
+
+def copy_file(source: Union[str, Path], destination: Union[str, Path]):
+    """Copy a file, (de)compressing it as given by the extensions of both paths."""
+    with open_text(source, "rb") as input, open_text(destination, "wb") as output:
+        shutil.copyfileobj(input, output, 1024 * 1024)
@@ -3,10 +3,25 @@ import os
 from shutil import rmtree
 from datetime import datetime
 from pathlib import Path
-from typing import List, Literal, Union
+from typing import List, Literal, Optional, Union
 
 import tomli
 
+from biopathpred.modules.best_blast import diamond_filter_options
+from biopathpred.modules.compression import (COMPRESSION_SUFFIXES,
+                                             check_compression,
+                                             strip_compression)
+from biopathpred.modules.parse_blastp_tabular import DIAMOND_TABULAR_OPTIONS
+from biopathpred.modules.events import EventStream
+from biopathpred.modules.pathway import load_pathway
+from biopathpred.modules.profiler import Profiler
+from biopathpred.modules.resources import (ResourcePlan, detect_cpus,
+                                           detect_memory, parse_memory)
+from biopathpred.modules.sharding import in_shard, parse_shard
+from biopathpred.modules.stage_cache import StageCache, file_digest
+from biopathpred.modules.table_io import check_table_format
+from biopathpred.modules.training_cache import TrainingCache, load_taxa
+
 
 class Configuration():
     """Configure input and output path, and check parameters.
@@ -19,7 +34,23 @@ class Configuration():
         file_list: The file list for the files with the right extension in the input path.
         logger: A logger for storing the info from each module.
         thread_num: An integer of available cpu threads.
+        blast_outfmt: The diamond output format, `xml` or `tabular`.
+        xml_parser: The parser of the XML output, `iterparse` or `biopython`.
+        intermediate_format: The format of the parse_blast and best_blast
+            outputs, `csv`, `parquet` or `feather`.
+        compression: The compression of the intermediate files, `gzip`,
+            `zstd` or `None`.
+        scheduler: The scheduler of the pipeline, `stage` or `stream`.
+        resources: A `ResourcePlan` of the worker counts and diamond options.
         default: Default configs for each module.
+        cache: A `StageCache` recording the keys of the module outputs.
+        resume: Whether to reuse the module outputs that are up to date.
+        profiler: A `Profiler` recording the time and resources of each job,
+            or `None` without `--profile`.
+        events: An `EventStream` of the progress of the run, or `None`
+            without `--events`.
+        shard: The shard (K, N) of the input genomes processed by this run
+            (see `genome_shard`), or `None` for all genomes.
     """
     def __init__(self, args):
         """Initialize the instance based on argparse inputs.
@@ -34,19 +65,47 @@ class Configuration():
         self._base_path = self._get_base_path()
         self.file_list = None
         self.logger = self._config_logging()
-        self.thread_num = self._get_thread_num()
         self.default = self._load_default_config()
-
-        self._file_ext_dict = {"prodigal": {"input": "fna", "output": "faa"},
-                               "blast": {"input": "faa", "output": "xml"},
-                               "parse_blast": {"input": "xml", "output": "csv"},
-                               "best_blast": {"input": "csv", "output": "csv"},
-                               "match_enzyme": {"input": "csv", "output": "txt"},
+        self.scheduler = self._get_scheduler()
+        self.resources = self._plan_resources()
+        self.thread_num = self.resources.python_workers
+        self.cache = StageCache(self._base_path.joinpath(".cache"))
+        self.resume = getattr(args, "resume", False)
+        self.shard = None
+        if getattr(args, "shard", None):
+            self.shard = parse_shard(args.shard)
+        self.profiler = None
+        if getattr(args, "profile", False):
+            self.profiler = Profiler(self._base_path.joinpath(".profile"))
+            self.profiler.reset()
+        self.events = None
+        if getattr(args, "events", None):
+            self.events = EventStream(args.events)
+        self.blast_outfmt = self._get_blast_outfmt()
+        blast_ext = "xml" if self.blast_outfmt == "xml" else "tsv"
+        self.xml_parser = self.default.get("parse_blast", {}).get("xml_parser", "iterparse")
+        if self.xml_parser not in ("iterparse", "biopython"):
+            raise ValueError(f"Unknown XML parser: {self.xml_parser}")
+        self.intermediate_format = self._get_intermediate_format()
+        table_ext = self.intermediate_format
+        self.compression = self._get_compression()
+        # The columnar formats are already compressed
+        suffix = COMPRESSION_SUFFIXES.get(self.compression, "")
+        if table_ext == "csv":
+            table_ext += suffix
+
+        # The input files may also be compressed (see `_get_files_in_input_path`)
+        self._file_ext_dict = {"prodigal": {"input": "fna", "output": f"faa{suffix}"},
+                               "blast": {"input": "faa", "output": f"{blast_ext}{suffix}"},
+                               "parse_blast": {"input": blast_ext, "output": table_ext},
+                               "best_blast": {"input": table_ext, "output": table_ext},
+                               "match_enzyme": {"input": table_ext, "output": "txt"},
+                               "post_alignment": {"input": blast_ext, "output": "txt"},
                                "result_summary": {"input": "txt", "output": "csv"}}
 
     def check_io(self, module: Literal["prodigal", "blast", "parse_blast",
                                        "best_blast", "match_enzyme",
-                                       "result_summary"]):
+                                       "post_alignment", "result_summary"]):
         """Determine the input and output path for each module.
 
         This method will set the input and output path of the object,
@@ -63,24 +122,75 @@ class Configuration():
             # will be from the last module.
             self.input_path = self.output_path
 
-        output_dirname = module
-        if module == "match_enzyme":
-            output_dirname = "match_enzyme_result"
-        self.output_path = self._base_path.joinpath(output_dirname)
-        self.output_path.mkdir(exist_ok=True)
+        self.output_path = self._get_output_path(module)
         self.type = module
 
         self.file_list = self._get_files_in_input_path()
 
         self._load_params()
 
+    def check_stream_io(self, modules: List[str]):
+        """Prepare the input and output paths for streaming several modules.
+
+        Unlike `check_io`, the output folders and parameters of all the given
+        modules are prepared at once, because a genome may be in any stage
+        while the others are still being processed. The input files are
+        collected for the first module, and the object is left in the state
+        of the last module so that `check_io` can continue from there.
+
+        Args:
+            modules: The names of the modules to be streamed, in order.
+        """
+        self.input_path = Path(self.args.input).resolve()
+        self.type = modules[0]
+        self.file_list = self._get_files_in_input_path()
+
+        for module in modules:
+            self.output_path = self._get_output_path(module)
+            self.type = module
+            self._load_params()
+
+    def check_serve_io(self, modules: List[str]):
+        """Prepare the output folders and parameters of the modules for serving.
+
+        Like `check_stream_io`, but the genomes are submitted to the service
+        instead of being collected from an input path. The submissions are
+        saved in the `submissions` folder, which is the input path.
+
+        Args:
+            modules: The names of the modules run on each submission, in order.
+        """
+        self.input_path = self._get_output_path("submissions")
+        self.file_list = []
+        for module in modules:
+            self.output_path = self._get_output_path(module)
+            self.type = module
+            self._load_params()
+
+    def _get_output_path(self, module: str, create: bool = True):
+        output_dirname = module
+        if module in ("match_enzyme", "post_alignment"):
+            output_dirname = "match_enzyme_result"
+        output_path = self._base_path.joinpath(output_dirname)
+        if create:
+            output_path.mkdir(exist_ok=True)
+
+        return output_path
+
     def _get_files_in_input_path(self):
         if self.input_path.is_dir():
             filetype = self._file_ext_dict[self.type]["input"]
-            pattern = f"**/*.{filetype}"
-            file_list = list(self.input_path.glob(pattern))
+            file_list = list(self.input_path.glob(f"**/*.{filetype}"))
+            for suffix in COMPRESSION_SUFFIXES.values():
+                file_list.extend(self.input_path.glob(f"**/*.{filetype}{suffix}"))
         elif self.input_path.is_file():
             file_list = [self.input_path]
+        if self.shard is not None:
+            # The shard of a genome is the same in the output folder of each module
+            file_count = len(file_list)
+            file_list = [file for file in file_list if in_shard(file, self.shard)]
+            self.logger.info(f"Shard {self.shard[0]}/{self.shard[1]}: "
+                             f"{len(file_list)} of {file_count} file(s)")
 
         return file_list
 
@@ -90,23 +200,178 @@ class Configuration():
         Each module may have its own extra parameters. These parameters will be
         loaded from `config.toml` if not specified.
         """
+        if self.type == "prodigal":
+            self.prodigal_shards = self._get_prodigal_shards()
+            # Only the genomes at least this large (FASTA file size) are sharded
+            self.prodigal_shard_min_size = parse_memory(
+                str(self.default.get("prodigal", {}).get("shard_min_size", "10M")))
+            self.training_cache = None
+            self.taxa_digest = None
+            prodigal_config = self.default.get("prodigal", {})
+            if prodigal_config.get("training_cache", False):
+                cache_dir = prodigal_config.get("training_cache_dir") \
+                    or self._base_path.joinpath(".cache", "prodigal_training")
+                taxa_path = prodigal_config.get("taxa")
+                if taxa_path:
+                    # Sharing the training files of a taxon changes the genes
+                    self.taxa_digest = file_digest(taxa_path)
+                self.training_cache = TrainingCache(
+                    Path(cache_dir).expanduser(),
+                    self._base_path.joinpath(".cache", "prodigal_training_stats"),
+                    taxa=load_taxa(taxa_path))
         if self.type == "blast":
-            self.database = self.args.database
-            if self.database is None:
+            database_path = self.args.database
+            if database_path is None:
                 database_path = self.default["database"]["path"]
             self.database = Path(database_path)
             self._check_blast_database(self.database)
-        elif self.type == "best_blast":
+            self.database_digest = file_digest(self.database)
+            if self.blast_outfmt == "xml":
+                self.blast_options = ["--outfmt", "5", "--xml-blord-format"]
+            else:
+                self.blast_options = DIAMOND_TABULAR_OPTIONS
+            self.blast_options = [*self.blast_options, *self._get_blast_filter_options()]
+            # Options that only affect speed and memory, not the alignments
+            self.blast_tuning_options = self.resources.diamond_options()
+            self.blast_batch_size = self.args.batch_size
+            if self.blast_batch_size is None:
+                self.blast_batch_size = self.default.get("blast", {}).get("batch_size", 1)
+        if self.type in ("best_blast", "post_alignment"):
             self.criteria = self.args.criteria
             if self.criteria is None:
                 self.criteria = self.default["criteria"]["column"]
             self.filter = self.args.filter
             if self.filter is None:
                 self.filter = self.default["criteria"]["filter"]
-        elif self.type == "match_enzyme":
+            self.top_n = getattr(self.args, "top_n", None)
+            if self.top_n is None:
+                self.top_n = self.default["criteria"].get("top_n", 1)
+            self.tie_breaker = getattr(self.args, "tie_breaker", None)
+            if self.tie_breaker is None:
+                self.tie_breaker = self.default["criteria"].get("tie_breaker") or None
+        if self.type in ("match_enzyme", "post_alignment"):
             self.model = self.args.model
             if self.model is None:
                 self.model = self.default["match_enzyme"]["model"]
+        if self.type in ("match_enzyme", "post_alignment", "result_summary"):
+            pathway_path = getattr(self.args, "pathway", None)
+            if pathway_path is None:
+                pathway_path = self.default.get("match_enzyme", {}).get("pathway")
+            # Validate and compile the pathway once before starting the workers
+            self.pathway = load_pathway(pathway_path)
+            self.pathway_digest = "builtin"
+            if self.pathway.source is not None:
+                self.pathway_digest = file_digest(self.pathway.source)
+        if self.type == "post_alignment":
+            # The intermediate csv files are only kept for debugging
+            self.keep_intermediate = getattr(self.args, "debug", False)
+            if self.keep_intermediate:
+                self._get_output_path("parse_blast")
+                self._get_output_path("best_blast")
+
+    def get_stage_params(self, module: str) -> dict:
+        """Collect the parameters that affect the output of a module.
+
+        These parameters are part of the cache key of the module outputs, so
+        changing any of them makes the previous outputs stale.
+
+        Args:
+            module: The name of the module.
+
+        Returns:
+            A dictionary of the parameters.
+        """
+        if module == "prodigal" and self.taxa_digest is not None:
+            return {"taxa": self.taxa_digest}
+        elif module == "blast":
+            return {"database": self.database_digest,
+                    "options": self.blast_options}
+        elif module == "best_blast":
+            return {"criteria": self.criteria, "filter": self.filter,
+                    "top_n": self.top_n, "tie_breaker": self.tie_breaker}
+        elif module == "match_enzyme":
+            return {"model": self.model, "pathway": self.pathway_digest}
+        elif module == "post_alignment":
+            return {"best_blast": self.get_stage_params("best_blast"),
+                    "match_enzyme": self.get_stage_params("match_enzyme")}
+        return {}
+
+    def _get_blast_filter_options(self):
+        """Get the diamond options for the best_blast filters that can be pushed down.
+
+        The options are part of `blast_options`, so they are in the cache key
+        of the diamond outputs.
+        """
+        if not self.default.get("blast", {}).get("filter_pushdown", True):
+            return []
+        criteria = getattr(self.args, "criteria", None)
+        if criteria is None:
+            criteria = self.default["criteria"]["column"]
+        filter = getattr(self.args, "filter", None)
+        if filter is None:
+            filter = self.default["criteria"]["filter"]
+        options = diamond_filter_options(criteria, filter)
+        if options:
+            self.logger.info(f"Filters applied by diamond: {' '.join(options)}")
+
+        return options
+
+    def _get_scheduler(self):
+        """Determine the scheduler of the pipeline, `stage` or `stream`."""
+        scheduler = getattr(self.args, "scheduler", None)
+        if scheduler is None:
+            scheduler = self.default.get("pipeline", {}).get("scheduler", "stream")
+        if scheduler not in ("stage", "stream"):
+            raise ValueError(f"Unknown scheduler: {scheduler}")
+
+        return scheduler
+
+    def _get_prodigal_shards(self):
+        shards = getattr(self.args, "prodigal_shards", None)
+        if shards is None:
+            shards = self.default.get("prodigal", {}).get("shards", 1)
+
+        return shards
+
+    def _get_blast_outfmt(self):
+        """Determine the diamond output format, `xml` or `tabular`.
+
+        The tabular output is smaller and faster to parse. XML is kept for
+        compatibility with the outputs of earlier runs.
+        """
+        outfmt = getattr(self.args, "outfmt", None)
+        if outfmt is None:
+            outfmt = self.default.get("blast", {}).get("outfmt", "xml")
+        if outfmt not in ("xml", "tabular"):
+            raise ValueError(f"Unknown diamond output format: {outfmt}")
+
+        return outfmt
+
+    def _get_compression(self):
+        """Determine the compression of the intermediate files, `gzip`, `zstd` or `None`.
+
+        The compressed files take less disk space and are faster to move on
+        network filesystems, but cost some CPU time.
+        """
+        compression = getattr(self.args, "compression", None)
+        if compression is None:
+            compression = self.default.get("pipeline", {}).get("compression") or None
+        check_compression(compression)
+
+        return compression
+
+    def _get_intermediate_format(self):
+        """Determine the format of the hit tables, `csv`, `parquet` or `feather`.
+
+        The columnar formats keep a fixed schema and are faster to read back,
+        but need pyarrow. csv is kept as the default.
+        """
+        format = getattr(self.args, "intermediate_format", None)
+        if format is None:
+            format = self.default.get("pipeline", {}).get("intermediate_format", "csv")
+        check_table_format(format)
+
+        return format
 
     def _get_base_path(self):
         """Determine the base output path.
@@ -123,20 +388,26 @@ class Configuration():
 
         return base_path
 
-    def create_savepath(self, filename):
+    def create_savepath(self, filename, module: Optional[str] = None):
         """Create the path for saving a file.
 
         The created path will be the output path appended by the given filename.
 
         Args:
             filename: A string of filename.
+            module: The module producing the file. If not given, the module
+                set by the last `check_io` call is used.
 
         Returns:
             A Path object for the file to save at.
         """
-        filetype = self._file_ext_dict[self.type]["output"]
-        basename_no_extension = Path(filename).stem
-        savename_new_extension = self.output_path.joinpath(f"{basename_no_extension}.{filetype}")
+        if module is None:
+            module, output_path = self.type, self.output_path
+        else:
+            output_path = self._get_output_path(module, create=False)
+        filetype = self._file_ext_dict[module]["output"]
+        basename_no_extension = strip_compression(filename).stem
+        savename_new_extension = output_path.joinpath(f"{basename_no_extension}.{filetype}")
 
         return savename_new_extension
 
@@ -148,12 +419,26 @@ class Configuration():
             module: The module name.
         """
         if isinstance(module, str):
-            to_be_removed = self._base_path.joinpath(module)
-            rmtree(to_be_removed)
-        elif isinstance(module, list):
-            for single_module in module:
-                to_be_removed = self._base_path.joinpath(single_module)
-                rmtree(to_be_removed)
+            module = [module]
+        for single_module in module:
+            to_be_removed = self._base_path.joinpath(single_module)
+            # Skipped modules (e.g. fused into post_alignment) have no outputs
+            rmtree(to_be_removed, ignore_errors=True)
+            # The keys of the removed outputs are no longer needed
+            rmtree(self.cache.cache_dir.joinpath(single_module), ignore_errors=True)
+
+    def write_profile(self) -> Path:
+        """Write the profile report of the run and remove the job records.
+
+        Returns:
+            The path of the report.
+        """
+        report_path = self._base_path.joinpath("profile.json")
+        self.profiler.report(report_path)
+        self.profiler.reset()
+        self.logger.info(f"Save the profile report to {report_path}")
+
+        return report_path
 
     def _config_logging(self):
         now = datetime.now().strftime("%y%m%d%H%M%S")
@@ -175,20 +460,30 @@ class Configuration():
 
         return logger
 
-    def _get_thread_num(self):
-        """Determine the maximum number of processes to be created.
+    def _plan_resources(self):
+        """Fit the number of processes and diamond options to the machine.
 
-        If the user doesn't specify the number of threads by --cpus argument,
-        all available threads in the computer will be used.
+        The CPU and memory budget is given by --cpus and --memory, or detected
+        from the CPU affinity, the cgroup quota and the available memory, so
+        that the pipeline does not oversubscribe a shared node. The budget is
+        split between the modules when they run at the same time (streaming
+        scheduler and service).
         """
-        max_thread_num = int(os.cpu_count())
+        max_thread_num = detect_cpus()
         thread_num = self.args.cpus
-        if thread_num > max_thread_num or thread_num == 0:
-            thread_num = max_thread_num // 2
-
-        self.logger.info(f"Create {thread_num} process(es).")
-
-        return thread_num
+        if thread_num > max_thread_num or thread_num <= 0:
+            thread_num = max_thread_num
+        memory = getattr(self.args, "memory", None)
+        memory = detect_memory() if memory is None else parse_memory(memory)
+
+        streaming = self.type == "serve" or (self.type == "main" and self.scheduler == "stream")
+        resources = ResourcePlan(thread_num, memory, streaming=streaming,
+                                 prodigal_shards=self._get_prodigal_shards())
+        for message in resources.describe():
+            self.logger.info(message)
+        self.logger.info(f"Create {resources.python_workers} process(es).")
+
+        return resources
 
     def _load_default_config(self):
         config_path = "./config.toml"
@@ -1,41 +1,259 @@
+import hashlib
+import multiprocessing as mp
 import re
+import shutil
+import subprocess
+import tempfile
 from collections import OrderedDict
+from functools import partial
 from pathlib import Path
+from typing import List, Optional, Tuple, Union
 
 from Bio import SeqIO
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+
+from biopathpred.modules.compression import open_text, strip_compression
 
 REGEX_FRAGMENT = re.compile(r"\(Fragment\)")
 REGEX_ENZYME_FILENAME = re.compile(r"^(\d+_\w+).fasta")
+# The length of the sequence lines, as written by `SeqIO.write`
+LINE_WIDTH = 60
+
+
+def build_blast_db(input_dir, output_filepath, filter_fragment=False,
+                   workers: int = 1, deduplicate: bool = True,
+                   drop_conflicts: bool = False) -> dict:
+    """Collect the enzyme FASTA files into one database FASTA file.
+
+    The files are named `[int]_[str].fasta` (optionally compressed), one per
+    enzyme, and are collected in the order of their enzyme number. Each file
+    is parsed by a worker into a labelled part, and the parts are streamed
+    into the output in order, so that the output is the same for any number
+    of workers.
+
+    A sequence is identified by the hash of its residues. A sequence that was
+    already collected for the same enzyme is dropped. A sequence that was
+    already collected for another enzyme is a conflict: it is reported in
+    `[output].conflicts.tsv`, and kept unless `drop_conflicts` is set.
 
+    Args:
+        input_dir: The folder of the enzyme FASTA files.
+        output_filepath: The path of the database FASTA file.
+        filter_fragment: Whether to drop the sequences marked "(Fragment)".
+        workers: The number of processes parsing the files.
+        deduplicate: Whether to drop the duplicate sequences of an enzyme.
+        drop_conflicts: Whether to drop the sequences already collected for
+            another enzyme.
 
-def build_blast_db(input_dir, output_filepath, filter_fragment=False):
+    Returns:
+        A dictionary of the numbers of collected entries, duplicates and
+        conflicts.
+    """
     print("Collect fasta files with pattern: [int]_[str].fasta")
-    input_path = Path(input_dir)
     output_path = Path(output_filepath)
     if output_path.is_file():
         output_path.unlink()
-    total_entries = 0
+    enzyme_files = collect_enzyme_files(input_dir)
+    selector = RecordSelector(deduplicate, drop_conflicts)
+
+    with tempfile.TemporaryDirectory(dir=output_path.parent) as part_dir:
+        part_paths = [Path(part_dir, f"{i}.fasta") for i in range(len(enzyme_files))]
+        items = [(filepath, enzyme_id_name, part_path) for (filepath, enzyme_id_name), part_path
+                 in zip(enzyme_files, part_paths)]
+        prepare = partial(prepare_enzyme_file, filter_fragment=filter_fragment)
+        pool = mp.Pool(workers) if workers > 1 else None
+        try:
+            # `imap` keeps the order of the files while the next ones are parsed
+            prepared = pool.imap(prepare, items) if pool is not None else map(prepare, items)
+            with open(output_path, "w") as output:
+                for (filepath, enzyme_id_name, part_path), records in zip(items, prepared):
+                    entries = _write_part(part_path, records, enzyme_id_name, output,
+                                          selector)
+                    part_path.unlink()
+                    print(f"{filepath.name}: {entries} entries")
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    selector.report(output_path)
+
+    return selector.stats
+
 
-    for filepath in input_path.glob("*.fasta"):
-        search_result = REGEX_ENZYME_FILENAME.search(filepath.name)
-        if search_result is None:
+def collect_enzyme_files(input_dir) -> List[Tuple[Path, str]]:
+    """Collect the enzyme FASTA files in the order of their enzyme number.
+
+    Returns:
+        A list of tuples of the file path and its enzyme id and name
+        (e.g. `1_iam1`).
+    """
+    enzyme_files = []
+    for filepath in Path(input_dir).iterdir():
+        filename = strip_compression(filepath).name
+        search_result = REGEX_ENZYME_FILENAME.search(filename)
+        if search_result is None or not filename.endswith(".fasta"):
             continue
-        enzyme_id_name = search_result.group(1)
+        enzyme_files.append((filepath, search_result.group(1)))
+
+    return sorted(enzyme_files,
+                  key=lambda item: (int(item[1].split("_", 1)[0]), item[1], item[0].name))
+
+
+def prepare_enzyme_file(item: Tuple[Path, str, Path],
+                        filter_fragment: bool = False) -> List[Tuple[str, bytes]]:
+    """Label the sequences of an enzyme file and write them to a part file.
 
-        fasta_records = parse_fasta(filepath)
+    Args:
+        item: A tuple of the enzyme FASTA file, its enzyme id and name, and
+            the path of the part file.
+        filter_fragment: Whether to drop the sequences marked "(Fragment)".
+
+    Returns:
+        The ID and the digest of each sequence written to the part file, in
+        order.
+    """
+    filepath, enzyme_id_name, part_path = item
+    label = enzyme_id_name.replace("_", "~~~", 1)
+    records = []
+    with open_text(filepath, "r") as f, open(part_path, "w") as output:
+        for description, sequence in SimpleFastaParser(f):
+            if filter_fragment and REGEX_FRAGMENT.search(description) is not None:
+                continue
+            write_record(output, label_description(description, label), sequence)
+            records.append((description.split(maxsplit=1)[0], sequence_digest(sequence)))
+
+    return records
 
-        if filter_fragment:
-            fasta_records = filter_partial_sequence(fasta_records)
 
-        fasta_records = add_id(fasta_records, enzyme_id_name)
+class RecordSelector():
+    """Select the records of a database, dropping duplicate sequences.
 
-        with open(output_filepath, "a") as f:
-            SeqIO.write(fasta_records, f, "fasta")
+    The records are given in the order of the database. A sequence that was
+    already selected for the same enzyme is a duplicate, and one that was
+    already selected for another enzyme is a conflict.
+
+    Attributes:
+        deduplicate: Whether to drop the duplicate sequences of an enzyme.
+        drop_conflicts: Whether to drop the conflicting sequences.
+        seen: A dictionary of the sequence digests and the ID and enzyme of
+            their first record.
+        stats: A dictionary of the numbers of selected entries, duplicates
+            and conflicts.
+        conflicts: A list of the conflicting records, with their first record
+            and whether they were kept.
+    """
+    def __init__(self, deduplicate: bool = True, drop_conflicts: bool = False):
+        self.deduplicate = deduplicate
+        self.drop_conflicts = drop_conflicts
+        self.seen = {}
+        self.stats = {"entries": 0, "duplicates": 0, "conflicts": 0}
+        self.conflicts = []
 
-        print(f"{filepath.name}: {len(fasta_records)} entries")
-        total_entries += len(fasta_records)
+    def keep(self, record_id: str, digest: bytes, enzyme_id_name: str) -> bool:
+        """Check whether a record is selected, and count it."""
+        first = self.seen.get(digest)
+        keep = True
+        if first is None:
+            self.seen[digest] = (record_id, enzyme_id_name)
+        elif first[1] == enzyme_id_name:
+            keep = not self.deduplicate
+            self.stats["duplicates"] += not keep
+        else:
+            keep = not self.drop_conflicts
+            self.stats["conflicts"] += 1
+            self.conflicts.append((record_id, enzyme_id_name, *first, "yes" if keep else "no"))
+        self.stats["entries"] += keep
 
-    print(f"Collect {total_entries} entries")
+        return keep
+
+    def report(self, output_path: Union[str, Path]):
+        """Print the numbers of records and save the conflicts next to the database.
+
+        The conflicts are saved in `[output].conflicts.tsv`, which is removed
+        if there is none.
+        """
+        output_path = Path(output_path)
+        conflict_path = output_path.with_name(f"{output_path.name}.conflicts.tsv")
+        conflict_path.unlink(missing_ok=True)
+        if self.conflicts:
+            with open(conflict_path, "w") as f:
+                f.write("id\tenzyme\tfirst_id\tfirst_enzyme\tkept\n")
+                for conflict in self.conflicts:
+                    f.write("\t".join(conflict) + "\n")
+            print(f"{self.stats['conflicts']} sequence(s) also belong to another enzyme: "
+                  f"see {conflict_path}")
+        if self.stats["duplicates"]:
+            print(f"Drop {self.stats['duplicates']} duplicate sequence(s)")
+        print(f"Collect {self.stats['entries']} entries")
+
+
+def _write_part(part_path: Path, records: List[Tuple[str, bytes]],
+                enzyme_id_name: str, output, selector: RecordSelector) -> int:
+    """Copy the selected records of a part file to the output."""
+    keeps = [selector.keep(record_id, digest, enzyme_id_name) for record_id, digest in records]
+    entries = sum(keeps)
+    with open(part_path, "r") as f:
+        if entries == len(keeps):
+            shutil.copyfileobj(f, output, 1024 * 1024)
+        else:
+            keeps, keep = iter(keeps), False
+            for line in f:
+                if line.startswith(">"):
+                    keep = next(keeps)
+                if keep:
+                    output.write(line)
+
+    return entries
+
+
+def sequence_digest(sequence: str) -> bytes:
+    """Hash the residues of a sequence, ignoring their case."""
+    return hashlib.blake2b(sequence.upper().encode(), digest_size=16).digest()
+
+
+def write_record(output, description: str, sequence: str):
+    """Write a FASTA record like `SeqIO.write`, with lines of 60 residues."""
+    output.write(f">{description}\n")
+    for start in range(0, len(sequence), LINE_WIDTH):
+        output.write(f"{sequence[start:start + LINE_WIDTH]}\n")
+
+
+def label_description(description: str, label: str) -> str:
+    """Insert the enzyme label after the ID of a FASTA description (see `add_id`)."""
+    record_id, _, record_info = description.partition(" ")
+    return f"{record_id} {label}~~~{record_info}"
+
+
+def make_diamond_db(fasta_path: Union[str, Path], diamond_path: str = "diamond",
+                    db_path: Optional[Union[str, Path]] = None,
+                    threads: int = 1) -> Path:
+    """Run `diamond makedb` on a database FASTA file.
+
+    Args:
+        fasta_path: The database FASTA file.
+        diamond_path: The diamond executable.
+        db_path: The path of the diamond database, the FASTA path with the
+            extension `.dmnd` by default.
+        threads: The number of diamond threads.
+
+    Returns:
+        The path of the diamond database.
+
+    Raises:
+        FileNotFoundError: If the diamond executable is not found.
+        subprocess.CalledProcessError: If diamond fails.
+    """
+    fasta_path = Path(fasta_path)
+    db_path = Path(db_path) if db_path is not None else fasta_path.with_suffix(".dmnd")
+    if shutil.which(diamond_path) is None:
+        raise FileNotFoundError(f"diamond is not found at {diamond_path}: "
+                                "set diamond_path in config.toml or use --no-makedb")
+    command = [diamond_path, "makedb", "--in", str(fasta_path),
+               "-d", str(db_path.with_suffix("")), "-p", str(threads)]
+    print(" ".join(command))
+    subprocess.run(command, check=True)
+
+    return db_path
 
 
 def parse_fasta(filepath):
@@ -57,22 +275,16 @@ def add_id(fasta_records: OrderedDict, enzyme_id_name: str) -> str:
     """
     enzyme_id_name = enzyme_id_name.replace("_", "~~~", 1)
     for record in fasta_records:
-        record_id, record_info = record.description.split(" ", 1)
-        record.description = f"{record_id} {enzyme_id_name}~~~{record_info}"
+        record.description = label_description(record.description, enzyme_id_name)
 
     return fasta_records
 
 
-def filter_database(fasta_records, database_records: dict):
-    fasta_dict = {record.id: record for record in fasta_records}
-    database_dict = {record.id: record for record in database_records}
-    records_to_remove = []
-    for target_id in fasta_dict.keys():
-        if target_id in database_dict:
-            records_to_remove.append(database_dict[target_id])
-
-    for record in records_to_remove:
-        database_records.remove(record)
+def filter_database(fasta_records, database_records: list):
+    """Remove the database records with the ID of any of the given records, in place."""
+    ids_to_remove = {record.id for record in fasta_records}
+    database_records[:] = [record for record in database_records
+                           if record.id not in ids_to_remove]
 
     return database_records
 
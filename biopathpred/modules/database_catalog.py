@@ -0,0 +1,243 @@
+import json
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+
+from biopathpred.modules.compression import open_text, strip_compression
+from biopathpred.modules.database_building import (REGEX_ENZYME_FILENAME,
+                                                   REGEX_FRAGMENT,
+                                                   RecordSelector,
+                                                   label_description,
+                                                   sequence_digest,
+                                                   write_record)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS enzymes (
+    enzyme_id TEXT PRIMARY KEY,
+    number INTEGER NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS records (
+    enzyme_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    record_id TEXT NOT NULL,
+    accession TEXT NOT NULL,
+    description TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    sequence TEXT NOT NULL,
+    PRIMARY KEY (enzyme_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_accession ON records (accession);
+CREATE INDEX IF NOT EXISTS records_digest ON records (digest);
+"""
+# The records inserted at a time when an enzyme file is added
+INSERT_BATCH = 10000
+
+
+def record_accession(record_id: str) -> str:
+    """Get the accession of a record ID, e.g. `P0A3V3` for `sp|P0A3V3|TR2M_RHIRD`."""
+    fields = record_id.split("|")
+    if len(fields) >= 2 and fields[0] in ("sp", "tr"):
+        return fields[1]
+    return record_id
+
+
+class DatabaseCatalog():
+    """A persistent catalog of the enzyme sequences of a database.
+
+    The catalog is an SQLite file with one table of the enzyme families and
+    one of their records, indexed by accession and by the digest of their
+    sequence (see `sequence_digest`), so that the enzymes of an accession or
+    of a sequence are found without scanning the database.
+
+    An enzyme family is added, replaced or removed on its own, and the
+    database FASTA file is exported in the order of the enzyme numbers, as
+    `build_blast_db` writes it from the same files. The catalog version is
+    increased by every change, so an export that is up to date is skipped.
+
+    Attributes:
+        path: The path of the SQLite file.
+        connection: The connection to the SQLite file.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.connection = sqlite3.connect(self.path)
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('catalog_id', ?)",
+                                    (uuid.uuid4().hex,))
+            self.connection.execute("INSERT OR IGNORE INTO meta VALUES ('version', '0')")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _meta(self, key: str) -> str:
+        return self.connection.execute("SELECT value FROM meta WHERE key = ?",
+                                       (key,)).fetchone()[0]
+
+    @property
+    def version(self) -> int:
+        return int(self._meta("version"))
+
+    def _bump_version(self):
+        self.connection.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 "
+                                "WHERE key = 'version'")
+
+    def add_enzyme(self, filepath: Union[str, Path],
+                   enzyme_id_name: Optional[str] = None,
+                   replace: bool = False) -> int:
+        """Add the sequences of an enzyme family from a FASTA file.
+
+        Args:
+            filepath: The enzyme FASTA file, optionally compressed.
+            enzyme_id_name: The enzyme id and name (e.g. `1_iam1`), taken from
+                the file name `[int]_[str].fasta` if not given.
+            replace: Whether to replace the family if it is in the catalog.
+
+        Returns:
+            The number of added records.
+
+        Raises:
+            ValueError: If the enzyme id and name are not valid, or the family
+                is already in the catalog and `replace` is not set.
+        """
+        filepath = Path(filepath)
+        if enzyme_id_name is None:
+            search_result = REGEX_ENZYME_FILENAME.search(strip_compression(filepath).name)
+            if search_result is None:
+                raise ValueError(f"{filepath.name} does not match the pattern "
+                                 "[int]_[str].fasta")
+            enzyme_id_name = search_result.group(1)
+        number = enzyme_id_name.split("_", 1)[0]
+        if not number.isdigit() or "_" not in enzyme_id_name:
+            raise ValueError(f"Invalid enzyme id and name: {enzyme_id_name}")
+
+        count = 0
+        with self.connection:
+            if self._has_enzyme(enzyme_id_name):
+                if not replace:
+                    raise ValueError(f"Enzyme {enzyme_id_name} is already in the catalog")
+                self._delete_enzyme(enzyme_id_name)
+            self.connection.execute("INSERT INTO enzymes VALUES (?, ?, ?)",
+                                    (enzyme_id_name, int(number), str(filepath)))
+            rows = []
+            with open_text(filepath, "r") as f:
+                for description, sequence in SimpleFastaParser(f):
+                    record_id = description.split(maxsplit=1)[0] if description else ""
+                    rows.append((enzyme_id_name, count, record_id, record_accession(record_id),
+                                 description, sequence_digest(sequence), sequence))
+                    count += 1
+                    if len(rows) == INSERT_BATCH:
+                        self._insert_records(rows)
+                        rows = []
+            self._insert_records(rows)
+            self._bump_version()
+
+        return count
+
+    def _insert_records(self, rows: list):
+        self.connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _has_enzyme(self, enzyme_id_name: str) -> bool:
+        return self.connection.execute("SELECT 1 FROM enzymes WHERE enzyme_id = ?",
+                                       (enzyme_id_name,)).fetchone() is not None
+
+    def _delete_enzyme(self, enzyme_id_name: str):
+        self.connection.execute("DELETE FROM records WHERE enzyme_id = ?", (enzyme_id_name,))
+        self.connection.execute("DELETE FROM enzymes WHERE enzyme_id = ?", (enzyme_id_name,))
+
+    def remove_enzyme(self, enzyme_id_name: str):
+        """Remove an enzyme family and its sequences.
+
+        Raises:
+            ValueError: If the family is not in the catalog.
+        """
+        with self.connection:
+            if not self._has_enzyme(enzyme_id_name):
+                raise ValueError(f"Enzyme {enzyme_id_name} is not in the catalog")
+            self._delete_enzyme(enzyme_id_name)
+            self._bump_version()
+
+    def enzymes(self) -> List[Tuple[str, int]]:
+        """List the enzyme families and their numbers of records, in database order."""
+        return self.connection.execute(
+            "SELECT enzymes.enzyme_id, COUNT(records.position) FROM enzymes "
+            "LEFT JOIN records ON records.enzyme_id = enzymes.enzyme_id "
+            "GROUP BY enzymes.enzyme_id ORDER BY enzymes.number, enzymes.enzyme_id").fetchall()
+
+    def find_accession(self, accession: str) -> List[Tuple[str, str]]:
+        """Find the records of an accession.
+
+        Returns:
+            A list of tuples of the enzyme id and name and the record ID.
+        """
+        return self.connection.execute(
+            "SELECT enzyme_id, record_id FROM records WHERE accession = ? "
+            "ORDER BY enzyme_id, position", (accession,)).fetchall()
+
+    def find_sequence(self, sequence: str) -> List[str]:
+        """Find the enzyme families of a sequence."""
+        rows = self.connection.execute(
+            "SELECT DISTINCT enzyme_id FROM records WHERE digest = ? ORDER BY enzyme_id",
+            (sequence_digest(sequence),)).fetchall()
+        return [row[0] for row in rows]
+
+    def export_fasta(self, output_filepath: Union[str, Path],
+                     filter_fragment: bool = False, deduplicate: bool = True,
+                     drop_conflicts: bool = False) -> Optional[dict]:
+        """Export the database FASTA file, unless it is up to date.
+
+        The file is the same as `build_blast_db` writes from the enzyme files
+        of the catalog with the same options. The catalog version and the
+        options of the export are saved in `[output].catalog`.
+
+        Args:
+            output_filepath: The path of the database FASTA file.
+            filter_fragment: Whether to drop the sequences marked "(Fragment)".
+            deduplicate: Whether to drop the duplicate sequences of an enzyme.
+            drop_conflicts: Whether to drop the sequences already collected for
+                another enzyme.
+
+        Returns:
+            The numbers of exported entries, duplicates and conflicts (see
+            `RecordSelector`), or `None` if the file was up to date.
+        """
+        output_path = Path(output_filepath)
+        key_path = output_path.with_name(f"{output_path.name}.catalog")
+        key = {"catalog_id": self._meta("catalog_id"), "version": self.version,
+               "filter_fragment": filter_fragment, "deduplicate": deduplicate,
+               "drop_conflicts": drop_conflicts}
+        if output_path.is_file() and key_path.is_file() and \
+                json.loads(key_path.read_text()) == key:
+            print(f"{output_path} is up to date with the catalog")
+            return None
+
+        key_path.unlink(missing_ok=True)
+        selector = RecordSelector(deduplicate, drop_conflicts)
+        temporary_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex}")
+        with open(temporary_path, "w") as output:
+            for enzyme_id_name, _ in self.enzymes():
+                label = enzyme_id_name.replace("_", "~~~", 1)
+                rows = self.connection.execute(
+                    "SELECT record_id, description, digest, sequence FROM records "
+                    "WHERE enzyme_id = ? ORDER BY position", (enzyme_id_name,))
+                for record_id, description, digest, sequence in rows:
+                    if filter_fragment and REGEX_FRAGMENT.search(description) is not None:
+                        continue
+                    if selector.keep(record_id, digest, enzyme_id_name):
+                        write_record(output, label_description(description, label), sequence)
+        temporary_path.replace(output_path)
+        key_path.write_text(json.dumps(key))
+        selector.report(output_path)
+
+        return selector.stats
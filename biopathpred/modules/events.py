@@ -0,0 +1,207 @@
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from biopathpred.modules.compression import strip_compression
+
+# The time window of the rolling throughput of a stage
+THROUGHPUT_WINDOW = 60.0
+# Marks the end of the events for the writer thread
+_CLOSE = object()
+
+
+def genome_name(item) -> str:
+    """Get the genome name of a file, e.g. `GCF_000001` for `GCF_000001.fna.gz`."""
+    return strip_compression(Path(str(item))).stem
+
+
+class StageProgress():
+    """Track the progress of a stage and its rolling throughput.
+
+    Attributes:
+        total: The number of genomes of the stage.
+        done: The number of finished genomes.
+        start: The start time of the stage.
+        finished: The finish times of the genomes in the last
+            `THROUGHPUT_WINDOW` seconds.
+    """
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.start = time.time()
+        self.finished = deque()
+
+    def update(self, count: int, now: float) -> dict:
+        """Count finished genomes.
+
+        Returns:
+            A dictionary of the finished and total genomes, the rolling
+            throughput in genomes per second and the estimated time left.
+        """
+        self.done += count
+        self.finished.extend([now] * count)
+        while self.finished and self.finished[0] < now - THROUGHPUT_WINDOW:
+            self.finished.popleft()
+        window = min(now - self.start, THROUGHPUT_WINDOW)
+        throughput = len(self.finished) / window if window > 0 else None
+        eta = (self.total - self.done) / throughput if throughput else None
+        return {"done": self.done, "total": self.total,
+                "throughput_per_s": None if throughput is None else round(throughput, 3),
+                "eta_s": None if eta is None else round(eta, 1)}
+
+
+class EventStream():
+    """Write the progress of a run as a stream of JSON lines.
+
+    Each event is a JSON object with its `time` (seconds since the epoch) and
+    its `event` name:
+
+    - `run_started` and `run_finished` (or `run_failed`) for the whole run;
+    - `stage_started` and `stage_finished` for each module;
+    - `genome_finished` for each genome done by a module, with the duration
+      of its job, whether it has an output, the progress and rolling
+      throughput of the module, its estimated time left and the genomes
+      queued for each module;
+    - `error` for a job that raised.
+
+    The events are put in a queue without blocking and written by a thread,
+    so the jobs are not slowed down by the target. The events are emitted by
+    the main process: the workers only time their jobs (see `timed_call`). A
+    copy of the stream sent to a worker process emits nothing.
+
+    Attributes:
+        target: A file path, or `unix:[path]` for a Unix domain socket that a
+            monitor listens on.
+    """
+    def __init__(self, target: str):
+        self.target = target
+        if target.startswith("unix:"):
+            self._connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._connection.connect(target[len("unix:"):])
+            self._write = self._connection.sendall
+        else:
+            self._connection = open(target, "ab", buffering=0)
+            self._write = self._connection.write
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._progress: Dict[str, StageProgress] = {}
+        self._writer = threading.Thread(target=self._write_events, daemon=True)
+        self._writer.start()
+
+    def __getstate__(self):
+        return {"target": self.target}
+
+    def __setstate__(self, state):
+        self.target = state["target"]
+        self._queue = None
+
+    def _write_events(self):
+        while True:
+            event = self._queue.get()
+            if event is _CLOSE:
+                break
+            try:
+                self._write(json.dumps(event).encode() + b"\n")
+            except OSError as err:
+                # A monitor that goes away does not stop the run
+                logging.getLogger("pipeline_log").warning(f"Stop writing events: {err}")
+                break
+
+    def emit(self, event: str, **fields):
+        if self._queue is not None:
+            self._queue.put({"time": round(time.time(), 3), "event": event, **fields})
+
+    def stage_started(self, stage: str, total: int):
+        with self._lock:
+            self._progress[stage] = StageProgress(total)
+        self.emit("stage_started", stage=stage, total=total)
+
+    def genomes_finished(self, stage: str, items: list, outputs: list, seconds: float,
+                         queued: Optional[Dict[str, int]] = None):
+        """Emit the `genome_finished` events of a job.
+
+        Args:
+            stage: The module of the job.
+            items: The input files of the job.
+            outputs: The outputs of the files, `None` for no output.
+            seconds: The duration of the job.
+            queued: The number of genomes waiting for each module.
+        """
+        now = time.time()
+        with self._lock:
+            progress = self._progress[stage].update(len(items), now)
+        for item, output in zip(items, outputs):
+            self.emit("genome_finished", stage=stage, genome=genome_name(item),
+                      duration_s=round(seconds, 3), output=output is not None,
+                      batch=len(items), queued=queued, **progress)
+
+    def job_failed(self, stage: str, items: Iterable, error: BaseException):
+        self.emit("error", stage=stage, genomes=[genome_name(item) for item in items],
+                  error=f"{type(error).__name__}: {error}")
+
+    def stage_finished(self, stage: str, done: Optional[int] = None):
+        """Emit the `stage_finished` event of a stage.
+
+        Args:
+            stage: The module.
+            done: The number of genomes done by the module, if they were not
+                reported one by one.
+        """
+        with self._lock:
+            progress = self._progress.pop(stage, None)
+        fields = {}
+        if progress is not None:
+            if done is not None:
+                progress.done = done
+            elapsed = time.time() - progress.start
+            fields = {"done": progress.done, "elapsed_s": round(elapsed, 3),
+                      "throughput_per_s": round(progress.done / elapsed, 3) if elapsed > 0 else None}
+        self.emit("stage_finished", stage=stage, **fields)
+
+    @contextmanager
+    def run(self, run_type: str):
+        """Emit the start and the end of the run in the `with` block, then close the stream."""
+        start = time.perf_counter()
+        self.emit("run_started", type=run_type)
+        try:
+            yield self
+        except BaseException as err:
+            self.emit("run_failed", error=f"{type(err).__name__}: {err}",
+                      elapsed_s=round(time.perf_counter() - start, 3))
+            raise
+        else:
+            self.emit("run_finished", elapsed_s=round(time.perf_counter() - start, 3))
+        finally:
+            self.close()
+
+    def close(self):
+        """Write the remaining events and close the target."""
+        if self._queue is None:
+            return
+        self._queue.put(_CLOSE)
+        self._writer.join()
+        self._queue = None
+        self._connection.close()
+
+
+def timed_call(func, item):
+    """Call a job and time it, for the `genome_finished` events.
+
+    Returns:
+        A tuple of the output of the job and its duration in seconds.
+    """
+    start = time.perf_counter()
+    output = func(item)
+    return output, time.perf_counter() - start
+
+
+def job_items(item) -> List:
+    """Get the files of a job on one file or on a batch of files."""
+    return list(item) if isinstance(item, (list, tuple)) else [item]
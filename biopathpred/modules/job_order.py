@@ -0,0 +1,62 @@
+import heapq
+from pathlib import Path
+from typing import List, Sequence, Union
+
+from biopathpred.modules.compression import get_compression
+
+# The approximate ratio of the uncompressed to the compressed size of a FASTA file
+COMPRESSION_RATIO = {"gzip": 4, "zstd": 4}
+# The jobs sent to a worker at a time by the Python modules, whose jobs are
+# short enough for the dispatch overhead to matter
+MAX_CHUNKSIZE = 10
+
+
+def job_cost(item: Union[str, Path, Sequence[Union[str, Path]]]) -> int:
+    """Estimate the cost of a job on a file or a batch of files.
+
+    The cost is the uncompressed size of the inputs, which follows the number
+    of bases that prodigal reads and of residues that diamond aligns better
+    than the number of contigs or proteins, and needs no read of the files.
+    """
+    files = item if isinstance(item, (list, tuple)) else [item]
+    return sum(Path(file).stat().st_size * COMPRESSION_RATIO.get(get_compression(file), 1)
+               for file in files)
+
+
+def longest_first(costs: Sequence[float], chunksize: int = 1) -> List[int]:
+    """Order the jobs by decreasing cost, keeping the input order of equal costs.
+
+    With chunks of several jobs, the sorted jobs are dealt to the chunks in
+    turn, so that the largest jobs are not grouped in the first chunk and the
+    chunks still come largest first.
+
+    Returns:
+        The indices of the jobs in the new order.
+    """
+    order = sorted(range(len(costs)), key=lambda i: -costs[i])
+    chunk_num = -(-len(order) // chunksize)
+
+    return [i for chunk in range(chunk_num) for i in order[chunk::chunk_num]]
+
+
+def adaptive_chunksize(job_num: int, workers: int) -> int:
+    """Choose the number of jobs sent to a worker at a time.
+
+    The chunks are small enough for each worker to get about four of them,
+    so that the last chunks are short, and at most `MAX_CHUNKSIZE`.
+    """
+    return max(1, min(MAX_CHUNKSIZE, job_num // (4 * workers)))
+
+
+def estimate_makespan(costs: Sequence[float], workers: int, chunksize: int) -> float:
+    """Estimate the cost of the slowest worker when the jobs run in order.
+
+    Each worker takes the next chunk of jobs when it is idle, as with
+    `Pool.imap`.
+    """
+    finish_times = [0.0] * workers
+    for start in range(0, len(costs), chunksize):
+        finish = heapq.heappop(finish_times) + sum(costs[start:start + chunksize])
+        heapq.heappush(finish_times, finish)
+
+    return max(finish_times, default=0.0)
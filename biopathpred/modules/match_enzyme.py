@@ -4,38 +4,56 @@ from typing import Dict, List, Literal, Union
 import numpy as np
 import pandas as pd
 
+from biopathpred.modules.batch_scoring import match_enzyme_results
 from biopathpred.modules.existence_score_model import existence_score_model
-from biopathpred.modules.pathway import (Enzyme, PathwayNode, enzyme_dict,
-                                         pathway_dict)
+from biopathpred.modules.pathway import (CompiledPathway, Enzyme, PathwayNode,
+                                         compiled_pathway)
+from biopathpred.modules.table_io import read_table
 
 
 def start_match_enzyme(filepath: Union[str, Path],
                        output_filepath: Union[str, Path],
                        model: Literal["prob", "binary"],
                        verbose: bool,
-                       enzyme_dict: Dict[int, Union[None, Enzyme]] = enzyme_dict,
-                       pathway_dict: Dict[int, PathwayNode] = pathway_dict):
+                       pathway: CompiledPathway = compiled_pathway):
     """
     Perform pathway mapping from the predicted enzymes and output scores
     evaluated from the model.
 
     Args:
-        filepath: The path to a .csv file containing best alignment results.
+        filepath: The path to a .csv (or .parquet, .feather) file containing
+            best alignment results.
         output_filepath: The path for saving output.
         model: The `prob` or `binary` model in calculating pathway node score.
         verbose: Whether to print the result to screen.
-        enzyme_dict: The dictionary that contains the enzyme info of the pathway.
-        pathway_dict: The dictionary that contains the compound info of the pathway.
+        pathway: The compiled pathway. It is not modified, so this function
+            can run in several threads at once.
+    """
+    data = read_table(filepath, columns=["enzyme_id", "identity"])
+    match_best_blast(data, output_filepath, model, verbose, pathway)
+
+
+def match_best_blast(data: pd.DataFrame,
+                     output_filepath: Union[str, Path],
+                     model: Literal["prob", "binary"],
+                     verbose: bool,
+                     pathway: CompiledPathway = compiled_pathway):
     """
-    match_enzyme_existence(filepath, enzyme_dict)
-    # The starting compound is given the key: 1
-    traverse_enzyme_reaction(pathway_dict[1], enzyme_dict, pathway_dict)
-    result = []
-    result.extend(get_pathway_result(pathway_dict, model, verbose))
-    result.extend(get_enzyme_result(enzyme_dict, model, verbose))
+    Perform pathway mapping from best alignment results already in memory.
+
+    Args:
+        data: The best alignment results with "enzyme_id" and "identity"
+            columns.
+        output_filepath: See parameter `output_filepath` in `start_match_enzyme`.
+        model: See parameter `model` in `start_match_enzyme`.
+        verbose: See parameter `verbose` in `start_match_enzyme`.
+        pathway: See parameter `pathway` in `start_match_enzyme`.
+    """
+    result = match_enzyme_results([data], model, pathway)[0]
+    if verbose:
+        print("".join(result), end="")
     with open(output_filepath, "w") as f:
         f.writelines(result)
-    reset_enzyme_and_pathway(enzyme_dict, pathway_dict)
 
 
 def match_enzyme_existence(filepath: Union[str, Path],
@@ -44,9 +62,14 @@ def match_enzyme_existence(filepath: Union[str, Path],
     Calculate scores (0 - 1) from the given model and count the number of
     enzymes that have the same function. The results are stored in Enzyme objects.
 
+    This function and `traverse_enzyme_reaction` modify the PathwayNode and
+    Enzyme objects in place, which must then be reset with
+    `reset_enzyme_and_pathway`. `start_match_enzyme` uses the equivalent
+    `CompiledPathway` instead.
+
     Args:
         filepath: See parameter `filepath` in `start_match_enzyme`.
-        enzyme_dict: See parameter `enzyme_dict` in `start_match_enzyme`.
+        enzyme_dict: The dictionary that contains the enzyme info of the pathway.
 
     Steps
     -----
@@ -62,7 +85,7 @@ def match_enzyme_existence(filepath: Union[str, Path],
     """
     data = pd.read_csv(filepath, usecols=["enzyme_id", "identity"])
     data = data[data["enzyme_id"] != "-"]
-    data["existence_score"] = existence_score_model(data["identity"])
+    data = data.assign(existence_score=existence_score_model(data["identity"]))
     data = data.groupby("enzyme_id").agg(
         count=("enzyme_id", "count"),
         prob=("existence_score", lambda x: 1 - np.nanprod(1 - x))).reset_index()
@@ -84,8 +107,8 @@ def traverse_enzyme_reaction(compound: PathwayNode,
 
     Args:
         compound: A PathwayNode object containing compound info.
-        enzyme_dict: See parameter `enzyme_dict` in `start_match_enzyme`.
-        pathway_dict: See parameter `pathway_dict` in `start_match_enzyme`.
+        enzyme_dict: The dictionary that contains the enzyme info of the pathway.
+        pathway_dict: The dictionary that contains the compound info of the pathway.
     """
     for enzyme in compound.next_enzyme:
         try:
@@ -107,7 +130,7 @@ def get_pathway_result(pathway_dict: Dict[int, PathwayNode],
     The result can be printed to screen by setting `verbose` to true.
 
     Args:
-        pathway_dict: See parameter `pathway_dict` in `start_match_enzyme`.
+        pathway_dict: The dictionary that contains the compound info of the pathway.
         model: See parameter `model` in `start_match_enzyme`.
         verbose: See parameter `verbose` in `start_match_enzyme`.
 
@@ -145,7 +168,7 @@ def get_enzyme_result(enzyme_dict: Dict[int, Union[None, Enzyme]],
     The result can be printed to screen by setting `verbose` to true.
 
     Args:
-        enzyme_dict: See parameter `enzyme_dict` in `start_match_enzyme`.
+        enzyme_dict: The dictionary that contains the enzyme info of the pathway.
         model: See parameter `model` in `start_match_enzyme`.
         verbose: See parameter `verbose` in `start_match_enzyme`.
 
@@ -0,0 +1,96 @@
+import csv
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from biopathpred.modules.parse_blastp_xml import (HEADER, REGEX_ELEMENTS,
+                                                  REGEX_GENE, REGEX_PRODUCT,
+                                                  open_output)
+
+# diamond --outfmt 6 fields, only those written to the csv
+TABULAR_FIELDS = ["qtitle", "stitle", "bitscore", "evalue", "nident", "length",
+                  "gaps", "qlen"]
+TABULAR_DTYPES = {"qtitle": str, "stitle": str, "bitscore": np.float64,
+                  "evalue": np.float64, "nident": np.int64, "length": np.int64,
+                  "gaps": np.int64, "qlen": np.int64}
+DIAMOND_TABULAR_OPTIONS = ["--outfmt", "6", *TABULAR_FIELDS]
+
+
+def parse_subject_titles(stitle: pd.Series) -> pd.DataFrame:
+    """Extract the alignment info from the database FASTA headers.
+
+    This is the vectorized version of `parse_alignment_title` in
+    `parse_blastp_xml`, working on the subject titles without the
+    "gnl|BL_ORD_ID|" prefix of the XML output.
+
+    Args:
+        stitle: The subject titles reported by diamond.
+
+    Returns:
+        A data frame with the alignment_id, enzyme_id, enzyme_code, product,
+        organism, existence and gene columns.
+    """
+    alignment_id_full = stitle.str.split(" ", n=1).str[0]
+    description = stitle.str.split(" ", n=1).str[1]
+    alignment_id = alignment_id_full.str.split("|").str[1]
+    elements = description.str.extract(REGEX_ELEMENTS)
+    labels, organism, existence = elements[0], elements[1], elements[2]
+
+    product = labels.str.extract(REGEX_PRODUCT)
+    unlabeled = product[0].isna()
+    if labels[unlabeled].str.contains("~~~", regex=False).any():
+        raise ValueError("Invalid database product format")
+    product.loc[unlabeled, 2] = labels[unlabeled]
+    product = product.fillna("")
+    product[2] = product[2].str.replace(",", " ", regex=False)
+
+    gene = description.str.extract(REGEX_GENE)[0]
+    gene = gene.str.replace(",", " ", regex=False).fillna("-")
+
+    return pd.DataFrame({"alignment_id": alignment_id,
+                         "enzyme_id": product[0],
+                         "enzyme_code": product[1],
+                         "product": product[2],
+                         "organism": organism,
+                         "existence": existence,
+                         "gene": gene})
+
+
+def parse_blast_tabular(filepath, output_filepath):
+    """
+    Parse the results from diamond blastp that are in tabular format
+    (see `DIAMOND_TABULAR_OPTIONS`) and write the same csv as `parse_blast`.
+    """
+    try:
+        data = pd.read_csv(filepath, sep="\t", header=None, names=TABULAR_FIELDS,
+                           dtype=TABULAR_DTYPES, quoting=csv.QUOTE_NONE,
+                           float_precision="round_trip")
+    except FileNotFoundError:
+        print(f"Cannot find '{filepath}'")
+        sys.exit()
+    except pd.errors.EmptyDataError:
+        print(f"Find empty tabular file: {os.path.basename(filepath)}")
+        data = pd.DataFrame(columns=TABULAR_FIELDS)
+
+    with open_output(output_filepath) as output:
+        output.write(HEADER)
+        if len(data) > 0:
+            output.write("\n".join(format_rows(data)) + "\n")
+
+
+def format_rows(data: pd.DataFrame) -> pd.Series:
+    """Format the diamond tabular records as csv lines with `HEADER` columns."""
+    # the output from prodigal is delimited by '#'
+    query = data["qtitle"].str.split("#", n=4, expand=True)
+    alignment = parse_subject_titles(data["stitle"])
+    identity = (data["nident"] / data["length"] * 100).round(3)
+    coverage = (100 * (data["length"] - data["gaps"]) / data["qlen"]).round(3)
+
+    columns = [query[0].str.strip(" "), query[1].str.strip(" "),
+               query[2].str.strip(" "), *(alignment[column] for column in alignment),
+               data["bitscore"].astype(str), data["evalue"].astype(str),
+               identity.astype(str), coverage.astype(str)]
+
+    return columns[0].str.cat(columns[1:], sep=",")
@@ -1,8 +1,12 @@
 import re
 import sys
 import os
+from contextlib import contextmanager
+from xml.etree.ElementTree import ParseError, iterparse
 from Bio.Blast import NCBIXML
 
+from biopathpred.modules.compression import is_empty, open_text
+
 
 # csv column title
 HEADER_ELEMENT = ["id", "start", "end", "alignment_id", "enzyme_id",
@@ -78,13 +82,26 @@ def parse_alignment_title(alignment_title):
     return alignment_info
 
 
+@contextmanager
+def open_output(output_filepath):
+    """Open the csv output for writing, or use it as is if it is a text stream.
+
+    The output is compressed if its extension is that of a compression.
+    """
+    if hasattr(output_filepath, "write"):
+        yield output_filepath
+    else:
+        with open_text(output_filepath, "w") as output:
+            yield output
+
+
 def parse_blast(filepath, output_filepath):
     """
     Parse the results from diamond blastp that are in xml formats
     """
     try:
-        with open(filepath, "r") as result, \
-                open(output_filepath, "w") as output:
+        with open_text(filepath, "r") as result, \
+                open_output(output_filepath) as output:
             blast_records = NCBIXML.parse(result)
             output.write(HEADER)
             try:
@@ -111,3 +128,92 @@ def parse_blast(filepath, output_filepath):
     except FileNotFoundError:
         print(f"Cannot find '{filepath}'")
         sys.exit()
+
+
+def iter_blast_rows(filepath):
+    """
+    Parse the results from diamond blastp that are in xml formats with
+    `iterparse`, keeping only the fields written to the csv.
+
+    Each <Iteration> is cleared once its rows are built, so the memory stays
+    flat whatever the size of the file. The rows are the same as those of
+    `parse_blast`.
+
+    Args:
+        filepath: The path to the xml file, which may be compressed.
+
+    Yields:
+        A list of csv lines (with `HEADER` columns) for each query.
+    """
+    with open_text(filepath, "rb") as f:
+        yield from _iter_blast_rows(f)
+
+
+def _iter_blast_rows(file):
+    # <BlastOutput_query-*> are only used by old files without <Iteration_query-*>
+    header_query, header_query_len = "", None
+    iterations = None
+    query, query_len = "", None
+    title = alignment_info = ""
+    hsp = {}
+    rows = []
+    for event, elem in iterparse(file, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "BlastOutput_iterations":
+                iterations = elem
+            elif tag == "Iteration":
+                query, query_len = header_query, header_query_len
+                rows = []
+            continue
+
+        if tag.startswith("Hsp_"):
+            hsp[tag] = elem.text
+        elif tag == "Hsp":
+            id, start, end, strand, _ = [element.strip(" ") for element in query.split("#")]
+            align_len = int(hsp["Hsp_align-len"])
+            # `score` is the bit score and `evalue` the expect value
+            score = float(hsp["Hsp_bit-score"])
+            evalue = float(hsp["Hsp_evalue"])
+            identity = round(int(hsp["Hsp_identity"]) / align_len * 100, 3)
+            coverage = round(100 * (align_len - int(hsp.get("Hsp_gaps", 0))) / query_len, 3)
+            rows.append(f"{id},{start},{end},{alignment_info},{score},{evalue},"
+                        f"{identity},{coverage}\n")
+            hsp = {}
+        elif tag == "Hit_id":
+            title = elem.text + " "
+        elif tag == "Hit_def":
+            alignment_info = parse_alignment_title(title + elem.text)
+        elif tag == "Iteration_query-def":
+            query = elem.text or ""
+        elif tag == "Iteration_query-len":
+            query_len = int(elem.text)
+        elif tag == "Iteration":
+            yield rows
+            elem.clear()
+            if iterations is not None:
+                iterations.clear()
+        elif tag == "BlastOutput_query-def":
+            header_query = elem.text or ""
+        elif tag == "BlastOutput_query-len":
+            header_query_len = int(elem.text)
+
+
+def parse_blast_iterparse(filepath, output_filepath):
+    """
+    Parse the results from diamond blastp that are in xml formats, in constant
+    memory (see `iter_blast_rows`). The output is the same as `parse_blast`.
+    """
+    try:
+        with open_output(output_filepath) as output:
+            output.write(HEADER)
+            try:
+                for rows in iter_blast_rows(filepath):
+                    output.writelines(rows)
+            except ParseError:
+                if not is_empty(filepath):
+                    raise
+                print(f"Find empty XML file: {os.path.basename(filepath)}")
+    except FileNotFoundError:
+        print(f"Cannot find '{filepath}'")
+        sys.exit()
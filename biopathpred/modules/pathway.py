@@ -1,4 +1,10 @@
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple, Union
+
 import numpy as np
+import tomli
 
 
 class PathwayNode():
@@ -85,3 +91,279 @@ enzyme_dict = {0: None,
                10: Enzyme("iaox_ian_1", 7, 8),
                11: Enzyme("ian_1_iaa", 8, 3),
                12: Enzyme("ian_1_iam_1", 8, 2)}
+
+
+class CompiledPathway():
+    """A read-only array representation of a pathway for scoring genomes.
+
+    The pathway is compiled once from the PathwayNode and Enzyme objects. All
+    arrays are read-only and `evaluate` keeps its state in arrays allocated
+    for each call, so one instance can be shared by threads, async tasks or a
+    long-running service without copies or resets.
+
+    Attributes:
+        compound_ids: The compound ids, in the order of the compound columns.
+        compound_names: The compound names.
+        default_visited: Whether each compound is a starting compound.
+        indegree: The number of reactions producing each compound.
+        enzyme_ids: The enzyme ids, in the order of the enzyme columns.
+        enzyme_names: The enzyme names.
+        edge_enzyme: The enzyme column of each reaction.
+        edge_reactant: The compound column of the reactant of each reaction.
+        edge_product: The compound column of the product of each reaction.
+        edge_completes: Whether each reaction is the last one into its
+            product, after which the product's existence probability is
+            computed.
+        topological_order: The compound columns in the order their existence
+            probabilities are computed, starting compounds first.
+        target: The name of the compound used as the prediction score.
+        source: The definition file the pathway was loaded from, if any.
+    """
+    def __init__(self, pathway_dict: Dict[int, PathwayNode],
+                 enzyme_dict: Dict[int, Optional[Enzyme]],
+                 start_ids: Sequence[int] = (1,),
+                 target_id: Optional[int] = None,
+                 source: Optional[Path] = None):
+        """Compile the pathway.
+
+        The reactions are stored in the order of a depth-first traversal from
+        the starting compounds, in which a compound is expanded once all the
+        reactions producing it have run. The order only depends on the graph,
+        so evaluating the reactions in this order gives the same result for
+        every genome as traversing the PathwayNode objects.
+
+        Args:
+            pathway_dict: The dictionary that contains the compound info of the pathway.
+            enzyme_dict: The dictionary that contains the enzyme info of the pathway.
+            start_ids: The ids of the compounds the traversal starts from.
+            target_id: The id of the compound used as the prediction score.
+            source: The definition file the pathway was loaded from, if any.
+        """
+        compound_ids = list(pathway_dict)
+        enzyme_ids = [key for key, enzyme in enzyme_dict.items() if enzyme is not None]
+        compound_column = {compound_id: i for i, compound_id in enumerate(compound_ids)}
+        enzyme_column = {enzyme_id: i for i, enzyme_id in enumerate(enzyme_ids)}
+
+        edges = []
+        topological_order = [compound_column[start_id] for start_id in start_ids]
+        reacted = {compound_id: 0 for compound_id in pathway_dict}
+
+        def traverse(compound_id):
+            for enzyme_id in pathway_dict[compound_id].next_enzyme:
+                try:
+                    product_id = enzyme_dict[enzyme_id].product
+                    reactant_id = enzyme_dict[enzyme_id].reactant
+                    product = pathway_dict[product_id]
+                    pathway_dict[reactant_id]
+                except (KeyError, AttributeError):
+                    continue
+                reacted[product_id] += 1
+                completes = reacted[product_id] == product.indegree
+                edges.append((enzyme_column[enzyme_id], compound_column[reactant_id],
+                              compound_column[product_id], completes))
+                if completes:
+                    topological_order.append(compound_column[product_id])
+                    traverse(product_id)
+
+        for start_id in start_ids:
+            traverse(start_id)
+
+        self.compound_ids = _read_only(compound_ids)
+        self.compound_names = tuple(pathway_dict[key].name for key in compound_ids)
+        self.default_visited = _read_only(
+            [bool(pathway_dict[key].default_visited) for key in compound_ids])
+        self.indegree = _read_only([pathway_dict[key].indegree for key in compound_ids])
+        self.enzyme_ids = _read_only(enzyme_ids)
+        self.enzyme_names = tuple(enzyme_dict[key].name for key in enzyme_ids)
+        edge_columns = list(zip(*edges)) or [[], [], [], []]
+        self.edge_enzyme = _read_only(edge_columns[0], dtype=np.int64)
+        self.edge_reactant = _read_only(edge_columns[1], dtype=np.int64)
+        self.edge_product = _read_only(edge_columns[2], dtype=np.int64)
+        self.edge_completes = _read_only(edge_columns[3], dtype=bool)
+        self.topological_order = _read_only(topological_order, dtype=np.int64)
+        self.target = None if target_id is None else pathway_dict[target_id].name
+        self.source = source
+
+    def __reduce__(self):
+        # A pathway loaded from a file (or the built-in one) is sent to worker
+        # processes as a reference, and each worker compiles it once and
+        # reuses it from the cache.
+        if self.source is not None or self is compiled_pathway:
+            return load_pathway, (self.source,)
+        return super().__reduce__()
+
+    def evaluate(self, enzyme_prob: np.ndarray,
+                 enzyme_exist: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Determine the compound scores of one or many genomes.
+
+        Each reaction updates the compounds of every genome at once, following
+        `PathwayNode.react`.
+
+        Args:
+            enzyme_prob: The enzyme probabilities, of shape (enzymes,) or
+                (genomes, enzymes).
+            enzyme_exist: The enzyme existence flags, of the same shape.
+
+        Returns:
+            A tuple of the compound existence probabilities (`prob` model)
+            and visited flags (`binary` model), of shape (compounds,) or
+            (genomes, compounds).
+        """
+        enzyme_prob = np.asarray(enzyme_prob, dtype=np.float64)
+        enzyme_exist = np.asarray(enzyme_exist, dtype=bool)
+        shape = enzyme_prob.shape[:-1] + (len(self.compound_ids),)
+        # The state of this call
+        visited = np.broadcast_to(self.default_visited, shape).copy()
+        existence_prob = visited.astype(np.float64)
+        # The running product of (1 - enzyme prob * reactant prob) of each compound
+        complement = np.ones(shape)
+
+        for enzyme, reactant, product, completes in zip(
+                self.edge_enzyme, self.edge_reactant, self.edge_product,
+                self.edge_completes):
+            visited[..., product] |= enzyme_exist[..., enzyme] & visited[..., reactant]
+            complement[..., product] *= \
+                1 - enzyme_prob[..., enzyme] * existence_prob[..., reactant]
+            if completes:
+                existence_prob[..., product] = 1 - complement[..., product]
+
+        return existence_prob, visited
+
+
+def _read_only(values, dtype=None) -> np.ndarray:
+    array = np.array(values, dtype=dtype)
+    array.flags.writeable = False
+    return array
+
+
+def load_pathway_definition(path: Union[str, Path]):
+    """Load and validate a pathway definition file.
+
+    The file (TOML, or JSON if the suffix is .json) lists the compounds, the
+    enzymes with their reactant and product compounds, the starting
+    compounds and the target compound, e.g.
+
+        start = [1]
+        target = 3
+
+        [[compound]]
+        id = 1
+        name = "trp"
+
+        [[enzyme]]
+        id = 1
+        name = "trp_iam_1"
+        reactant = 1
+        product = 2
+
+    The enzyme ids are those labeled in the database (`enzyme_id`). The
+    reactions of each compound follow the order of the enzymes in the file.
+
+    Args:
+        path: The path to the definition file.
+
+    Returns:
+        A tuple of the pathway_dict, the enzyme_dict, the starting compound
+        ids and the target compound id.
+
+    Raises:
+        ValueError: If the definition is incomplete, refers to unknown
+            compounds, or contains a cycle.
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        if path.suffix == ".json":
+            definition = json.load(f)
+        else:
+            definition = tomli.load(f)
+
+    def check(condition, message):
+        if not condition:
+            raise ValueError(f"Invalid pathway definition {path}: {message}")
+
+    compounds = definition.get("compound", [])
+    enzymes = definition.get("enzyme", [])
+    check(compounds, "no compound")
+    for item in compounds:
+        check(isinstance(item.get("id"), int) and isinstance(item.get("name"), str),
+              f"compound needs an integer id and a name: {item}")
+    for item in enzymes:
+        check(isinstance(item.get("id"), int) and isinstance(item.get("name"), str)
+              and isinstance(item.get("reactant"), int)
+              and isinstance(item.get("product"), int),
+              f"enzyme needs an integer id, a name, a reactant and a product: {item}")
+    compound_ids = [item["id"] for item in compounds]
+    enzyme_ids = [item["id"] for item in enzymes]
+    check(len(set(compound_ids)) == len(compound_ids), "duplicate compound id")
+    check(len(set(enzyme_ids)) == len(enzyme_ids), "duplicate enzyme id")
+    for item in enzymes:
+        for key in ("reactant", "product"):
+            check(item[key] in compound_ids,
+                  f"enzyme {item['id']} has an unknown {key} {item[key]}")
+    start_ids = definition.get("start", [])
+    check(start_ids, "no starting compound")
+    for start_id in start_ids:
+        check(start_id in compound_ids, f"unknown starting compound {start_id}")
+    target_id = definition.get("target")
+    check(target_id in compound_ids, f"unknown target compound {target_id}")
+
+    # Remove the compounds without incoming reactions until none is left;
+    # the remaining compounds form a cycle.
+    indegree = {compound_id: 0 for compound_id in compound_ids}
+    for item in enzymes:
+        indegree[item["product"]] += 1
+    queue = [compound_id for compound_id, degree in indegree.items() if degree == 0]
+    while queue:
+        compound_id = queue.pop()
+        for item in enzymes:
+            if item["reactant"] == compound_id:
+                indegree[item["product"]] -= 1
+                if indegree[item["product"]] == 0:
+                    queue.append(item["product"])
+    cycle = [compound_id for compound_id, degree in indegree.items() if degree > 0]
+    check(not cycle, f"cycle through compounds {cycle}")
+
+    pathway_dict = {}
+    for item in compounds:
+        pre_enzyme = [enzyme["id"] for enzyme in enzymes
+                      if enzyme["product"] == item["id"]]
+        next_enzyme = [enzyme["id"] for enzyme in enzymes
+                       if enzyme["reactant"] == item["id"]]
+        pathway_dict[item["id"]] = PathwayNode(item["name"], pre_enzyme or [None],
+                                               next_enzyme or [None],
+                                               item["id"] in start_ids)
+    enzyme_dict = {item["id"]: Enzyme(item["name"], item["reactant"], item["product"])
+                   for item in enzymes}
+
+    return pathway_dict, enzyme_dict, start_ids, target_id
+
+
+def load_pathway(path: Optional[Union[str, Path]] = None) -> CompiledPathway:
+    """Load a pathway definition file and compile it.
+
+    The compiled pathway is cached for each file (and modification time), so
+    it is only built once in each process.
+
+    Args:
+        path: The path to the definition file. The built-in IAA pathway is
+            returned if not given.
+
+    Returns:
+        A CompiledPathway object.
+    """
+    if path is None:
+        return compiled_pathway
+    path = Path(path).resolve()
+
+    return _load_pathway(path, path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=None)
+def _load_pathway(path: Path, mtime: int) -> CompiledPathway:
+    pathway_dict, enzyme_dict, start_ids, target_id = load_pathway_definition(path)
+
+    return CompiledPathway(pathway_dict, enzyme_dict, start_ids, target_id, source=path)
+
+
+# The built-in IAA pathway, also defined in pathway/definition/IAA_pathway.toml
+compiled_pathway = CompiledPathway(pathway_dict, enzyme_dict, target_id=3)
@@ -0,0 +1,63 @@
+import io
+from pathlib import Path
+from typing import Callable, List, Literal, Optional, Union
+
+import pandas as pd
+
+from biopathpred.modules.best_blast import select_best_blast
+from biopathpred.modules.compression import open_text, strip_compression
+from biopathpred.modules.match_enzyme import match_best_blast
+from biopathpred.modules.pathway import CompiledPathway, compiled_pathway
+from biopathpred.modules.table_io import write_table
+
+
+def start_post_alignment(filepath: Union[str, Path],
+                         output_filepath: Union[str, Path],
+                         parser: Callable,
+                         criteria: str,
+                         filter: List[str],
+                         model: Literal["prob", "binary"],
+                         verbose: bool,
+                         pathway: CompiledPathway = compiled_pathway,
+                         parse_blast_filepath: Optional[Union[str, Path]] = None,
+                         best_blast_filepath: Optional[Union[str, Path]] = None,
+                         top_n: int = 1,
+                         tie_breaker: Optional[str] = None):
+    """
+    Run parse_blast, best_blast and match_enzyme on a diamond output in
+    memory, without writing and reading back the intermediate csv files.
+
+    The result is the same as running the three modules one after another.
+
+    Args:
+        filepath: The path to a diamond output file.
+        output_filepath: The path for saving the match_enzyme result.
+        parser: The parse_blast function for the diamond output format. It
+            writes the csv to a text stream.
+        criteria: See parameter `criteria` in `find_best_blast`.
+        filter: See parameter `filter` in `find_best_blast`.
+        model: See parameter `model` in `start_match_enzyme`.
+        verbose: See parameter `verbose` in `start_match_enzyme`.
+        pathway: See parameter `pathway` in `start_match_enzyme`.
+        parse_blast_filepath: If given, also save the parse_blast table here,
+            in the format given by its extension.
+        best_blast_filepath: If given, also save the best_blast table here.
+        top_n: See parameter `top_n` in `find_best_blast`.
+        tie_breaker: See parameter `tie_breaker` in `find_best_blast`.
+    """
+    buffer = io.StringIO()
+    parser(filepath, buffer)
+    buffer.seek(0)
+    data = pd.read_csv(buffer)
+    if parse_blast_filepath is not None:
+        if strip_compression(parse_blast_filepath).suffix == ".csv":
+            with open_text(parse_blast_filepath, "w") as f:
+                f.write(buffer.getvalue())
+        else:
+            write_table(data, parse_blast_filepath)
+
+    data = select_best_blast(data, criteria, filter, top_n, tie_breaker)
+    if best_blast_filepath is not None:
+        write_table(data, best_blast_filepath)
+
+    match_best_blast(data, output_filepath, model, verbose, pathway)
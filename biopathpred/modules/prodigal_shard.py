@@ -0,0 +1,104 @@
+import re
+from pathlib import Path
+from typing import List, Union
+
+from biopathpred.modules.compression import open_text
+
+# The ID field of a prodigal header: "ID={contig_index}_{gene_index}"
+REGEX_GENE_ID = re.compile(r"(;?ID=)(\d+)(_\d+)")
+
+
+def count_contig_bases(fna_path: Union[str, Path]) -> List[int]:
+    """Count the bases of each contig of a FASTA file."""
+    lengths = []
+    with open_text(fna_path, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                lengths.append(0)
+            elif lengths:
+                lengths[-1] += len(line.strip())
+
+    return lengths
+
+
+def plan_shards(lengths: List[int], shard_num: int) -> List[int]:
+    """Group consecutive contigs into shards of about the same number of bases.
+
+    Args:
+        lengths: The number of bases of each contig.
+        shard_num: The largest number of shards.
+
+    Returns:
+        A list of the number of contigs in each shard, without empty shards.
+    """
+    remaining = sum(lengths)
+    counts, shard_bases, target = [], 0, 0
+    for length in lengths:
+        if not counts or (shard_bases >= target and len(counts) < shard_num):
+            # Share the remaining bases among the remaining shards
+            target = remaining / (shard_num - len(counts))
+            counts.append(0)
+            shard_bases = 0
+        counts[-1] += 1
+        shard_bases += length
+        remaining -= length
+
+    return counts
+
+
+def write_shards(fna_path: Union[str, Path],
+                 shard_paths: List[Union[str, Path]],
+                 contig_counts: List[int]):
+    """Split the contigs of a FASTA file into shards, keeping their order.
+
+    Args:
+        fna_path: The genome FASTA file.
+        shard_paths: The paths for saving each shard.
+        contig_counts: The number of contigs in each shard (see `plan_shards`).
+    """
+    shards = iter(zip(shard_paths, contig_counts))
+    output, remaining = None, 0
+    try:
+        with open_text(fna_path, "r") as f:
+            for line in f:
+                if line.startswith(">"):
+                    if remaining == 0:
+                        if output is not None:
+                            output.close()
+                        shard_path, remaining = next(shards)
+                        output = open(shard_path, "w")
+                    remaining -= 1
+                if output is not None:
+                    output.write(line)
+    finally:
+        if output is not None:
+            output.close()
+
+
+def merge_shards(faa_paths: List[Union[str, Path]],
+                 contig_counts: List[int],
+                 output_path: Union[str, Path]):
+    """Merge the prodigal outputs of the shards of a genome into one file.
+
+    The proteins keep their names and coordinates, which only depend on
+    their contig. The contig index in the ID field of each header is shifted
+    by the contigs of the previous shards, so the file is the same as the
+    output of prodigal on the whole genome with the same training file.
+
+    Args:
+        faa_paths: The prodigal output (-a) of each shard, in order.
+        contig_counts: The number of contigs in each shard.
+        output_path: The path for saving the merged proteins, which is
+            compressed if its extension is that of a compression.
+    """
+    offset = 0
+    with open_text(output_path, "w") as output:
+        for faa_path, contig_count in zip(faa_paths, contig_counts):
+            with open(faa_path, "r") as f:
+                for line in f:
+                    if line.startswith(">") and offset:
+                        line = REGEX_GENE_ID.sub(
+                            lambda match: f"{match.group(1)}{int(match.group(2)) + offset}"
+                                          f"{match.group(3)}", line, count=1)
+                    output.write(line)
+            offset += contig_count
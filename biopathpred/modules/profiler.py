@@ -0,0 +1,223 @@
+import contextvars
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from biopathpred.modules.compression import open_text, strip_compression
+from biopathpred.modules.table_io import read_table
+
+# The job profiled in the current thread, to which the child processes are
+# added. Threads started by a job share its record through `copy_context`.
+_current_job = contextvars.ContextVar("current_job", default=None)
+# The number of slowest jobs of each stage listed in the report
+SLOWEST_NUM = 5
+
+
+def read_io(path: str = "/proc/thread-self/io") -> Optional[Dict[str, int]]:
+    """Read the bytes read and written by a thread or process (Linux only).
+
+    The bytes include those read from the page cache and pipes.
+    """
+    try:
+        with open(path, "r") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+    except (OSError, ValueError):
+        return None
+    return {"read_bytes": int(fields["rchar"]), "write_bytes": int(fields["wchar"])}
+
+
+def wait_child(process: subprocess.Popen) -> int:
+    """Wait for a child process, adding its resource usage to the profiled job.
+
+    The CPU time and peak RSS are those of the child and its own children.
+    Their bytes read and written are read before the child is reaped. Linux
+    counts the RSS of the worker when the child is spawned in its peak RSS,
+    so a small child shows at least the size of the worker.
+
+    Returns:
+        The return code of the child.
+    """
+    job = _current_job.get()
+    if job is None or not hasattr(os, "wait4"):
+        return process.wait()
+
+    io = None
+    if hasattr(os, "waitid"):
+        os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+        io = read_io(f"/proc/{process.pid}/io")
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    job["children"].append({"command": Path(str(process.args[0])).name,
+                            "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+                            "peak_rss_kb": usage.ru_maxrss,
+                            **(io or {"read_bytes": None, "write_bytes": None})})
+
+    return process.returncode
+
+
+def count_records(filepath: Union[str, Path]) -> int:
+    """Count the sequences of a FASTA file."""
+    with open_text(filepath, "rb") as f:
+        return sum(line.startswith(b">") for line in f)
+
+
+def count_hits(filepath: Union[str, Path]) -> int:
+    """Count the alignments of a diamond XML or tabular output."""
+    if strip_compression(filepath).suffix != ".xml":
+        with open_text(filepath, "rb") as f:
+            return sum(1 for _ in f)
+    count, tail = 0, b""
+    with open_text(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            # The tail of the previous chunk is kept for the tags split between chunks
+            chunk = tail + chunk
+            count += chunk.count(b"<Hsp>")
+            tail = chunk[-4:]
+    return count
+
+
+def count_rows(filepath: Union[str, Path]) -> int:
+    """Count the rows of a parse_blast or best_blast table."""
+    if strip_compression(filepath).suffix == ".csv":
+        with open_text(filepath, "rb") as f:
+            return max(sum(1 for _ in f) - 1, 0)
+    return len(read_table(filepath, columns=["id"]))
+
+
+def measure_sizes(module: str, inputs: List[Path], outputs: List[Optional[Path]]) -> dict:
+    """Measure the inputs and outputs of a job.
+
+    Returns:
+        A dictionary of the input and output bytes, and the contigs,
+        proteins or hits handled by the module.
+    """
+    inputs = [Path(path) for path in inputs if Path(path).is_file()]
+    outputs = [Path(path) for path in outputs if path is not None and Path(path).is_file()]
+    sizes = {"input_bytes": sum(path.stat().st_size for path in inputs),
+             "output_bytes": sum(path.stat().st_size for path in outputs)}
+    if module == "prodigal":
+        sizes["contigs"] = sum(count_records(path) for path in inputs)
+        sizes["proteins"] = sum(count_records(path) for path in outputs)
+    elif module == "blast":
+        sizes["proteins"] = sum(count_records(path) for path in inputs)
+        sizes["hits"] = sum(count_hits(path) for path in outputs)
+    elif module in ("parse_blast", "post_alignment"):
+        sizes["hits"] = sum(count_hits(path) for path in inputs)
+    elif module in ("best_blast", "match_enzyme"):
+        sizes["hits"] = sum(count_rows(path) for path in inputs)
+
+    return sizes
+
+
+class Profiler():
+    """Record the time and resources of each job of a run.
+
+    For each job of a module, on one genome or a batch of genomes, the wall
+    time, the CPU time of the worker thread, the peak RSS of the worker
+    process (its high-water mark so far) and the bytes read and written by
+    the worker thread are recorded, with the CPU time, peak RSS and bytes of
+    the child processes (prodigal and diamond) and the sizes of the inputs.
+
+    The records are saved as small JSON files under `record_dir`, one per
+    job, so that workers in different processes record them without a lock.
+    `report` aggregates them.
+
+    Attributes:
+        record_dir: The folder that stores the job records.
+    """
+    def __init__(self, record_dir: Union[str, Path]):
+        self.record_dir = Path(record_dir)
+
+    def reset(self):
+        shutil.rmtree(self.record_dir, ignore_errors=True)
+
+    @contextmanager
+    def job(self, module: str, files: List[Union[str, Path]]):
+        """Profile a job run in the `with` block.
+
+        The block may set `record["outputs"]` to the output paths, which are
+        measured with the inputs once the job is done. The job is not
+        recorded if it raises.
+
+        Yields:
+            The record of the job.
+        """
+        record = {"module": module,
+                  "genomes": [strip_compression(file).stem for file in files],
+                  "children": [], "outputs": []}
+        token = _current_job.set(record)
+        io_start = read_io()
+        start, wall_start, cpu_start = time.time(), time.perf_counter(), time.thread_time()
+        try:
+            yield record
+        finally:
+            _current_job.reset(token)
+        record.update(start=start, wall_s=round(time.perf_counter() - wall_start, 3),
+                      cpu_s=round(time.thread_time() - cpu_start, 3),
+                      worker_peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        io_end = read_io()
+        for field in ("read_bytes", "write_bytes"):
+            record[field] = io_end[field] - io_start[field] if io_start and io_end else None
+        record.update(measure_sizes(module, files, record.pop("outputs")))
+
+        self.record_dir.mkdir(parents=True, exist_ok=True)
+        record_path = self.record_dir.joinpath(f"{module}_{uuid.uuid4().hex}.json")
+        record_path.write_text(json.dumps(record))
+
+    def records(self) -> List[dict]:
+        """Load the job records, in the order the jobs started."""
+        records = [json.loads(path.read_text()) for path in self.record_dir.glob("*.json")]
+        return sorted(records, key=lambda record: record["start"])
+
+    def report(self, output_path: Union[str, Path]) -> dict:
+        """Aggregate the job records of each module into a JSON report.
+
+        The throughput of a module is the number of genomes (and hits) over
+        the time from the start of its first job to the end of its last one.
+        The slowest jobs are listed with their ratio to the median wall time.
+
+        Returns:
+            The report.
+        """
+        records = self.records()
+        stages = {}
+        for module in dict.fromkeys(record["module"] for record in records):
+            jobs = [record for record in records if record["module"] == module]
+            span = max(job["start"] + job["wall_s"] for job in jobs) - jobs[0]["start"]
+            children = [child for job in jobs for child in job["children"]]
+            genomes = sum(len(job["genomes"]) for job in jobs)
+            median = statistics.median(job["wall_s"] for job in jobs)
+            stage = {"jobs": len(jobs), "genomes": genomes, "span_s": round(span, 3),
+                     "wall_s": round(sum(job["wall_s"] for job in jobs), 3),
+                     "cpu_s": round(sum(job["cpu_s"] for job in jobs), 3),
+                     "child_cpu_s": round(sum(child["cpu_s"] for child in children), 3),
+                     "worker_peak_rss_kb": max(job["worker_peak_rss_kb"] for job in jobs),
+                     "child_peak_rss_kb": max((child["peak_rss_kb"] for child in children),
+                                              default=None)}
+            for field in ("read_bytes", "write_bytes"):
+                stage[field] = sum(job[field] or 0 for job in jobs)
+                stage[f"child_{field}"] = sum(child[field] or 0 for child in children)
+            for field in ("input_bytes", "output_bytes", "contigs", "proteins", "hits"):
+                if field in jobs[0]:
+                    stage[field] = sum(job[field] for job in jobs)
+            stage["genomes_per_s"] = round(genomes / span, 3) if span > 0 else None
+            if "hits" in stage:
+                stage["hits_per_s"] = round(stage["hits"] / span, 3) if span > 0 else None
+            stage["slowest"] = [
+                {"genomes": job["genomes"], "wall_s": job["wall_s"],
+                 "median_ratio": round(job["wall_s"] / median, 2) if median > 0 else None}
+                for job in sorted(jobs, key=lambda job: job["wall_s"], reverse=True)[:SLOWEST_NUM]]
+            stages[module] = stage
+
+        report = {"stages": stages, "jobs": records}
+        Path(output_path).write_text(json.dumps(report, indent=2))
+
+        return report
@@ -0,0 +1,233 @@
+import math
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+GIB = 1024 ** 3
+
+# Memory of a diamond process estimated from the block size (billions of
+# sequence letters) and the number of index chunks. diamond documents ~6 GB
+# per block size unit with the default 4 index chunks.
+DIAMOND_SETTINGS = [(2.0, 1), (2.0, 4), (1.0, 4), (0.4, 4), (0.4, 8), (0.2, 16)]
+# Use fewer diamond threads than cores: a genome is a small query, and
+# running more jobs keeps the cores busier than more threads per job.
+DIAMOND_MAX_THREADS = 4
+# Rough peak memory of the other per-genome jobs
+PRODIGAL_MEMORY = GIB // 4
+PYTHON_MEMORY = GIB // 2
+# The share of the CPUs of each module when the modules run at the same time
+# (streaming pipeline and service), from their typical share of the run time
+STREAMING_CPU_SHARES = {"prodigal": 0.3, "diamond": 0.5, "python": 0.2}
+
+REGEX_MEMORY = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", re.IGNORECASE)
+
+
+def estimate_diamond_memory(block_size: float, index_chunks: int) -> float:
+    """Estimate the peak memory (bytes) of a diamond blastp process."""
+    return block_size * (2 + 16 / index_chunks) * GIB
+
+
+def parse_memory(memory: str) -> int:
+    """Convert a memory size such as `16G` or `512M` to bytes."""
+    match = REGEX_MEMORY.search(memory)
+    if match is None:
+        raise ValueError(f"Invalid memory size: {memory}")
+    value, unit = match.groups()
+    exponent = " KMGT".index(unit.upper() or " ")
+
+    return int(float(value) * 1024 ** exponent)
+
+
+def _cgroup_paths(controller: str, filename: str) -> List[Path]:
+    """List the candidate paths of a cgroup file, for cgroup v1 and v2."""
+    paths = []
+    try:
+        with open("/proc/self/cgroup", "r") as f:
+            for line in f:
+                _, controllers, group = line.strip().split(":", 2)
+                group = group.lstrip("/")
+                if controllers == "":
+                    paths.append(CGROUP_ROOT / group / filename)
+                elif controller in controllers.split(","):
+                    paths.append(CGROUP_ROOT / controllers / group / filename)
+    except (OSError, ValueError):
+        pass
+    paths.extend([CGROUP_ROOT / filename, CGROUP_ROOT / controller / filename])
+
+    return paths
+
+
+def _read_first(paths: List[Path]) -> Optional[str]:
+    for path in paths:
+        try:
+            return path.read_text().strip()
+        except OSError:
+            continue
+    return None
+
+
+def detect_cpus() -> int:
+    """Detect the number of CPUs this process may use.
+
+    The number is the smallest of the CPUs in the affinity mask and the cgroup
+    CPU quota, so that a container or a batch job limited to a few cores is not
+    oversubscribed.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" or "200000 100000"
+    quota = _read_first(_cgroup_paths("cpu", "cpu.max"))
+    if quota is not None:
+        limit, period = quota.split()[:2]
+        if limit != "max":
+            cpus = min(cpus, math.ceil(int(limit) / int(period)))
+    else:
+        limit = _read_first(_cgroup_paths("cpu", "cpu.cfs_quota_us"))
+        period = _read_first(_cgroup_paths("cpu", "cpu.cfs_period_us"))
+        if limit is not None and period is not None and int(limit) > 0:
+            cpus = min(cpus, math.ceil(int(limit) / int(period)))
+
+    return max(1, cpus)
+
+
+def detect_memory() -> int:
+    """Detect the memory (bytes) available to this process.
+
+    The memory is the smallest of the available system memory and the cgroup
+    memory limit.
+    """
+    memory = None
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    memory = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if memory is None:
+        try:
+            memory = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            memory = 4 * GIB
+
+    for limit in (_read_first(_cgroup_paths("memory", "memory.max")),
+                  _read_first(_cgroup_paths("memory", "memory.limit_in_bytes"))):
+        if limit is not None and limit.isdigit():
+            memory = min(memory, int(limit))
+
+    return memory
+
+
+def split_cpus(cpus: int, shares: Dict[str, float]) -> Dict[str, int]:
+    """Split the CPUs between modules in proportion to their shares.
+
+    Each module gets at least one CPU, so the modules get more CPUs than
+    given if there are fewer CPUs than modules.
+    """
+    counts = {module: max(1, int(cpus * share)) for module, share in shares.items()}
+    while sum(counts.values()) < cpus:
+        module = max(shares, key=lambda module: cpus * shares[module] - counts[module])
+        counts[module] += 1
+    while sum(counts.values()) > cpus and max(counts.values()) > 1:
+        module = max((module for module in counts if counts[module] > 1),
+                     key=lambda module: counts[module] - cpus * shares[module])
+        counts[module] -= 1
+
+    return counts
+
+
+class ResourcePlan():
+    """Worker counts and diamond options fitted to the CPU and memory budget.
+
+    When the modules run one after another, each gets the whole budget. When
+    they run at the same time (`streaming`), the CPUs are split between them
+    by `STREAMING_CPU_SHARES`, and diamond gets the memory left by the others.
+
+    Attributes:
+        cpus: The number of CPUs to use.
+        memory: The memory (bytes) to use.
+        streaming: Whether the modules run at the same time.
+        prodigal_workers: The number of prodigal jobs run at once.
+        prodigal_threads: The number of prodigal processes run at once by a
+            job on a sharded genome.
+        python_workers: The number of processes for the Python modules.
+        diamond_jobs: The number of diamond processes run at once.
+        diamond_threads: The value of `--threads` for each diamond process.
+        diamond_block_size: The value of `--block-size`.
+        diamond_index_chunks: The value of `--index-chunks`.
+    """
+    def __init__(self, cpus: int, memory: int, streaming: bool = False,
+                 prodigal_shards: int = 1):
+        """Plan the resources.
+
+        Args:
+            cpus: The number of CPUs to use.
+            memory: The memory (bytes) to use.
+            streaming: Whether the modules run at the same time.
+            prodigal_shards: The number of contig shards of a large genome
+                predicted in parallel.
+        """
+        self.cpus = max(1, cpus)
+        self.memory = memory
+        self.streaming = streaming
+        if streaming:
+            module_cpus = split_cpus(self.cpus, STREAMING_CPU_SHARES)
+        else:
+            module_cpus = dict.fromkeys(STREAMING_CPU_SHARES, self.cpus)
+        # The shards of a genome take the cores of several prodigal jobs
+        self.prodigal_threads = max(1, min(prodigal_shards, module_cpus["prodigal"]))
+        self.prodigal_workers = self._fit(module_cpus["prodigal"] // self.prodigal_threads,
+                                          PRODIGAL_MEMORY * self.prodigal_threads)
+        self.python_workers = self._fit(module_cpus["python"], PYTHON_MEMORY)
+
+        diamond_memory = self.memory
+        if streaming:
+            # The other modules run next to diamond
+            diamond_memory = max(self.memory / 2,
+                                 self.memory - self.prodigal_workers * self.prodigal_threads
+                                 * PRODIGAL_MEMORY - self.python_workers * PYTHON_MEMORY)
+        diamond_cpus = module_cpus["diamond"]
+        self.diamond_threads = min(DIAMOND_MAX_THREADS, diamond_cpus)
+        self.diamond_jobs = max(1, diamond_cpus // self.diamond_threads)
+        # Prefer the fastest settings that fit in the memory of each job, then
+        # run fewer jobs if even the leanest settings do not fit.
+        while True:
+            memory_per_job = diamond_memory / self.diamond_jobs
+            for block_size, index_chunks in DIAMOND_SETTINGS:
+                if estimate_diamond_memory(block_size, index_chunks) <= memory_per_job:
+                    break
+            fits = estimate_diamond_memory(block_size, index_chunks) <= memory_per_job
+            if fits or self.diamond_jobs == 1:
+                break
+            self.diamond_jobs -= 1
+        self.diamond_block_size = block_size
+        self.diamond_index_chunks = index_chunks
+        # Give the cores of the dropped jobs to the remaining ones
+        self.diamond_threads = max(self.diamond_threads,
+                                   diamond_cpus // self.diamond_jobs)
+
+    def _fit(self, workers: int, memory_per_worker: int) -> int:
+        return max(1, min(workers, int(self.memory // memory_per_worker)))
+
+    def diamond_options(self) -> List[str]:
+        """The diamond options for the planned threads and memory."""
+        return ["--threads", str(self.diamond_threads),
+                "--block-size", str(self.diamond_block_size),
+                "--index-chunks", str(self.diamond_index_chunks)]
+
+    def describe(self) -> List[str]:
+        """Describe the plan in log messages."""
+        mode = "shared by the modules running at once" if self.streaming else "per module"
+        return [f"Resources: {self.cpus} CPU(s), {self.memory / GIB:.1f} GiB memory, {mode}",
+                f"prodigal: {self.prodigal_workers} job(s) x "
+                f"{self.prodigal_threads} process(es) (shards of a large genome)",
+                f"diamond: {self.diamond_jobs} process(es) x "
+                f"{self.diamond_threads} thread(s), block size "
+                f"{self.diamond_block_size}, {self.diamond_index_chunks} index chunk(s)",
+                f"Python modules: {self.python_workers} process(es)"]
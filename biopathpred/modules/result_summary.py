@@ -1,16 +1,22 @@
-from collections import defaultdict
+import json
+import multiprocessing as mp
+from functools import partial
 from pathlib import Path
-from typing import List, Literal
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
 
 import numpy as np
 
+from biopathpred.modules.sharding import in_shard
+
+# The number of result files summarized by a worker at a time
+CHUNK_SIZE = 1000
+# The file of the serialized SummaryState, written with the summary outputs
+STATE_FILENAME = "summary_state.json"
+
 
 class Result():
     """Parse and store the result from the output of match_enzyme module"""
 
-    total_compound_dict = defaultdict(list)
-    total_enzyme_dict = defaultdict(list)
-
     def __init__(self, filepath: Path):
         self.compound_dict = {}
         self.enzyme_dict = {}
@@ -44,61 +50,286 @@ class Result():
             score = float(score == "True")
         if type == "compound":
             self.compound_dict[id_] = score
-            self.total_compound_dict[id_].append(score)
         elif type == "enzyme":
             self.enzyme_dict[id_] = score
-            self.total_enzyme_dict[id_].append(score)
 
 
-def write_summary(data_dict: dict, type: Literal["compound", "enzyme"], output_path: Path):
-    """Write common statistics (max, min, mean and stdev) of input data to a csv
-    file.
+class SummaryStatistics():
+    """Mergeable statistics (count, sum, min, max, mean and M2) of each key.
 
-    Args:
-        data_dict: A dictionary that contains multiple lists of values.
-        type: The type of data, "compound" or "enzyme".
+    The statistics of two sets of results are merged without their values,
+    with the parallel algorithm of Chan et al. for the mean and the sum of
+    squared deviations (M2), so the memory does not grow with the number of
+    results.
+
+    Attributes:
+        keys: The keys (compound or enzyme names), in the order first seen.
+        count: The number of values of each key.
+        total: The sum of the values of each key.
+        minimum: The minimum of the values of each key.
+        maximum: The maximum of the values of each key.
+        mean: The running mean of the values of each key.
+        m2: The sum of squared deviations from the mean of each key.
     """
-    with open(output_path / f"{type}_output.csv", "w") as f:
-        f.writelines(f"{type}_key,{type}_value,max,min,mean,stdev\n")
-        for key, value in data_dict.items():
-            f.writelines(f"{key},{round(sum(value), 6)},{max(value)},"
-                         f"{min(value)},{round(np.mean(value), 6)},"
-                         f"{round(np.std(value, ddof=1), 6)}\n")
+    def __init__(self, keys: Sequence[str] = (), values: Optional[np.ndarray] = None):
+        """Compute the statistics of a matrix of values.
+
+        Args:
+            keys: The keys of the columns.
+            values: A results x keys matrix, with NaN for the missing values.
+        """
+        self.keys = list(keys)
+        if values is None:
+            values = np.empty((0, len(self.keys)))
+        present = ~np.isnan(values)
+        self.count = present.sum(axis=0)
+        self.total = np.where(present, values, 0).sum(axis=0)
+        self.minimum = np.where(present, values, np.inf).min(axis=0, initial=np.inf)
+        self.maximum = np.where(present, values, -np.inf).max(axis=0, initial=-np.inf)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.mean = self.total / self.count
+        deviation = np.where(present, values - self.mean, 0)
+        self.m2 = (deviation * deviation).sum(axis=0)
+
+    def merge(self, other: "SummaryStatistics") -> "SummaryStatistics":
+        """Merge the statistics of another set of results into this one.
+
+        Args:
+            other: The statistics to be merged. The keys not seen yet are
+                appended to `keys`.
+
+        Returns:
+            This object.
+        """
+        new_keys = [key for key in other.keys if key not in self.keys]
+        if new_keys:
+            self.keys.extend(new_keys)
+            padding = len(new_keys)
+            self.count = np.pad(self.count, (0, padding))
+            self.total = np.pad(self.total, (0, padding))
+            self.minimum = np.pad(self.minimum, (0, padding), constant_values=np.inf)
+            self.maximum = np.pad(self.maximum, (0, padding), constant_values=-np.inf)
+            self.mean = np.pad(self.mean, (0, padding))
+            self.m2 = np.pad(self.m2, (0, padding))
+
+        index = [self.keys.index(key) for key in other.keys]
+        count = self.count[index] + other.count
+        delta = other.mean - self.mean[index]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(other.count == 0, self.mean[index],
+                            self.mean[index] + delta * other.count / count)
+            m2 = np.where(other.count == 0, self.m2[index],
+                          self.m2[index] + other.m2
+                          + delta * delta * self.count[index] * other.count / count)
+        mean = np.where(self.count[index] == 0, other.mean, mean)
+        m2 = np.where(self.count[index] == 0, other.m2, m2)
+        self.total[index] = self.total[index] + other.total
+        self.minimum[index] = np.minimum(self.minimum[index], other.minimum)
+        self.maximum[index] = np.maximum(self.maximum[index], other.maximum)
+        self.mean[index] = mean
+        self.m2[index] = m2
+        self.count[index] = count
+
+        return self
+
+    def to_dict(self) -> dict:
+        return {"keys": self.keys,
+                **{attribute: getattr(self, attribute).tolist()
+                   for attribute in ("count", "total", "minimum", "maximum", "mean", "m2")}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SummaryStatistics":
+        statistics = cls(data["keys"])
+        for attribute in ("count", "total", "minimum", "maximum", "mean", "m2"):
+            setattr(statistics, attribute, np.array(data[attribute],
+                                                    dtype=getattr(statistics, attribute).dtype))
+        return statistics
+
+    def write(self, type: Literal["compound", "enzyme"], output_path: Path):
+        """Write common statistics (max, min, mean and stdev) to a csv file.
+
+        Args:
+            type: The type of data, "compound" or "enzyme".
+            output_path: The folder to save the csv file in.
+        """
+        with open(output_path / f"{type}_output.csv", "w") as f:
+            f.writelines(f"{type}_key,{type}_value,max,min,mean,stdev\n")
+            for i, key in enumerate(self.keys):
+                count = self.count[i]
+                stdev = np.sqrt(self.m2[i] / (count - 1)) if count > 1 else np.nan
+                f.writelines(f"{key},{round(self.total[i], 6)},{self.maximum[i]},"
+                             f"{self.minimum[i]},{round(self.total[i] / count, 6)},"
+                             f"{round(stdev, 6)}\n")
+
+
+class SummaryState():
+    """The mergeable summary of a set of match_enzyme results.
+
+    Attributes:
+        compound: The SummaryStatistics of the compound scores.
+        enzyme: The SummaryStatistics of the enzyme scores.
+        predictions: A list of (species, target compound score) of each result.
+    """
+    def __init__(self, results: Sequence[Result] = (), target: str = "iaa"):
+        """Summarize the results.
+
+        Args:
+            results: A list of Result objects.
+            target: The name of the compound used as the prediction score.
+        """
+        self.compound = SummaryStatistics(*_to_matrix([obj.compound_dict for obj in results]))
+        self.enzyme = SummaryStatistics(*_to_matrix([obj.enzyme_dict for obj in results]))
+        self.predictions = [(obj.name.rsplit(".", 1)[0], obj.compound_dict[target])
+                            for obj in results]
+
+    def merge(self, other: "SummaryState") -> "SummaryState":
+        """Merge the summary of the results that follow this one."""
+        self.compound.merge(other.compound)
+        self.enzyme.merge(other.enzyme)
+        self.predictions.extend(other.predictions)
+
+        return self
+
+    def write(self, output_path: Path):
+        """Write the compound, enzyme and prediction outputs."""
+        self.compound.write("compound", output_path)
+        self.enzyme.write("enzyme", output_path)
+        write_prediction(self.predictions, output_path)
 
+    def save(self, filepath: Path, shard: Optional[Tuple[int, int]] = None):
+        """Save the summary as JSON, to be merged with other shards (see `merge_summaries`).
 
-def write_prediction(result_list: List[Result], output_path: Path):
+        Args:
+            filepath: The path of the JSON file.
+            shard: The shard (K, N) of the summarized results, if sharded.
+        """
+        data = {"shard": shard, "compound": self.compound.to_dict(),
+                "enzyme": self.enzyme.to_dict(), "predictions": self.predictions}
+        Path(filepath).write_text(json.dumps(data))
+
+    @classmethod
+    def load(cls, filepath: Path) -> Tuple["SummaryState", Optional[Tuple[int, int]]]:
+        """Load a summary saved by `save`.
+
+        Returns:
+            A tuple of the summary and its shard.
+        """
+        data = json.loads(Path(filepath).read_text())
+        state = cls()
+        state.compound = SummaryStatistics.from_dict(data["compound"])
+        state.enzyme = SummaryStatistics.from_dict(data["enzyme"])
+        state.predictions = [tuple(prediction) for prediction in data["predictions"]]
+        shard = tuple(data["shard"]) if data["shard"] is not None else None
+
+        return state, shard
+
+
+def _to_matrix(dicts: List[Dict[str, float]]):
+    keys = {}
+    for data in dicts:
+        for key in data:
+            keys.setdefault(key, len(keys))
+    values = np.full((len(dicts), len(keys)), np.nan)
+    for i, data in enumerate(dicts):
+        for key, value in data.items():
+            values[i, keys[key]] = value
+
+    return list(keys), values
+
+
+def summarize_files(filepaths: List[Path], target: str = "iaa") -> SummaryState:
+    """Summarize a chunk of match_enzyme results."""
+    return SummaryState([Result(filepath) for filepath in filepaths], target)
+
+
+def write_prediction(predictions: List[tuple], output_path: Path):
     """Write prediction output to a csv file.
 
-    The prediction output is the score of the compound "iaa".
+    The prediction output is the score of the target compound of the pathway,
+    sorted from the highest.
 
     Args:
-        result_list : A list containing Result objects.
+        predictions : A list of (species, score) of each result.
     """
+    predictions = sorted(predictions, key=lambda prediction: prediction[1], reverse=True)
     with open(output_path / "prediction_output.csv", "w") as f:
         f.writelines("species,score\n")
-        for obj in result_list:
-            species = obj.name.rsplit(".", 1)[0]
-            score = obj.compound_dict["iaa"]
+        for species, score in predictions:
             f.writelines(f"{species},{score}\n")
 
 
-def result_summary(path: Path, output_path: Path):
+def result_summary(path: Path, output_path: Path, target: str = "iaa",
+                   processes: int = 1, shard: Optional[Tuple[int, int]] = None):
     """Collect the match_enzyme results from a folder and summarize them.
 
+    The results are summarized in chunks, in parallel if `processes` is
+    larger than 1, and the summaries of the chunks are merged in the order
+    of the files. The summary is also saved in `STATE_FILENAME`, so that the
+    summaries of several shards can be merged.
+
     Args:
         path: The path to the folder containing match_enzyme results.
         output_path: The path to save the summary.
+        target: The name of the compound used as the prediction score.
+        processes: The number of worker processes.
+        shard: The shard (K, N) of the genomes to summarize, all if not given.
     """
-    result_list = []
-    # Reset the shared attributes
-    Result.total_compound_dict = defaultdict(list)
-    Result.total_enzyme_dict = defaultdict(list)
-
-    file_list = path.glob("**/*.txt")
-    for filepath in file_list:
-        result_list.append(Result(filepath))
-    write_summary(Result.total_compound_dict, "compound", output_path)
-    write_summary(Result.total_enzyme_dict, "enzyme", output_path)
-    result_list.sort(
-        key=lambda obj: obj.compound_dict["iaa"], reverse=True)
-    write_prediction(result_list, output_path)
+    file_list = sorted(path.glob("**/*.txt"))
+    if shard is not None:
+        file_list = [filepath for filepath in file_list if in_shard(filepath, shard)]
+    chunks = [file_list[i:i + CHUNK_SIZE] for i in range(0, len(file_list), CHUNK_SIZE)]
+    job = partial(summarize_files, target=target)
+
+    state = SummaryState(target=target)
+    if processes > 1 and len(chunks) > 1:
+        with mp.Pool(min(processes, len(chunks))) as p:
+            for chunk_state in p.imap(job, chunks):
+                state.merge(chunk_state)
+    else:
+        for chunk in chunks:
+            state.merge(job(chunk))
+    state.write(output_path)
+    state.save(output_path / STATE_FILENAME, shard)
+
+
+def merge_summaries(filepaths: List[Path], output_path: Path) -> int:
+    """Merge the saved summaries of several shards into one summary.
+
+    The summary outputs are the same as those of a single run on all the
+    results, without reading the results again. The predictions are ranked
+    over all shards, and the predictions with the same score are in the
+    order of their names, as the result files of a single run.
+
+    Args:
+        filepaths: The summary files written by `result_summary`.
+        output_path: The folder to save the merged summary in.
+
+    Returns:
+        The number of merged results.
+
+    Raises:
+        ValueError: If the summaries are of shards of different sizes, or
+            some shards are missing or given more than once.
+    """
+    loaded = [SummaryState.load(filepath) for filepath in filepaths]
+    shards = [shard for _, shard in loaded if shard is not None]
+    if shards:
+        if len(shards) != len(loaded) or len({shard_num for _, shard_num in shards}) != 1:
+            raise ValueError("The summaries are not of the same sharding")
+        shard_num = shards[0][1]
+        indices = sorted(index for index, _ in shards)
+        if indices != list(range(1, shard_num + 1)):
+            missing = sorted(set(range(1, shard_num + 1)) - set(indices))
+            duplicated = sorted({index for index in indices if indices.count(index) > 1})
+            raise ValueError(f"Shards of {shard_num}: missing {missing}, "
+                             f"given more than once {duplicated}")
+        loaded.sort(key=lambda item: item[1])
+
+    state = SummaryState()
+    for shard_state, _ in loaded:
+        state.merge(shard_state)
+    state.predictions.sort(key=lambda prediction: prediction[0])
+    state.write(output_path)
+    state.save(output_path / STATE_FILENAME)
+
+    return len(state.predictions)
@@ -0,0 +1,194 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Literal, Optional
+
+from tqdm import tqdm
+
+# Marks the end of the items for a worker
+_SENTINEL = object()
+
+
+class Stage():
+    """A pipeline stage with its own workers and a bounded input queue.
+
+    Attributes:
+        name: The name of the stage, used in progress bars and error messages.
+        func: A callable taking the output of the previous stage and returning
+            the input of the next stage. Returning `None` drops the item.
+        workers: The number of items processed concurrently in this stage.
+        executor: `thread` runs `func` directly in the worker threads, which
+            suits stages waiting on external programs (prodigal, diamond);
+            `process` sends `func` to the process pool shared by all Python
+            stages.
+        queue_size: The maximum number of items waiting for this stage.
+            Upstream stages block when the queue is full.
+        batch_size: The number of items passed to `func` at once. If larger
+            than 1, `func` takes a list of items and returns a list of
+            outputs in the same order.
+    """
+    def __init__(self, name: str, func: Callable, workers: int,
+                 executor: Literal["thread", "process"] = "thread",
+                 queue_size: Optional[int] = None, batch_size: int = 1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.executor = executor
+        self.batch_size = max(1, batch_size)
+        if queue_size is None:
+            queue_size = 2 * self.workers * self.batch_size
+        self.queue_size = queue_size
+
+
+class StreamingScheduler():
+    """Stream items through a chain of stages without barriers between them.
+
+    Each item moves to the next stage as soon as the previous stage finishes
+    it, so the total time approaches that of the slowest stage instead of the
+    sum of all stages.
+
+    Attributes:
+        stages: The list of `Stage` objects to be run in order.
+        process_workers: The size of the process pool for `process` stages.
+        progress: Whether to show a progress bar for each stage.
+        events: An `EventStream` receiving the start and finish of each
+            stage, the finished items with the depth of each queue, and the
+            errors, or `None`.
+    """
+    def __init__(self, stages: List[Stage], process_workers: int = 1,
+                 progress: bool = True, events=None):
+        self.stages = stages
+        self.process_workers = max(1, process_workers)
+        self.progress = progress
+        self.events = events
+
+    def run(self, items: Iterable,
+            start_stages: Optional[Iterable[int]] = None) -> list:
+        """Process the items through all stages.
+
+        Args:
+            items: The inputs of the first stage.
+            start_stages: The index of the stage each item enters at, for
+                items that have already been through the earlier stages.
+                All items enter at the first stage if not given.
+
+        Returns:
+            A list of the outputs of the last stage, in completion order.
+
+        Raises:
+            The first exception raised by any stage. The remaining items are
+            drained without being processed once an error occurs.
+        """
+        items = list(items)
+        if start_stages is None:
+            start_stages = [0] * len(items)
+        start_stages = list(start_stages)
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        results, errors = [], []
+        lock = threading.Lock()
+        abort = threading.Event()
+        bars = [tqdm(total=sum(start <= i for start in start_stages),
+                     desc=stage.name, position=i, disable=not self.progress)
+                for i, stage in enumerate(self.stages)]
+        if self.events is not None:
+            for bar, stage in zip(bars, self.stages):
+                self.events.stage_started(stage.name, bar.total)
+
+        need_pool = any(stage.executor == "process" for stage in self.stages)
+        pool = None
+        if need_pool:
+            # Forking the pool workers while other threads start external
+            # programs would leak their pipes into the workers, so the workers
+            # are forked from a clean server process instead.
+            context = None
+            if "forkserver" in mp.get_all_start_methods():
+                context = mp.get_context("forkserver")
+            pool = ProcessPoolExecutor(self.process_workers, mp_context=context)
+
+        def feed():
+            # Items entering at a later stage are queued before the first
+            # stage closes, so they always arrive before their stage closes.
+            for item, start in zip(items, start_stages):
+                if abort.is_set():
+                    break
+                queues[start].put(item)
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_SENTINEL)
+
+        def work(index: int):
+            stage = self.stages[index]
+            is_last = index == len(self.stages) - 1
+            closed = False
+            while not closed:
+                batch = []
+                while len(batch) < stage.batch_size:
+                    item = queues[index].get()
+                    if item is _SENTINEL:
+                        closed = True
+                        break
+                    batch.append(item)
+                if not batch or abort.is_set():
+                    continue
+                try:
+                    start = time.perf_counter()
+                    func_input = batch if stage.batch_size > 1 else batch[0]
+                    if stage.executor == "process":
+                        outputs = pool.submit(stage.func, func_input).result()
+                    else:
+                        outputs = stage.func(func_input)
+                except BaseException as err:
+                    with lock:
+                        errors.append((stage.name, batch, err))
+                    abort.set()
+                    if self.events is not None:
+                        self.events.job_failed(stage.name, batch, err)
+                    continue
+                bars[index].update(len(batch))
+                if stage.batch_size == 1:
+                    outputs = [outputs]
+                if self.events is not None:
+                    # The duration includes the wait for a free process worker
+                    self.events.genomes_finished(
+                        stage.name, batch, outputs, time.perf_counter() - start,
+                        queued={other.name: waiting.qsize()
+                                for other, waiting in zip(self.stages, queues)})
+                for output in outputs:
+                    if output is None:
+                        continue
+                    if is_last:
+                        with lock:
+                            results.append(output)
+                    else:
+                        queues[index + 1].put(output)
+
+            # The last worker of a stage closes the queue of the next stage
+            with lock:
+                remaining[index] -= 1
+                closing = remaining[index] == 0
+            if closing and self.events is not None:
+                self.events.stage_finished(stage.name)
+            if closing and not is_last:
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_SENTINEL)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for index, stage in enumerate(self.stages):
+            threads.extend(threading.Thread(target=work, args=(index,), daemon=True)
+                           for _ in range(stage.workers))
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            for bar in bars:
+                bar.close()
+
+        if errors:
+            raise errors[0][2]
+        return results
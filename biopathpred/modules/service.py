@@ -0,0 +1,345 @@
+import gzip
+import json
+import logging
+import queue
+import re
+import socketserver
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, List, Literal, Optional, Union
+from urllib.parse import parse_qs, urlsplit
+
+from biopathpred.modules.result_summary import Result
+
+# The largest submission accepted, in bytes after decompression
+MAX_SUBMISSION_SIZE = 256 * 1024 ** 2
+# The characters of nucleotide sequences, to tell genomes from proteins
+NUCLEOTIDES = set("ACGTUNacgtun")
+# Marks the end of the submissions for the collector thread
+_CLOSE = object()
+
+logger = logging.getLogger("pipeline_log")
+
+
+class ServiceBusy(Exception):
+    """Raised when the submission queue of the service is full or the service is closing."""
+
+
+class ScoringError(Exception):
+    """Raised when a submission cannot be scored, e.g. when an executable fails on it."""
+
+
+class Submission():
+    """A genome or protein FASTA file submitted for scoring.
+
+    Attributes:
+        name: The name given by the client.
+        sequence_type: `genome` for nucleotide contigs, which are predicted
+            with prodigal, or `protein` for proteins aligned directly.
+        path: The file the FASTA is saved to. Its name is unique, so that
+            the outputs of the submissions do not overwrite each other.
+        submitted: The time the submission was received.
+        future: The `Future` of the JSON-ready result.
+    """
+    def __init__(self, name: str, fasta: bytes, input_dir: Union[str, Path],
+                 sequence_type: Optional[Literal["genome", "protein"]] = None):
+        """Check and save a submitted FASTA file.
+
+        Raises:
+            ValueError: If the FASTA file or the sequence type is not valid.
+        """
+        if not fasta.lstrip().startswith(b">"):
+            raise ValueError("The submission is not a FASTA file")
+        if sequence_type is None:
+            sequence_type = detect_sequence_type(fasta)
+        if sequence_type not in ("genome", "protein"):
+            raise ValueError(f"Unknown sequence type: {sequence_type}")
+        self.name = name
+        self.sequence_type = sequence_type
+        safe_name = re.sub(r"[^A-Za-z0-9_-]", "_", name)[:100]
+        extension = "fna" if sequence_type == "genome" else "faa"
+        if sequence_type == "protein":
+            fasta = prodigal_headers(fasta)
+        self.path = Path(input_dir, f"{safe_name}_{uuid.uuid4().hex[:12]}.{extension}")
+        self.path.write_bytes(fasta)
+        self.submitted = time.perf_counter()
+        self.future = Future()
+
+
+def detect_sequence_type(fasta: bytes) -> Literal["genome", "protein"]:
+    """Tell a genome from proteins by the characters of the first sequence lines."""
+    lines = [line for line in fasta[:100000].decode(errors="replace").splitlines()
+             if line and not line.startswith(">")]
+    characters = set("".join(lines[:100]))
+    return "genome" if characters <= NUCLEOTIDES else "protein"
+
+
+def prodigal_headers(fasta: bytes) -> bytes:
+    """Rewrite the headers of a protein FASTA file in the format of prodigal.
+
+    The blast parsers read the gene id, start and end from the
+    `id # start # end # strand # description` headers written by prodigal.
+    The other proteins are given their first word as id, and the positions
+    of their first and last residues. Headers already in this format are kept.
+    """
+    records = fasta.lstrip()[1:].split(b"\n>")
+    for i, record in enumerate(records):
+        header, newline, sequence = record.partition(b"\n")
+        if header.count(b"#") >= 4:
+            continue
+        words = header.strip().split(maxsplit=1) or [b"protein_%d" % (i + 1)]
+        gene_id = re.sub(rb"[#,]", b"_", words[0])
+        description = words[1] if len(words) > 1 else b""
+        length = len(re.sub(rb"[\s*]", b"", sequence))
+        records[i] = b"%s # 1 # %d # 1 # %s%s%s" % (gene_id, length, description,
+                                                  newline, sequence)
+
+    return b">" + b"\n>".join(records)
+
+
+class ScoringService():
+    """Score submitted genomes in batches on a bounded pool of workers.
+
+    The submissions wait in a bounded queue. When a worker is free, the
+    submissions that arrived together (up to `batch_size`, waiting at most
+    `batch_wait` seconds for more) are scored as one batch, so that they
+    share one diamond run.
+
+    Attributes:
+        score_batch: A callable taking a list of `Submission` objects and
+            returning the match_enzyme output path of each, `None` if no
+            protein was found, or the exception raised by the submission.
+        target: The name of the compound used as the prediction score.
+        workers: The number of batches scored at once.
+        batch_size: The largest number of submissions in a batch.
+        batch_wait: The longest time to wait for more submissions.
+        timeout: The longest time a request waits for its result, or `None`
+            for no limit.
+        keep_files: Whether to keep the submitted and output files.
+    """
+    def __init__(self, score_batch: Callable[[List[Submission]],
+                                             List[Union[Path, Exception, None]]],
+                 target: str, workers: int = 1, batch_size: int = 8,
+                 batch_wait: float = 0.2, queue_size: int = 64,
+                 timeout: Optional[float] = None, keep_files: bool = False):
+        self.score_batch = score_batch
+        self.target = target
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.keep_files = keep_files
+        self.scored = 0
+        self._closing = False
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._slots = threading.Semaphore(self.workers)
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, submission: Submission) -> Future:
+        """Queue a submission.
+
+        Raises:
+            ServiceBusy: If the queue is full or the service is closing.
+        """
+        # No submission is queued after the end of the submissions
+        with self._lock:
+            if self._closing:
+                submission.path.unlink(missing_ok=True)
+                raise ServiceBusy("The service is shutting down")
+            try:
+                self._queue.put_nowait(submission)
+            except queue.Full:
+                submission.path.unlink(missing_ok=True)
+                raise ServiceBusy("Too many submissions, retry later") from None
+        return submission.future
+
+    def _collect(self):
+        closing = False
+        while not closing:
+            # The submissions wait in the queue until a worker is free
+            self._slots.acquire()
+            batch = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                try:
+                    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                    submission = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if submission is _CLOSE:
+                    closing = True
+                    break
+                # The requests that timed out have cancelled their submission
+                if not submission.future.set_running_or_notify_cancel():
+                    submission.path.unlink(missing_ok=True)
+                    continue
+                batch.append(submission)
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_wait
+            if batch:
+                self._executor.submit(self._score, batch)
+            else:
+                self._slots.release()
+
+    def _score(self, batch: List[Submission]):
+        try:
+            outputs = self.score_batch(batch)
+            for submission, output in zip(batch, outputs):
+                if isinstance(output, Exception):
+                    submission.future.set_exception(output)
+                    continue
+                if output is None:
+                    submission.future.set_result(None)
+                    continue
+                result = Result(Path(output))
+                submission.future.set_result(
+                    {"name": submission.name, "type": submission.sequence_type,
+                     "prediction": result.compound_dict.get(self.target),
+                     "compounds": result.compound_dict, "enzymes": result.enzyme_dict,
+                     "batch": len(batch),
+                     "seconds": round(time.perf_counter() - submission.submitted, 3)})
+                if not self.keep_files:
+                    Path(output).unlink(missing_ok=True)
+            self.scored += len(batch)
+        except BaseException as err:
+            logger.error(f"Scoring a batch of {len(batch)} submission(s) failed: {err!r}")
+            # The requests only handle the errors of the scoring, not SystemExit
+            if not isinstance(err, Exception):
+                err = ScoringError(f"Scoring failed: {type(err).__name__}")
+            for submission in batch:
+                if not submission.future.done():
+                    submission.future.set_exception(err)
+        finally:
+            if not self.keep_files:
+                for submission in batch:
+                    submission.path.unlink(missing_ok=True)
+            self._slots.release()
+
+    def close(self):
+        """Score the queued submissions and stop the workers.
+
+        The submissions made from now on are refused with `ServiceBusy`.
+        """
+        with self._lock:
+            self._closing = True
+        self._queue.put(_CLOSE)
+        self._collector.join()
+        self._executor.shutdown(wait=True)
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """The HTTP API of a `ScoringService`.
+
+    - `POST /score?name=NAME[&type=genome|protein]` with a FASTA body
+      (optionally with `Content-Encoding: gzip`) returns the compound and
+      enzyme scores as JSON. The type is detected from the sequences if not
+      given.
+    - `GET /health` returns the numbers of queued and scored submissions.
+
+    A request that waits longer than the `timeout` of the service gets a 504
+    response, and its submission is dropped if it is not being scored yet.
+    """
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            self._send_json(404, {"error": "Not found"})
+            return
+        service = self.server.service
+        self._send_json(200, {"status": "ok", "queued": service.queued,
+                              "scored": service.scored})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/score":
+            self._send_json(404, {"error": "Not found"})
+            return
+        params = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length == 0 or length > MAX_SUBMISSION_SIZE:
+            self._send_json(413 if length else 400,
+                            {"error": f"The FASTA body must have 1 to {MAX_SUBMISSION_SIZE} bytes"})
+            return
+        fasta = self.rfile.read(length)
+        try:
+            if self.headers.get("Content-Encoding") == "gzip":
+                fasta = gzip.decompress(fasta)
+            submission = Submission(params.get("name", ["genome"])[0], fasta,
+                                    self.server.input_dir, params.get("type", [None])[0])
+        except (ValueError, OSError, EOFError) as err:
+            self._send_json(400, {"error": str(err)})
+            return
+
+        service = self.server.service
+        try:
+            future = service.submit(submission)
+            result = future.result(timeout=service.timeout)
+        except ServiceBusy as err:
+            self._send_json(503, {"error": str(err)})
+            return
+        except FutureTimeoutError:
+            future.cancel()
+            self._send_json(504, {"error": f"No result within {service.timeout} seconds"})
+            return
+        except Exception as err:
+            self._send_json(500, {"error": f"{type(err).__name__}: {err}"})
+            return
+        if result is None:
+            self._send_json(422, {"error": "No protein found in the submission"})
+            return
+        self._send_json(200, result)
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # The clients of a Unix socket have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        logger.info(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: ScoringService, input_dir: Union[str, Path],
+                socket_path: Optional[Union[str, Path]] = None,
+                host: str = "127.0.0.1", port: int = 8000):
+    """Create the HTTP server of a service on a Unix socket or a TCP port.
+
+    Args:
+        service: The service scoring the submissions.
+        input_dir: The folder the submissions are saved to.
+        socket_path: The path of the Unix socket. A TCP port is used if not
+            given.
+        host: The host of the TCP port.
+        port: The TCP port, or 0 for any free port.
+    """
+    if socket_path is not None:
+        Path(socket_path).unlink(missing_ok=True)
+        server = UnixHTTPServer(str(socket_path), ScoringHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ScoringHandler)
+    server.service = service
+    server.input_dir = Path(input_dir)
+
+    return server
@@ -0,0 +1,39 @@
+import hashlib
+from pathlib import Path
+from typing import Tuple, Union
+
+from biopathpred.modules.compression import strip_compression
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parse a shard given as `K/N`, the K-th of N shards (1 <= K <= N).
+
+    Raises:
+        ValueError: If the shard is not valid.
+    """
+    try:
+        index, shard_num = (int(value) for value in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard: {shard}, expected K/N") from None
+    if not 1 <= index <= shard_num:
+        raise ValueError(f"Invalid shard: {shard}, K must be between 1 and N")
+
+    return index, shard_num
+
+
+def genome_shard(filepath: Union[str, Path], shard_num: int) -> int:
+    """Assign a genome to one of `shard_num` shards (numbered from 1).
+
+    The shard depends only on the genome name (the file name without its
+    extensions), so a genome is in the same shard on every node and in the
+    output folder of every module.
+    """
+    name = strip_compression(filepath).stem
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+
+    return int.from_bytes(digest, "big") % shard_num + 1
+
+
+def in_shard(filepath: Union[str, Path], shard: Tuple[int, int]) -> bool:
+    index, shard_num = shard
+    return genome_shard(filepath, shard_num) == index
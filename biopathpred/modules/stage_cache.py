@@ -0,0 +1,123 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+# The files modified within this many seconds may change again without a new
+# modification time (coarse file system timestamps), so their content is hashed
+MTIME_RESOLUTION = 2.0
+
+
+def file_digest(filepath: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 digest of a file's content.
+
+    Args:
+        filepath: The path to the file.
+        chunk_size: The number of bytes read at a time.
+
+    Returns:
+        The hexadecimal digest.
+    """
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class StageCache():
+    """Record the key that produced each stage artifact.
+
+    The key of an artifact is a hash of the module name, the key of its input
+    and the parameters of the module. The key of an input is the key recorded
+    when the input was produced by an earlier stage, or a hash of its size and
+    modification time otherwise (see `file_key`). Keys are therefore chained
+    from the genome file, and the key of any stage can be computed before its
+    upstream artifacts exist.
+
+    The keys are stored as small files under `cache_dir`, one per artifact, so
+    that workers in different processes can record them without a lock.
+
+    Attributes:
+        cache_dir: The folder that stores the keys.
+    """
+    def __init__(self, cache_dir: Union[str, Path]):
+        self.cache_dir = Path(cache_dir)
+
+    @staticmethod
+    def stage_key(module: str, input_key: str, params: dict) -> str:
+        """Derive the key of a stage artifact.
+
+        Args:
+            module: The name of the module producing the artifact.
+            input_key: The key of the input of the module.
+            params: The parameters affecting the output of the module.
+
+        Returns:
+            The hexadecimal key.
+        """
+        content = json.dumps([module, input_key, params], sort_keys=True,
+                             default=str)
+
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def input_key(self, filepath: Union[str, Path]) -> str:
+        """Get the key of an input file.
+
+        Args:
+            filepath: The path to the input file.
+
+        Returns:
+            The recorded key if the file is a stage artifact, otherwise the
+            key of the file itself.
+        """
+        key = self.recorded_key(filepath)
+        if key is None:
+            key = self.file_key(filepath)
+
+        return key
+
+    @staticmethod
+    def file_key(filepath: Union[str, Path]) -> str:
+        """Get the key of a file from its size and modification time.
+
+        The file is not read, unless it was modified too recently for its
+        modification time to tell later changes apart, in which case the key
+        is the digest of its content. A file that is touched or copied gets a
+        new key, so its outputs are computed again rather than reused wrongly.
+        """
+        stat = Path(filepath).stat()
+        if time.time() - stat.st_mtime < MTIME_RESOLUTION:
+            return file_digest(filepath)
+        content = json.dumps(["stat", stat.st_size, stat.st_mtime_ns])
+
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def recorded_key(self, filepath: Union[str, Path]) -> Optional[str]:
+        try:
+            return self._key_path(filepath).read_text()
+        except FileNotFoundError:
+            return None
+
+    def is_fresh(self, filepath: Union[str, Path], key: str) -> bool:
+        """Check whether an artifact exists and was produced with the key."""
+        return Path(filepath).is_file() and self.recorded_key(filepath) == key
+
+    def record(self, filepath: Union[str, Path], key: str):
+        """Record the key of an artifact once it is completely written."""
+        key_path = self._key_path(filepath)
+        key_path.parent.mkdir(parents=True, exist_ok=True)
+        key_path.write_text(key)
+
+    def invalidate(self, filepath: Union[str, Path]):
+        """Forget the key of an artifact before it is rewritten.
+
+        An artifact left half-written by a crash is then never seen as fresh.
+        """
+        self._key_path(filepath).unlink(missing_ok=True)
+
+    def _key_path(self, filepath: Union[str, Path]) -> Path:
+        filepath = Path(filepath)
+        return self.cache_dir.joinpath(filepath.parent.name, f"{filepath.name}.key")
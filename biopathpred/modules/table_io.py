@@ -0,0 +1,197 @@
+import importlib.util
+import io
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from biopathpred.modules.compression import strip_compression
+from biopathpred.modules.parse_blastp_xml import HEADER_ELEMENT
+
+# Formats of the parse_blast and best_blast outputs, by file extension
+TABLE_FORMATS = ["csv", "parquet", "feather"]
+
+# The fixed schema of the hit tables (columns of `HEADER_ELEMENT`). The
+# repeated free-text columns are dictionary-encoded as categories.
+HIT_SCHEMA = {"id": "object", "start": "int64", "end": "int64",
+              "alignment_id": "category", "enzyme_id": "float64",
+              "enzyme_code": "category", "product": "category",
+              "organism": "category", "existence": "int64", "gene": "category",
+              "score": "float64", "evalue": "float64", "identity": "float64",
+              "coverage": "float64"}
+
+# The dtypes pandas infers for a csv column, from the narrowest
+CSV_DTYPE_ORDER = ["int64", "float64", "object"]
+
+
+def check_table_format(format: str):
+    """Check that a table format is known and its optional dependency is installed.
+
+    Raises:
+        ValueError: If the format is unknown.
+        ImportError: If pyarrow is needed but not installed.
+    """
+    if format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format: {format}")
+    if format != "csv" and importlib.util.find_spec("pyarrow") is None:
+        raise ImportError(f"The {format} format requires pyarrow "
+                          "(pip install biopathpred[columnar])")
+
+
+def apply_hit_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """Cast a hit table to `HIT_SCHEMA`.
+
+    Unlabeled alignments (an empty or "-" enzyme_id) get a NaN enzyme_id.
+    """
+    data = data.copy()
+    for column, dtype in HIT_SCHEMA.items():
+        if column not in data:
+            continue
+        if column == "enzyme_id":
+            data[column] = pd.to_numeric(data[column], errors="coerce").astype(np.float64)
+        elif dtype == "category":
+            values = data[column]
+            data[column] = values.where(values.isna(), values.astype(str)).astype("category")
+        else:
+            data[column] = data[column].astype(dtype)
+
+    return data[[column for column in HEADER_ELEMENT if column in data]]
+
+
+def read_table(filepath: Union[str, Path, io.StringIO],
+               columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Read a hit table in the format given by its extension.
+
+    The csv files are read as before, with the dtypes inferred by pandas, so
+    that they are written back unchanged. They may be compressed (.csv.gz or
+    .csv.zst). Parquet and feather files keep their schema.
+
+    Args:
+        filepath: The path to the table, or a text stream of csv.
+        columns: If given, only these columns are read.
+
+    Returns:
+        A data frame of the table.
+    """
+    suffix = strip_compression(filepath).suffix if isinstance(filepath, (str, Path)) else ".csv"
+    if suffix == ".parquet":
+        return pd.read_parquet(filepath, columns=columns)
+    elif suffix == ".feather":
+        return pd.read_feather(filepath, columns=columns)
+
+    return pd.read_csv(filepath, usecols=columns)
+
+
+def iter_table(filepath: Union[str, Path], chunksize: int,
+               numeric_columns: Iterable[str] = ()) -> Iterator[pd.DataFrame]:
+    """Read a hit table in chunks of rows, in the format given by its extension.
+
+    The csv columns are read as strings, except `numeric_columns`, whose
+    dtypes are inferred by pandas for each chunk. The dtypes of the whole
+    file can be given back to the rows kept from the chunks with
+    `update_csv_dtypes` and `cast_csv_dtypes`. Feather files are read at once.
+
+    Args:
+        filepath: The path to the table.
+        chunksize: The number of rows of each chunk.
+        numeric_columns: The csv columns that are compared as numbers.
+
+    Yields:
+        A data frame of each chunk.
+    """
+    suffix = strip_compression(filepath).suffix
+    if suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    elif suffix == ".feather":
+        yield pd.read_feather(filepath)
+    else:
+        columns = pd.read_csv(filepath, nrows=0).columns
+        dtype = {column: str for column in columns if column not in numeric_columns}
+        with pd.read_csv(filepath, dtype=dtype, chunksize=chunksize) as reader:
+            yield from reader
+
+
+def update_csv_dtypes(dtypes: Dict[str, str], chunk: pd.DataFrame) -> Dict[str, str]:
+    """Widen the dtypes of the csv columns with those of a chunk (see `iter_table`).
+
+    The dtypes are those pandas infers when the whole file is read at once:
+    `int64` for integers, `float64` for numbers with a decimal part or
+    missing values, and `object` for columns with any other text.
+
+    Args:
+        dtypes: The dtypes of the chunks read so far, empty for the first one.
+        chunk: The next chunk.
+
+    Returns:
+        The dtypes of the columns.
+    """
+    dtypes = dict(dtypes)
+    for column, values in chunk.items():
+        if dtypes.get(column) == "object":
+            continue
+        if values.dtype != object:
+            dtype = {"i": "int64", "u": "int64", "f": "float64"}.get(values.dtype.kind, "object")
+        else:
+            present = values.dropna()
+            numbers = pd.to_numeric(present, errors="coerce")
+            if numbers.isna().any():
+                dtype = "object"
+            elif len(present) == len(values) and numbers.dtype.kind in "iu":
+                dtype = "int64"
+            else:
+                dtype = "float64"
+        dtypes[column] = max(dtypes.get(column, dtype), dtype, key=CSV_DTYPE_ORDER.index)
+
+    return dtypes
+
+
+def cast_csv_dtypes(data: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+    """Give the rows kept from the chunks of a csv file the dtypes of the whole file.
+
+    The rows are parsed again from csv text, so their values are the same as
+    when the whole file is read at once.
+    """
+    buffer = io.StringIO()
+    data.to_csv(buffer, index=False)
+    buffer.seek(0)
+
+    return pd.read_csv(buffer, dtype={column: str if dtype == "object" else dtype
+                                      for column, dtype in dtypes.items()})
+
+
+def write_table(data: pd.DataFrame, filepath: Union[str, Path]):
+    """Write a hit table in the format given by its extension.
+
+    Parquet and feather tables are cast to `HIT_SCHEMA` first.
+    """
+    suffix = strip_compression(filepath).suffix
+    if suffix == ".parquet":
+        apply_hit_schema(data).to_parquet(filepath, index=False)
+    elif suffix == ".feather":
+        apply_hit_schema(data).reset_index(drop=True).to_feather(filepath)
+    else:
+        data.to_csv(filepath, index=False)
+
+
+def parse_blast_table(filepath: Union[str, Path],
+                      output_filepath: Union[str, Path],
+                      parser: Callable):
+    """Parse a diamond output into a hit table in the format of `output_filepath`.
+
+    Args:
+        filepath: The path to the diamond output.
+        output_filepath: The path for saving the table.
+        parser: The parse_blast function for the diamond output format.
+    """
+    if strip_compression(output_filepath).suffix == ".csv":
+        parser(filepath, output_filepath)
+        return
+
+    buffer = io.StringIO()
+    parser(filepath, buffer)
+    buffer.seek(0)
+    write_table(pd.read_csv(buffer), output_filepath)
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import re
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from biopathpred.modules.compression import open_text, strip_compression
+
+# The characters of a taxon name that are replaced in its file name
+REGEX_UNSAFE = re.compile(r"[^\w.-]+")
+
+
+def content_digest(filepath: Union[str, Path], chunk_size: int = 1 << 20) -> str:
+    """Compute the SHA-256 digest of the decompressed content of a file.
+
+    A genome has the same digest whether it is compressed or not.
+    """
+    sha = hashlib.sha256()
+    with open_text(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def load_taxa(filepath: Optional[Union[str, Path]]) -> Dict[str, str]:
+    """Load the taxon of each genome from a tab-separated file.
+
+    Each line is a genome FASTA file name (with or without its extensions)
+    and the name of its taxon, separated by a tab. Lines starting with "#"
+    are skipped.
+
+    Returns:
+        A dictionary of genome names (without extensions) and taxa.
+    """
+    taxa = {}
+    if not filepath:
+        return taxa
+    with open(filepath, "r") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            genome, taxon = line.rstrip("\n").split("\t")[:2]
+            taxa[strip_compression(genome.strip()).stem] = taxon.strip()
+
+    return taxa
+
+
+class TrainingCache():
+    """Store the prodigal training files for reuse across runs.
+
+    The training file of a genome is keyed by the digest of its content, or
+    by its taxon if it is listed in `taxa`, so that all the genomes of a
+    taxon share the training file of the first one.
+
+    Hits and misses are recorded as empty files under `stats_dir`, one per
+    genome, so that workers in different processes count them without a lock.
+
+    Attributes:
+        cache_dir: The folder that stores the training files.
+        stats_dir: The folder that records the hits and misses of a run.
+        taxa: A dictionary of genome names (without extensions) and taxa.
+    """
+    def __init__(self, cache_dir: Union[str, Path], stats_dir: Union[str, Path],
+                 taxa: Optional[Dict[str, str]] = None):
+        self.cache_dir = Path(cache_dir)
+        self.stats_dir = Path(stats_dir)
+        self.taxa = taxa or {}
+
+    def training_path(self, genome_path: Union[str, Path]) -> Path:
+        """Get the path of the training file of a genome, whether it exists or not."""
+        taxon = self.taxa.get(strip_compression(genome_path).stem)
+        if taxon is not None:
+            return self.cache_dir.joinpath("taxon", f"{REGEX_UNSAFE.sub('_', taxon)}.trn")
+
+        return self.cache_dir.joinpath("genome", f"{content_digest(genome_path)}.trn")
+
+    def lookup(self, genome_path: Union[str, Path]) -> Tuple[Path, bool]:
+        """Look up the training file of a genome and record a hit or a miss.
+
+        Returns:
+            A tuple of the path of the training file and whether it exists.
+        """
+        training_path = self.training_path(genome_path)
+        hit = training_path.is_file()
+        stats_path = self.stats_dir.joinpath("hit" if hit else "miss",
+                                              Path(genome_path).name)
+        stats_path.parent.mkdir(parents=True, exist_ok=True)
+        stats_path.touch()
+
+        return training_path, hit
+
+    def temporary_path(self, training_path: Path) -> Path:
+        """Get a unique path for writing a training file before `store`.
+
+        The path does not exist, because prodigal reads an existing training
+        file instead of writing it.
+        """
+        training_path.parent.mkdir(parents=True, exist_ok=True)
+        return training_path.with_name(f".{training_path.name}.{uuid.uuid4().hex}")
+
+    def store(self, temporary_path: Path, training_path: Path):
+        """Move a complete training file into the cache.
+
+        The file is moved at once, so other workers never read it half-written.
+        """
+        os.replace(temporary_path, training_path)
+
+    def statistics(self) -> Tuple[int, int]:
+        """Count the hits and misses recorded since `reset_statistics`."""
+        return tuple(len(list(self.stats_dir.joinpath(event).glob("*")))
+                     for event in ("hit", "miss"))
+
+    def reset_statistics(self):
+        shutil.rmtree(self.stats_dir, ignore_errors=True)
@@ -0,0 +1,67 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from biopathpred.modules.batch_scoring import start_batch_match_enzyme
+from biopathpred.modules.match_enzyme import (get_enzyme_result,
+                                              get_pathway_result,
+                                              match_enzyme_existence,
+                                              reset_enzyme_and_pathway,
+                                              start_match_enzyme,
+                                              traverse_enzyme_reaction)
+from biopathpred.modules.pathway import enzyme_dict, pathway_dict
+
+
+def traverse_pathway_objects(filepath, model):
+    """The match_enzyme result computed on the PathwayNode and Enzyme objects."""
+    reset_enzyme_and_pathway(enzyme_dict, pathway_dict)
+    match_enzyme_existence(filepath, enzyme_dict)
+    traverse_enzyme_reaction(pathway_dict[1], enzyme_dict, pathway_dict)
+    result = get_pathway_result(pathway_dict, model, False)
+    result.extend(get_enzyme_result(enzyme_dict, model, False))
+    reset_enzyme_and_pathway(enzyme_dict, pathway_dict)
+
+    return "".join(result)
+
+
+@pytest.fixture(scope="module")
+def best_blast_files(temp_dir):
+    rng = np.random.default_rng(0)
+    filepaths = ["tests/test_data/match_enzyme/GCF_match_enzyme_example.csv"]
+    for i in range(20):
+        size = rng.integers(0, 30)
+        data = pd.DataFrame({
+            "enzyme_id": rng.choice([np.nan, 0, *range(1, 13)], size=size),
+            "identity": rng.uniform(20, 100, size=size).round(3)})
+        filepaths.append(temp_dir / f"batch_scoring_{i}.csv")
+        data.to_csv(filepaths[-1], index=False)
+
+    return filepaths
+
+
+@pytest.mark.parametrize("model", ["prob", "binary"])
+def test_start_batch_match_enzyme(temp_dir, best_blast_files, model):
+    result_paths = [temp_dir / f"result_{model}_{i}.txt"
+                    for i in range(len(best_blast_files))]
+    start_batch_match_enzyme(best_blast_files, result_paths, model=model, verbose=False)
+
+    for filepath, result_path in zip(best_blast_files, result_paths):
+        with open(result_path) as f:
+            assert f.read() == traverse_pathway_objects(filepath, model)
+
+
+def test_start_match_enzyme_threads(temp_dir, best_blast_files):
+    result_paths = [temp_dir / f"thread_{i}.txt" for i in range(len(best_blast_files))]
+    threads = [threading.Thread(target=start_match_enzyme,
+                                args=(filepath, result_path, "prob", False))
+               for filepath, result_path in zip(best_blast_files, result_paths)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for filepath, result_path in zip(best_blast_files, result_paths):
+        with open(result_path) as f:
+            assert f.read() == traverse_pathway_objects(filepath, "prob")
@@ -0,0 +1,35 @@
+from benchmarks import run_benchmarks
+from benchmarks.synthetic import (synthetic_alignments, write_diamond_tabular,
+                                  write_diamond_xml)
+from biopathpred.modules.parse_blastp_tabular import parse_blast_tabular
+from biopathpred.modules.parse_blastp_xml import (parse_blast,
+                                                  parse_blast_iterparse)
+
+
+def test_synthetic_alignments(temp_dir):
+    queries, alignments = synthetic_alignments(300, seed=1)
+    assert len(queries) == 300 and alignments["query"].nunique() < 300
+    write_diamond_xml(temp_dir / "synthetic.xml", queries, alignments)
+    write_diamond_tabular(temp_dir / "synthetic.tsv", alignments)
+
+    parse_blast_iterparse(temp_dir / "synthetic.xml", temp_dir / "synthetic_iterparse.csv")
+    parse_blast(temp_dir / "synthetic.xml", temp_dir / "synthetic_biopython.csv")
+    parse_blast_tabular(temp_dir / "synthetic.tsv", temp_dir / "synthetic_tabular.csv")
+    expected = (temp_dir / "synthetic_tabular.csv").read_text()
+    assert len(expected.splitlines()) == len(alignments) + 1
+    assert (temp_dir / "synthetic_iterparse.csv").read_text() == expected
+    assert (temp_dir / "synthetic_biopython.csv").read_text() == expected
+
+
+def test_run_benchmarks(temp_dir, monkeypatch):
+    monkeypatch.setattr(run_benchmarks, "BASE_SIZES",
+                        {"queries": 50, "genomes": 2, "genes": 5, "results": 3})
+    results = run_benchmarks.run_benchmarks([1, 2], temp_dir / "benchmark_data", repeat=1)
+    assert len(results["results"]) == 14
+    assert all(result["seconds"] > 0 and result["peak_memory_mb"] is not None
+               for result in results["results"])
+
+    slower = {**results, "results": [{**result, "seconds": result["seconds"] * 2}
+                                     for result in results["results"]]}
+    assert run_benchmarks.compare_results(results, results) == []
+    assert len(run_benchmarks.compare_results(results, slower)) == 14
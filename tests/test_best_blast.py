@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from biopathpred.modules import best_blast
+from biopathpred.modules.best_blast import find_best_blast, select_best_blast
+from biopathpred.modules.parse_blastp_xml import HEADER_ELEMENT
+
+
+@pytest.fixture(scope="module")
+def parse_blast_file(temp_dir):
+    """A parse_blast table of 2000 alignments of 300 genes, with tied scores."""
+    rng = np.random.default_rng(0)
+    num = 2000
+    data = pd.DataFrame({"id": [f"NZ_CP012401.1_{i}" for i in rng.integers(0, 300, num)],
+                         "start": 1, "end": 300, "alignment_id": "Q0KDL6",
+                         "enzyme_id": rng.choice(["1", "5", "12", "-"], num),
+                         "enzyme_code": "IPA3",
+                         "product": rng.choice(["Alcohol dehydrogenase", np.nan], num),
+                         "organism": "Cupriavidus necator", "existence": 1,
+                         "gene": "adh", "score": rng.integers(30, 40, num) + 0.5,
+                         "evalue": rng.random(num) * 1e-5,
+                         "identity": np.round(rng.random(num) * 100, 3),
+                         "coverage": np.round(rng.random(num) * 100, 3)})
+    filepath = temp_dir / "best_blast_input.csv"
+    data[HEADER_ELEMENT].to_csv(filepath, index=False)
+    return filepath
+
+
+@pytest.mark.parametrize("criteria,filter", [("score", ["coverage=50"]),
+                                             ("identity", ["coverage=30", "identity=20"]),
+                                             ("evalue", [])])
+def test_find_best_blast_chunks(temp_dir, parse_blast_file, monkeypatch, criteria, filter):
+    file = pd.read_csv(parse_blast_file)
+    expected = file.loc[file.groupby(["id"])[criteria].idxmax()]
+    for column, _, threshold in best_blast.parse_filter(filter):
+        expected = expected.loc[expected[column] >= threshold]
+    expected.to_csv(temp_dir / "expected.csv", index=False)
+
+    monkeypatch.setattr(best_blast, "CHUNK_SIZE", 37)
+    find_best_blast(parse_blast_file, temp_dir / "chunked.csv", criteria, filter)
+    with open(temp_dir / "expected.csv") as f1, open(temp_dir / "chunked.csv") as f2:
+        assert f2.read() == f1.read()
+
+
+@pytest.mark.parametrize("enzyme_ids", [["1", "5", "12", np.nan],
+                                        ["1", "5", "12", np.nan, "-"]])
+def test_find_best_blast_dtypes(temp_dir, parse_blast_file, monkeypatch, enzyme_ids):
+    # Unlabeled alignments with an empty enzyme_id make it a float column
+    # when the whole table is read, so the chunks are written the same way
+    rng = np.random.default_rng(1)
+    file = pd.read_csv(parse_blast_file)
+    file["enzyme_id"] = rng.choice(enzyme_ids, len(file))
+    file.loc[:100, "enzyme_id"] = "5"
+    file.to_csv(temp_dir / "empty_enzyme_id.csv", index=False)
+    file = pd.read_csv(temp_dir / "empty_enzyme_id.csv")
+    file.loc[file.groupby(["id"])["score"].idxmax()].to_csv(
+        temp_dir / "empty_enzyme_id_expected.csv", index=False)
+
+    monkeypatch.setattr(best_blast, "CHUNK_SIZE", 37)
+    find_best_blast(temp_dir / "empty_enzyme_id.csv",
+                    temp_dir / "empty_enzyme_id_chunked.csv", "score", [])
+    expected = (temp_dir / "empty_enzyme_id_expected.csv").read_text()
+    assert (temp_dir / "empty_enzyme_id_chunked.csv").read_text() == expected
+    assert ("5.0," in expected) == ("-" not in enzyme_ids)
+
+
+def test_find_best_blast_top_n(temp_dir, parse_blast_file, monkeypatch):
+    monkeypatch.setattr(best_blast, "CHUNK_SIZE", 37)
+    find_best_blast(parse_blast_file, temp_dir / "top.csv", "score", [],
+                    top_n=2, tie_breaker="identity")
+    result = pd.read_csv(temp_dir / "top.csv")
+
+    expected = select_best_blast(pd.read_csv(parse_blast_file), "score", [],
+                                 top_n=2, tie_breaker="identity")
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+    assert result.groupby("id").size().max() <= 2
+    for _, hits in result.groupby("id", sort=False):
+        ranks = list(zip(hits["score"], hits["identity"]))
+        assert ranks == sorted(ranks, reverse=True)
+
+
+@pytest.mark.parametrize("criteria,filter,options", [
+    ("score", ["coverage=50"], []),
+    ("coverage", ["coverage=50"], ["--query-cover", "49.999"]),
+    ("identity", ["identity>=30", "coverage=50"], ["--id", "29.999"]),
+    ("score", ["evalue<=1e-5"], ["--evalue", str(1e-5 * 1.01)]),
+    ("score", ["evalue<=0.01"], []),
+    ("identity", ["evalue<=1e-5"], []),
+    ("score", ["score=50"], []),
+])
+def test_diamond_filter_options(criteria, filter, options):
+    assert best_blast.diamond_filter_options(criteria, filter) == options
+
+
+def test_select_best_blast_evalue_filter(parse_blast_file):
+    data = select_best_blast(pd.read_csv(parse_blast_file), "score", ["evalue<=5e-6"])
+    assert len(data) > 0 and (data["evalue"] <= 5e-6).all()
+    assert data["id"].is_unique
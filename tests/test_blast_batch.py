@@ -0,0 +1,62 @@
+import re
+from pathlib import Path
+
+from biopathpred.modules.blast_batch import (split_batch_tabular,
+                                             split_batch_xml,
+                                             write_batch_query)
+from biopathpred.modules.parse_blastp_xml import parse_blast
+
+DATA_DIR = Path("tests/test_data/match_enzyme")
+XML_PATH = DATA_DIR / "GCF_example.xml"
+
+
+def test_write_batch_query(temp_dir):
+    faa_paths = [temp_dir / "a.faa", temp_dir / "b.faa", temp_dir / "c.faa"]
+    faa_paths[0].write_text(">p1 # 1 # 9 # 1 # ID=1_1\nMKV\n>p2 # 3 # 9 # 1 # ID=1_2\nMK\n")
+    faa_paths[1].write_text("")
+    faa_paths[2].write_text(">p1 # 1 # 9 # -1 # ID=1_1\nMA\n")
+    query_path = temp_dir / "query.faa"
+    counts = write_batch_query(faa_paths, query_path)
+
+    assert counts == [2, 0, 1]
+    assert query_path.read_text() == (">0|p1 # 1 # 9 # 1 # ID=1_1\nMKV\n"
+                                      ">0|p2 # 3 # 9 # 1 # ID=1_2\nMK\n"
+                                      ">2|p1 # 1 # 9 # -1 # ID=1_1\nMA\n")
+
+
+def test_split_batch_xml(temp_dir):
+    # Tag the queries as if the first 10 came from another genome
+    count = 0
+
+    def tag(match):
+        nonlocal count
+        count += 1
+        return f"{match.group(1)}{int(count > 10)}|"
+
+    batch_xml = re.sub(r"(<Iteration_query-def>)", tag, XML_PATH.read_text())
+    batch_path = temp_dir / "batch.xml"
+    batch_path.write_text(batch_xml)
+    xml_paths = [temp_dir / "genome0.xml", temp_dir / "genome1.xml"]
+    split_batch_xml(batch_path, xml_paths)
+
+    rows = []
+    for xml_path in xml_paths:
+        csv_path = xml_path.with_suffix(".csv")
+        parse_blast(xml_path, csv_path)
+        rows.extend(csv_path.read_text().splitlines()[1:])
+    parse_blast(XML_PATH, temp_dir / "expected.csv")
+    expected = (temp_dir / "expected.csv").read_text().splitlines()[1:]
+
+    assert rows == expected
+    assert xml_paths[0].read_text().count("<Iteration>") == 10
+
+
+def test_split_batch_tabular(temp_dir):
+    lines = (DATA_DIR / "GCF_example.tsv").read_text().splitlines(keepends=True)
+    batch_path = temp_dir / "batch.tsv"
+    batch_path.write_text(f"1|{lines[0]}0|{lines[1]}")
+    tabular_paths = [temp_dir / "genome0.tsv", temp_dir / "genome1.tsv"]
+    split_batch_tabular(batch_path, tabular_paths)
+
+    assert tabular_paths[0].read_text() == lines[1]
+    assert tabular_paths[1].read_text() == lines[0]
@@ -0,0 +1,90 @@
+import gzip
+import shutil
+from pathlib import Path
+
+import pytest
+
+from biopathpred.modules.blast_batch import split_batch_xml
+from biopathpred.modules.compression import (check_compression, copy_file,
+                                             get_compression, is_empty,
+                                             open_text, strip_compression)
+from biopathpred.modules.parse_blastp_tabular import parse_blast_tabular
+from biopathpred.modules.parse_blastp_xml import (parse_blast,
+                                                  parse_blast_iterparse)
+from biopathpred.modules.table_io import parse_blast_table, read_table
+
+XML_PATH = Path("tests/test_data/match_enzyme/GCF_example.xml")
+
+
+def test_compression_paths():
+    assert get_compression("GCF_1.fna.gz") == "gzip"
+    assert get_compression("GCF_1.fna.zst") == "zstd"
+    assert get_compression("GCF_1.fna") is None
+    assert strip_compression("out/GCF_1.fna.gz") == Path("out/GCF_1.fna")
+    assert strip_compression("out/GCF_1.fna") == Path("out/GCF_1.fna")
+    with pytest.raises(ValueError):
+        check_compression("bzip2")
+
+
+def test_open_text_gzip(temp_dir):
+    with open_text(temp_dir / "text.txt.gz", "w") as f:
+        f.write(">p1\nMKV\n")
+    with gzip.open(temp_dir / "text.txt.gz", "rt") as f:
+        assert f.read() == ">p1\nMKV\n"
+    copy_file(temp_dir / "text.txt.gz", temp_dir / "text.txt")
+    assert (temp_dir / "text.txt").read_text() == ">p1\nMKV\n"
+
+    (temp_dir / "empty.xml.gz").write_bytes(gzip.compress(b""))
+    assert is_empty(temp_dir / "empty.xml.gz")
+    assert not is_empty(temp_dir / "text.txt.gz")
+
+
+@pytest.mark.parametrize("parser", [parse_blast, parse_blast_iterparse])
+def test_parse_compressed_xml(temp_dir, parser):
+    copy_file(XML_PATH, temp_dir / "result.xml.gz")
+    parser(XML_PATH, temp_dir / "expected.csv")
+    parser(temp_dir / "result.xml.gz", temp_dir / "result.csv.gz")
+
+    with open(temp_dir / "expected.csv") as f1, open_text(temp_dir / "result.csv.gz") as f2:
+        assert f2.read() == f1.read()
+    assert read_table(temp_dir / "result.csv.gz").equals(read_table(temp_dir / "expected.csv"))
+
+    (temp_dir / "empty.xml.gz").write_bytes(gzip.compress(b""))
+    parser(temp_dir / "empty.xml.gz", temp_dir / "empty.csv")
+
+
+def test_parse_compressed_tabular(temp_dir):
+    tabular = "p1 # 1 # 9 # 1 # ID=1_1\tsp|Q0KDL6|ADH Alcohol dehydrogenase OS=Cupriavidus " \
+              "OX=1 GN=adh PE=1 SV=1\t118.6\t5.72e-32\t43\t141\t5\t152\n"
+    (temp_dir / "result.tsv").write_text(tabular)
+    copy_file(temp_dir / "result.tsv", temp_dir / "result.tsv.gz")
+    parse_blast_tabular(temp_dir / "result.tsv", temp_dir / "expected_tabular.csv")
+    parse_blast_table(temp_dir / "result.tsv.gz", temp_dir / "result_tabular.csv.gz",
+                      parser=parse_blast_tabular)
+
+    with open(temp_dir / "expected_tabular.csv") as f1, \
+            open_text(temp_dir / "result_tabular.csv.gz") as f2:
+        assert f2.read() == f1.read()
+
+
+def test_split_batch_compressed(temp_dir):
+    batch_path = temp_dir / "batch.xml"
+    batch_path.write_text(XML_PATH.read_text().replace("<Iteration_query-def>",
+                                                       "<Iteration_query-def>0|"))
+    xml_paths = [temp_dir / "genome0.xml.gz"]
+    split_batch_xml(batch_path, xml_paths)
+    with open_text(xml_paths[0]) as f:
+        assert f.read() == XML_PATH.read_text()
+
+
+def test_open_text_zstd(temp_dir):
+    pytest.importorskip("zstandard")
+    with open_text(temp_dir / "text.txt.zst", "w") as f:
+        f.write(">p1\nMKV\n")
+    with open_text(temp_dir / "text.txt.zst") as f:
+        assert f.read() == ">p1\nMKV\n"
+    shutil.copy(XML_PATH, temp_dir / "plain.xml")
+    copy_file(temp_dir / "plain.xml", temp_dir / "result.xml.zst")
+    parse_blast_iterparse(temp_dir / "result.xml.zst", temp_dir / "zstd.csv")
+    parse_blast_iterparse(XML_PATH, temp_dir / "plain.csv")
+    assert (temp_dir / "zstd.csv").read_text() == (temp_dir / "plain.csv").read_text()
@@ -1,3 +1,5 @@
+import gzip
+import shutil
 from pathlib import Path
 
 import pytest
@@ -44,3 +46,31 @@ def test_building_blast_db(temp_dir, seq_paths, expected_database, is_filter, db
         expected = f2.read()
 
     assert result == expected, f"Result: {result}\nExpected: {expected}"
+
+
+def test_building_blast_db_duplicates(temp_dir, seq_paths, expected_database):
+    input_dir = temp_dir / "build_db_duplicates"
+    input_dir.mkdir()
+    for name in ("1_seq1.fasta", "2_seq2.fasta"):
+        shutil.copy(seq_paths[name.split("_")[1].split(".")[0]], input_dir / name)
+    # A sequence of enzyme 1 and a new one for enzyme 10, in a compressed file
+    with gzip.open(input_dir / "10_seq1.fasta.gz", "wt") as f:
+        f.write(">sp|P0A3V3|COPY 1\nMSASPLLDNQCDHLPTKMVDLTMVDKADELDRRVSDAFLEREASRGRRITQISTECSAGL\n"
+                ">sp|A0A000|NEW 2\nMKV\n")
+    # A duplicate of enzyme 1 in another case
+    with open(input_dir / "1_seq1.fasta", "a") as f:
+        f.write(">sp|P0A3V3|DUP 3\nmsaspllDNQCDHLPTKMVDLTMVDKADELDRRVSDAFLEREASRGRRITQISTECSAGL\n")
+
+    output_filepath = temp_dir / "duplicates.fasta"
+    stats = build_blast_db(input_dir, output_filepath, workers=2)
+    assert stats == {"entries": 6, "duplicates": 1, "conflicts": 2}
+    result = output_filepath.read_text()
+    assert result.startswith(expected_database["with_fragment"].read_text())
+    assert "DUP" not in result and "10~~~seq1~~~1" in result
+    with open(f"{output_filepath}.conflicts.tsv") as f:
+        assert [line.split("\t")[:4] for line in f][1:] == [
+            ["sp|Q09109|TR2M_AGRRH", "2_seq2", "sp|Q09109|TR2M_AGRRH", "1_seq1"],
+            ["sp|P0A3V3|COPY", "10_seq1", "sp|P0A3V3|TR2M_RHIRD", "1_seq1"]]
+
+    stats = build_blast_db(input_dir, output_filepath, drop_conflicts=True)
+    assert stats == {"entries": 4, "duplicates": 1, "conflicts": 2}
@@ -0,0 +1,64 @@
+from pathlib import Path
+
+import pytest
+
+from biopathpred.modules.database_building import build_blast_db
+from biopathpred.modules.database_catalog import DatabaseCatalog
+
+DATA_DIR = Path("tests/test_data/build_db")
+SEQ1 = DATA_DIR / "test_data/1_seq1.fasta"
+SEQ2 = DATA_DIR / "test_data/2_seq2.fasta"
+
+
+def test_catalog_export(temp_dir):
+    output_filepath = temp_dir / "catalog_database.fasta"
+    with DatabaseCatalog(temp_dir / "catalog.sqlite") as catalog:
+        assert catalog.add_enzyme(SEQ2) == 1
+        assert catalog.add_enzyme(SEQ1) == 3
+        with pytest.raises(ValueError):
+            catalog.add_enzyme(SEQ1)
+        assert catalog.enzymes() == [("1_seq1", 3), ("2_seq2", 1)]
+        assert catalog.find_accession("Q09109") == [("1_seq1", "sp|Q09109|TR2M_AGRRH"),
+                                                    ("2_seq2", "sp|Q09109|TR2M_AGRRH")]
+        assert catalog.find_sequence("VSYNSKFLAATVQAEPVVLDA") == ["1_seq1"]
+
+        for filter_fragment, expected in [(False, "database.fasta"),
+                                          (True, "database_no_fragment.fasta")]:
+            stats = catalog.export_fasta(output_filepath, filter_fragment=filter_fragment)
+            assert stats["conflicts"] == 1
+            assert output_filepath.read_text() == (DATA_DIR / "expected" / expected).read_text()
+        assert catalog.export_fasta(output_filepath, filter_fragment=True) is None
+
+    # The catalog is persistent
+    with DatabaseCatalog(temp_dir / "catalog.sqlite") as catalog:
+        catalog.remove_enzyme("2_seq2")
+        assert catalog.find_accession("Q09109") == [("1_seq1", "sp|Q09109|TR2M_AGRRH")]
+        with pytest.raises(ValueError):
+            catalog.remove_enzyme("2_seq2")
+        replacement = temp_dir / "1_seq1.fasta"
+        replacement.write_text(">sp|A0A000|NEW_ONE New protein\nMKV\n")
+        assert catalog.add_enzyme(replacement, replace=True) == 1
+        assert catalog.find_sequence("VSYNSKFLAATVQAEPVVLDA") == []
+        assert catalog.export_fasta(output_filepath, filter_fragment=True) is not None
+        assert output_filepath.read_text() == ">sp|A0A000|NEW_ONE 1~~~seq1~~~New protein\nMKV\n"
+
+
+def test_catalog_build_blast_db(temp_dir):
+    input_dir = temp_dir / "catalog_enzymes"
+    input_dir.mkdir()
+    with DatabaseCatalog(temp_dir / "catalog_build.sqlite") as catalog:
+        for i, length in enumerate([130, 61, 60, 5], 1):
+            sequences = ["".join("ACDEFGHIKL"[(j * k) % 10] for j in range(length))
+                         for k in range(1, 4)]
+            # A duplicate, and a sequence shared by all the enzymes
+            sequences += [sequences[0], "MKVSHARED"]
+            path = input_dir / f"{i}_enzyme{i}.fasta"
+            path.write_text("".join(f">tr|X{i}{k}|E{i} Enzyme {k}\n{sequence}\n"
+                                    for k, sequence in enumerate(sequences)))
+            catalog.add_enzyme(path)
+        catalog.export_fasta(temp_dir / "catalog_build.fasta")
+    stats = build_blast_db(input_dir, temp_dir / "expected_build.fasta")
+
+    assert stats == {"entries": 16, "duplicates": 4, "conflicts": 3}
+    assert (temp_dir / "catalog_build.fasta").read_text() == \
+        (temp_dir / "expected_build.fasta").read_text()
@@ -0,0 +1,76 @@
+import json
+import pickle
+import socket
+
+import pytest
+
+from biopathpred.modules.events import EventStream
+from biopathpred.modules.scheduler import Stage, StreamingScheduler
+
+
+def read_events(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_event_stream(temp_dir):
+    path = temp_dir / "events.jsonl"
+    events = EventStream(str(path))
+    with pytest.raises(ValueError):
+        with events.run("prodigal"):
+            events.stage_started("prodigal", 3)
+            events.genomes_finished("prodigal", ["a.fna.gz", "b.fna"], ["a.faa", None], 2.0,
+                                    queued={"prodigal": 1})
+            # A copy sent to a worker process emits nothing
+            pickle.loads(pickle.dumps(events)).emit("ignored")
+            events.job_failed("prodigal", ["c.fna"], ValueError("bad genome"))
+            raise ValueError("bad genome")
+
+    records = read_events(path)
+    assert [record["event"] for record in records] == [
+        "run_started", "stage_started", "genome_finished", "genome_finished", "error",
+        "run_failed"]
+    first, second = records[2:4]
+    assert (first["genome"], first["output"], second["genome"], second["output"]) == \
+        ("a", True, "b", False)
+    assert first["done"] == 2 and first["total"] == 3 and first["batch"] == 2
+    assert first["queued"] == {"prodigal": 1} and first["duration_s"] == 2.0
+    assert first["throughput_per_s"] > 0 and first["eta_s"] is not None
+    assert records[4]["genomes"] == ["c"]
+    assert records[5]["error"] == "ValueError: bad genome"
+
+
+def test_event_stream_socket(temp_dir):
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    socket_path = temp_dir / "events.sock"
+    server.bind(str(socket_path))
+    server.listen(1)
+    events = EventStream(f"unix:{socket_path}")
+    connection, _ = server.accept()
+    with events.run("main"):
+        events.stage_started("blast", 1)
+        events.stage_finished("blast", done=1)
+
+    with connection, connection.makefile("r") as f:
+        records = [json.loads(line) for line in f]
+    server.close()
+    assert [record["event"] for record in records] == [
+        "run_started", "stage_started", "stage_finished", "run_finished"]
+    assert records[2]["done"] == 1
+
+
+def test_streaming_scheduler_events(temp_dir):
+    path = temp_dir / "scheduler_events.jsonl"
+    events = EventStream(str(path))
+    stages = [Stage("first", lambda x: x, workers=2),
+              Stage("second", lambda x: x if x % 2 == 0 else None, workers=1)]
+    StreamingScheduler(stages, progress=False, events=events).run(range(6))
+    events.close()
+
+    records = read_events(path)
+    finished = [record for record in records if record["event"] == "genome_finished"]
+    assert sum(record["stage"] == "first" for record in finished) == 6
+    assert sum(record["stage"] == "second" for record in finished) == 6
+    assert sum(record["output"] for record in finished if record["stage"] == "second") == 3
+    assert set(finished[0]["queued"]) == {"first", "second"}
+    assert [record["stage"] for record in records
+            if record["event"] == "stage_finished"] == ["first", "second"]
@@ -0,0 +1,41 @@
+import gzip
+
+from biopathpred.modules.job_order import (adaptive_chunksize,
+                                           estimate_makespan, job_cost,
+                                           longest_first)
+
+
+def test_job_cost(temp_dir):
+    plain = temp_dir / "cost.fna"
+    plain.write_bytes(b">contig\n" + b"ACGT" * 100 + b"\n")
+    compressed = temp_dir / "cost.fna.gz"
+    compressed.write_bytes(gzip.compress(plain.read_bytes()))
+
+    assert job_cost(plain) == plain.stat().st_size
+    # Compressed files are scaled up to about their uncompressed size
+    assert job_cost(compressed) == 4 * compressed.stat().st_size
+    assert job_cost([plain, compressed]) == job_cost(plain) + job_cost(compressed)
+
+
+def test_longest_first():
+    costs = [1, 5, 3, 5]
+    assert longest_first(costs) == [1, 3, 2, 0]
+    # The largest jobs are dealt to different chunks
+    assert longest_first(costs, chunksize=2) == [1, 2, 3, 0]
+    assert sorted(longest_first(list(range(7)), chunksize=3)) == list(range(7))
+    assert longest_first([], chunksize=3) == []
+
+
+def test_estimate_makespan():
+    # A chunk of large jobs at the end leaves the other workers idle
+    costs = [1] * 30 + [100] * 3
+    assert estimate_makespan(costs, 4, 10) == 300
+    order = longest_first(costs, 2)
+    assert estimate_makespan([costs[i] for i in order], 4, 2) == 101
+    assert estimate_makespan([], 4, 1) == 0
+
+
+def test_adaptive_chunksize():
+    assert adaptive_chunksize(10, 4) == 1
+    assert adaptive_chunksize(100, 4) == 6
+    assert adaptive_chunksize(10000, 4) == 10
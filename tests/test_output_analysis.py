@@ -1,7 +1,14 @@
 import tempfile
 from pathlib import Path
 
-from biopathpred.modules.result_summary import result_summary
+import numpy as np
+import pytest
+
+import biopathpred.modules.result_summary as result_summary_module
+from biopathpred.modules.result_summary import (STATE_FILENAME,
+                                                SummaryStatistics,
+                                                merge_summaries,
+                                                result_summary)
 
 DATA_DIR = Path(__file__).parent / "test_data/mapping_analysis/test_data"
 EXPECTED_DIR = Path(__file__).parent / "test_data/mapping_analysis/expected"
@@ -20,3 +27,60 @@ def test_enzyme_mapping_analysis():
         with open(EXPECTED_DIR / "prediction_output.csv") as expected, \
                 open(tmpdirname / "prediction_output.csv") as output:
             assert expected.read() == output.read()
+
+
+def test_summary_statistics_merge():
+    rng = np.random.default_rng(0)
+    values = rng.random((50, 4))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    # The first results have no values for the last two keys
+    values[:20, 2:] = np.nan
+    keys = ["a", "b", "c", "d"]
+    expected = SummaryStatistics(keys, values)
+    result = SummaryStatistics(keys[:2], values[:20, :2])
+    result.merge(SummaryStatistics(keys, values[20:35]))
+    result.merge(SummaryStatistics(keys[::-1], values[35:, ::-1]))
+    result.merge(SummaryStatistics())
+
+    assert result.keys == keys
+    for attribute in ["count", "total", "minimum", "maximum", "mean", "m2"]:
+        assert np.allclose(getattr(result, attribute), getattr(expected, attribute))
+    assert np.allclose(expected.m2 / (expected.count - 1),
+                       np.nanvar(values, axis=0, ddof=1))
+
+
+def test_result_summary_chunks(monkeypatch):
+    monkeypatch.setattr(result_summary_module, "CHUNK_SIZE", 1)
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tmpdirname = Path(tmpdirname)
+        result_summary(DATA_DIR, tmpdirname, processes=2)
+        for filename in ["compound_output.csv", "enzyme_output.csv",
+                         "prediction_output.csv"]:
+            with open(EXPECTED_DIR / filename) as expected, \
+                    open(tmpdirname / filename) as output:
+                assert expected.read() == output.read()
+
+
+def test_merge_summaries():
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        tmpdirname = Path(tmpdirname)
+        state_paths = []
+        for index in range(1, 4):
+            shard_dir = tmpdirname / f"shard_{index}"
+            shard_dir.mkdir()
+            result_summary(DATA_DIR, shard_dir, shard=(index, 3))
+            state_paths.append(shard_dir / STATE_FILENAME)
+        merged_dir = tmpdirname / "merged"
+        merged_dir.mkdir()
+
+        assert merge_summaries(state_paths[::-1], merged_dir) == \
+            len(list(DATA_DIR.glob("**/*.txt")))
+        for filename in ["compound_output.csv", "enzyme_output.csv",
+                         "prediction_output.csv"]:
+            with open(EXPECTED_DIR / filename) as expected, \
+                    open(merged_dir / filename) as output:
+                assert expected.read() == output.read()
+        with pytest.raises(ValueError):
+            merge_summaries(state_paths[:2], merged_dir)
+        with pytest.raises(ValueError):
+            merge_summaries(state_paths + state_paths[:1], merged_dir)
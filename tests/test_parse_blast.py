@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from biopathpred.modules.parse_blastp_tabular import parse_blast_tabular
+from biopathpred.modules.parse_blastp_xml import (HEADER, parse_blast,
+                                                  parse_blast_iterparse)
+
+DATA_DIR = Path("tests/test_data/match_enzyme")
+
+
+def test_parse_blast_tabular(temp_dir):
+    parse_blast(DATA_DIR / "GCF_example.xml", temp_dir / "xml.csv")
+    parse_blast_tabular(DATA_DIR / "GCF_example.tsv", temp_dir / "tabular.csv")
+    with open(temp_dir / "xml.csv") as f1, open(temp_dir / "tabular.csv") as f2:
+        expected = f1.read()
+        result = f2.read()
+
+    assert len(expected.splitlines()) == 3
+    assert result == expected, f"Result: {result}\nExpected: {expected}"
+
+
+def test_parse_blast_iterparse(temp_dir):
+    parse_blast(DATA_DIR / "GCF_example.xml", temp_dir / "biopython.csv")
+    parse_blast_iterparse(DATA_DIR / "GCF_example.xml", temp_dir / "iterparse.csv")
+    with open(temp_dir / "biopython.csv") as f1, open(temp_dir / "iterparse.csv") as f2:
+        expected = f1.read()
+        result = f2.read()
+
+    assert result == expected, f"Result: {result}\nExpected: {expected}"
+
+
+def test_parse_blast_iterparse_empty(temp_dir):
+    empty_path = temp_dir / "empty.xml"
+    empty_path.touch()
+    parse_blast_iterparse(empty_path, temp_dir / "empty.csv")
+    with open(temp_dir / "empty.csv") as f:
+        result = f.read()
+
+    assert result == HEADER
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pytest
+
+from biopathpred.modules.pathway import compiled_pathway, load_pathway
+
+DEFINITION_PATH = "pathway/definition/IAA_pathway.toml"
+
+
+def test_load_pathway():
+    pathway = load_pathway(DEFINITION_PATH)
+    for attribute in ["compound_ids", "default_visited", "indegree", "enzyme_ids",
+                      "edge_enzyme", "edge_reactant", "edge_product",
+                      "edge_completes", "topological_order"]:
+        assert np.array_equal(getattr(pathway, attribute),
+                              getattr(compiled_pathway, attribute)), attribute
+    assert pathway.compound_names == compiled_pathway.compound_names
+    assert pathway.enzyme_names == compiled_pathway.enzyme_names
+    assert pathway.target == "iaa"
+    assert load_pathway(DEFINITION_PATH) is pathway
+    assert not pathway.edge_enzyme.flags.writeable
+
+
+def write_definition(temp_dir, enzymes, start=[1], target=3):
+    definition = {"start": start, "target": target,
+                  "compound": [{"id": i, "name": f"c{i}"} for i in (1, 2, 3)],
+                  "enzyme": [{"id": i, "name": f"e{i}", "reactant": reactant,
+                              "product": product}
+                             for i, (reactant, product) in enumerate(enzymes, 1)]}
+    path = temp_dir / f"pathway_{len(list(temp_dir.glob('pathway_*')))}.json"
+    path.write_text(json.dumps(definition))
+
+    return path
+
+
+def test_evaluate_pathway(temp_dir):
+    pathway = load_pathway(write_definition(temp_dir, [(1, 2), (2, 3), (1, 3)]))
+    enzyme_prob = np.array([[0.5, 0.5, 0.0], [0.0, 0.0, 0.0]])
+    compound_prob, visited = pathway.evaluate(enzyme_prob, enzyme_prob > 0)
+
+    assert np.allclose(compound_prob, [[1, 0.5, 0.25], [1, 0, 0]])
+    assert visited.tolist() == [[True, True, True], [True, False, False]]
+
+
+@pytest.mark.parametrize("enzymes, start, target, message", [
+    ([(1, 2), (2, 3), (3, 2)], [1], 3, "cycle"),
+    ([(1, 2), (2, 4)], [1], 3, "unknown product"),
+    ([(1, 2), (2, 3)], [5], 3, "unknown starting compound"),
+    ([(1, 2), (2, 3)], [1], None, "unknown target compound"),
+])
+def test_invalid_pathway(temp_dir, enzymes, start, target, message):
+    with pytest.raises(ValueError, match=message):
+        load_pathway(write_definition(temp_dir, enzymes, start, target))
@@ -0,0 +1,222 @@
+import http.client
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from biopathpred import cli
+from biopathpred.cli import main
+from biopathpred.modules.table_io import read_table
+
+REPO_PATH = Path(__file__).parents[1]
+TEST_DATA_PATH = Path(__file__).parent / "test_data/match_enzyme"
+
+# Stand-ins for prodigal and diamond that log their command lines
+FAKE_PRODIGAL = """#!{python}
+import json, sys
+args = sys.argv[1:]
+with open({log!r}, "a") as f:
+    f.write(json.dumps(["prodigal", *args]) + "\\n")
+def opt(flag):
+    return args[args.index(flag) + 1] if flag in args else None
+data = open(opt("-i")).read() if opt("-i") else sys.stdin.read()
+if data.startswith(">short"):
+    sys.exit("Sequence is too short to train")
+if opt("-t") and not opt("-a"):
+    open(opt("-t"), "w").write("trained\\n")
+    sys.exit(0)
+with open(opt("-a"), "w") as f:
+    for i, contig in enumerate(data.split(">")[1:], 1):
+        f.write(f">{{contig.split()[0]}}_1 # 1 # 300 # 1 # ID={{i}}_1;partial=00\\nMKV\\n")
+"""
+FAKE_DIAMOND = """#!{python}
+import json, sys
+args = sys.argv[1:]
+with open({log!r}, "a") as f:
+    f.write(json.dumps(["diamond", *args]) + "\\n")
+def opt(flag):
+    return args[args.index(flag) + 1] if flag in args else None
+queries = [line[1:].strip() for line in open(opt("-q")) if line.startswith(">")]
+rows = open({hits!r}).read().splitlines()
+with open(opt("-o"), "w") as f:
+    for query in queries:
+        for row in rows:
+            f.write(query + "\\t" + row.split("\\t", 1)[1] + "\\n")
+"""
+CONFIG = """[pipeline]
+scheduler = "{scheduler}"
+fused = false
+intermediate_format = "{table_format}"
+
+[prodigal]
+training_cache = {training_cache}
+
+[database]
+path = {database!r}
+
+[blast]
+outfmt = "tabular"
+
+[criteria]
+column = "score"
+filter = ["coverage=50"]
+
+[match_enzyme]
+model = "prob"
+
+[executable]
+prodigal_path = "./bin/prodigal"
+diamond_path = "./bin/diamond"
+"""
+
+
+def make_workspace(path: Path, scheduler: str = "stage", table_format: str = "csv",
+                   training_cache: bool = False, genome_num: int = 3) -> Path:
+    """Create a working folder with genomes, a config.toml and fake executables."""
+    path.mkdir()
+    bin_path = path / "bin"
+    bin_path.mkdir()
+    log = str(path / "commands.jsonl")
+    for name, script in (("prodigal", FAKE_PRODIGAL), ("diamond", FAKE_DIAMOND)):
+        executable = bin_path / name
+        executable.write_text(script.format(python=sys.executable, log=log,
+                                            hits=str(TEST_DATA_PATH / "GCF_example.tsv")))
+        executable.chmod(0o755)
+    path.joinpath("config.toml").write_text(CONFIG.format(
+        scheduler=scheduler, table_format=table_format,
+        training_cache=str(training_cache).lower(),
+        database=str(REPO_PATH / "pathway/database/IAA_database_complete.dmnd")))
+    input_path = path / "genomes"
+    input_path.mkdir()
+    for i in range(genome_num):
+        input_path.joinpath(f"genome_{i}.fna").write_text(
+            "".join(f">contig_{j}\nACGTACGT\n" for j in range(i + 1)))
+
+    return path
+
+
+def run_pipeline(workspace: Path, monkeypatch, *args: str):
+    """Run the pipeline in a working folder, and return the logged commands."""
+    log = workspace / "commands.jsonl"
+    log.unlink(missing_ok=True)
+    monkeypatch.chdir(workspace)
+    monkeypatch.setattr(sys, "argv", ["biopathpred", "-i", "genomes", "-o", "output",
+                                      *args])
+    main()
+    if not log.is_file():
+        return []
+    return [json.loads(line) for line in log.read_text().splitlines()]
+
+
+def test_stage_resume(temp_dir, monkeypatch):
+    workspace = make_workspace(temp_dir / "stage_resume")
+    commands = run_pipeline(workspace, monkeypatch)
+    summary_path = workspace / "output/result_summary"
+    summary = {path.name: path.read_text() for path in summary_path.iterdir()}
+    assert sum(command[0] == "prodigal" for command in commands) == 3
+    assert not (workspace / "output/prodigal").exists()
+
+    # The intermediate files were removed, but the genomes are up to date
+    assert run_pipeline(workspace, monkeypatch, "--resume") == []
+    assert {path.name: path.read_text() for path in summary_path.iterdir()} == summary
+
+    workspace.joinpath("genomes/genome_0.fna").write_text(">contig_0\nACGTACGA\n")
+    commands = run_pipeline(workspace, monkeypatch, "--resume")
+    assert [command[0] for command in commands] == ["prodigal", "diamond"]
+
+
+def test_streaming_parse_blast_columnar(temp_dir, monkeypatch):
+    pytest.importorskip("pyarrow")
+    workspace = make_workspace(temp_dir / "streaming_parquet", scheduler="stream",
+                               table_format="parquet")
+    run_pipeline(workspace, monkeypatch, "--debug")
+
+    # The streaming parse_blast stage writes the tables through the table writer
+    tables = sorted((workspace / "output/parse_blast").iterdir())
+    assert [table.name for table in tables] == [f"genome_{i}.parquet" for i in range(3)]
+    for table in tables:
+        assert table.read_bytes()[:4] == b"PAR1"
+        assert len(read_table(table)) > 0
+    assert len(list((workspace / "output/match_enzyme_result").glob("*.txt"))) == 3
+
+
+def test_prodigal_runs_once_per_genome(temp_dir, monkeypatch):
+    # Without the training cache, each genome is predicted in one run
+    workspace = make_workspace(temp_dir / "prodigal_once")
+    commands = run_pipeline(workspace, monkeypatch)
+    prodigal_commands = [command for command in commands if command[0] == "prodigal"]
+    assert len(prodigal_commands) == 3
+    assert all("-a" in command and "-t" not in command for command in prodigal_commands)
+
+
+def test_training_cache_reuse(temp_dir, monkeypatch):
+    workspace = make_workspace(temp_dir / "training_cache", training_cache=True)
+    commands = run_pipeline(workspace, monkeypatch)
+    prodigal_commands = [command for command in commands if command[0] == "prodigal"]
+    # A miss trains prodigal ahead, then predicts with the new training file
+    training = [command for command in prodigal_commands if "-a" not in command]
+    assert len(training) == 3 and len(prodigal_commands) == 6
+    training_paths = {command[command.index("-t") + 1] for command in prodigal_commands
+                      if "-a" in command}
+    assert len(training_paths) == 3
+    summary_path = workspace / "output/result_summary"
+    summary = {path.name: path.read_text() for path in summary_path.iterdir()}
+
+    # Screening the same genomes again reuses the training files
+    commands = run_pipeline(workspace, monkeypatch)
+    prodigal_commands = [command for command in commands if command[0] == "prodigal"]
+    assert len(prodigal_commands) == 3
+    assert {command[command.index("-t") + 1] for command in prodigal_commands
+            if "-a" in command} == training_paths
+    assert {path.name: path.read_text() for path in summary_path.iterdir()} == summary
+
+
+def test_serve_submissions(temp_dir, monkeypatch):
+    workspace = make_workspace(temp_dir / "serve", genome_num=0)
+    servers = []
+    started = threading.Event()
+
+    def make_server(*args, **kwargs):
+        servers.append(cli_make_server(*args, **kwargs))
+        started.set()
+        return servers[0]
+
+    cli_make_server = cli.make_server
+    monkeypatch.setattr(cli, "make_server", make_server)
+    monkeypatch.chdir(workspace)
+    monkeypatch.setattr(sys, "argv", ["biopathpred", "serve", "-o", "output",
+                                      "--port", "0", "--batch-wait", "0.5"])
+    thread = threading.Thread(target=main)
+    thread.start()
+    assert started.wait(10)
+
+    def score(fasta):
+        connection = http.client.HTTPConnection("127.0.0.1", servers[0].server_address[1])
+        connection.request("POST", "/score?name=submission", body=fasta)
+        response = connection.getresponse()
+        data = json.loads(response.read())
+        connection.close()
+        return response.status, data
+
+    try:
+        # A plain protein FASTA and a genome that prodigal fails on are
+        # scored in the same batch as a genome
+        with ThreadPoolExecutor(3) as executor:
+            responses = list(executor.map(score, [
+                b">WP_000001.1 IaaM tryptophan monooxygenase\nMKVLAAGIT\n",
+                b">contig_0\nACGTACGT\n", b">short\nACGT\n"]))
+    finally:
+        servers[0].shutdown()
+        thread.join()
+
+    (protein_status, protein), (genome_status, genome), (short_status, short) = responses
+    assert (protein_status, genome_status, short_status) == (200, 200, 500)
+    assert protein["type"] == "protein"
+    assert protein["compounds"] == genome["compounds"]
+    assert protein["enzymes"] == genome["enzymes"] != {}
+    assert genome["batch"] == 3
+    assert "prodigal failed" in short["error"]
+    assert not list((workspace / "output/submissions").iterdir())
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from biopathpred.modules.best_blast import find_best_blast
+from biopathpred.modules.match_enzyme import start_match_enzyme
+from biopathpred.modules.parse_blastp_xml import parse_blast_iterparse
+from biopathpred.modules.post_alignment import start_post_alignment
+
+XML_PATH = Path("tests/test_data/match_enzyme/GCF_example.xml")
+
+
+def test_start_post_alignment(temp_dir):
+    filter = ["coverage=50"]
+    parse_blast_iterparse(XML_PATH, temp_dir / "parse_blast.csv")
+    find_best_blast(temp_dir / "parse_blast.csv", temp_dir / "best_blast.csv",
+                    criteria="score", filter=filter)
+    start_match_enzyme(temp_dir / "best_blast.csv", temp_dir / "expected.txt",
+                       model="prob", verbose=False)
+
+    start_post_alignment(XML_PATH, temp_dir / "fused.txt",
+                         parser=parse_blast_iterparse, criteria="score",
+                         filter=filter, model="prob", verbose=False,
+                         parse_blast_filepath=temp_dir / "fused_parse_blast.csv",
+                         best_blast_filepath=temp_dir / "fused_best_blast.csv")
+
+    for expected, result in [("expected.txt", "fused.txt"),
+                             ("parse_blast.csv", "fused_parse_blast.csv"),
+                             ("best_blast.csv", "fused_best_blast.csv")]:
+        with open(temp_dir / expected) as f1, open(temp_dir / result) as f2:
+            assert f2.read() == f1.read(), f"{result} differs from {expected}"
@@ -0,0 +1,54 @@
+import pytest
+
+from biopathpred.modules.prodigal_shard import (count_contig_bases,
+                                                merge_shards, plan_shards,
+                                                write_shards)
+
+CONTIGS = [("NZ_CP012401.1", 120), ("contig_2", 35), ("contig_3", 70),
+           ("contig_4", 10), ("contig_5", 90)]
+
+
+def write_proteins(fna_path, faa_path):
+    """Write two proteins per contig with prodigal headers, like prodigal -a."""
+    with open(fna_path) as f:
+        contigs = [line[1:].split()[0] for line in f if line.startswith(">")]
+    with open(faa_path, "w") as f:
+        for i, contig in enumerate(contigs, 1):
+            for j in (1, 2):
+                f.write(f">{contig}_{j} # {j * 3} # {j * 3 + 8} # 1 # "
+                        f"ID={i}_{j};partial=00;start_type=ATG;gc_cont=0.650\nMKV*\n")
+
+
+@pytest.fixture(scope="module")
+def genome(temp_dir):
+    fna_path = temp_dir / "shard_genome.fna"
+    with open(fna_path, "w") as f:
+        for name, length in CONTIGS:
+            f.write(f">{name} description\n")
+            for start in range(0, length, 50):
+                f.write("A" * min(50, length - start) + "\n")
+    return fna_path
+
+
+def test_plan_shards():
+    assert plan_shards([10] * 10, 4) == [3, 3, 2, 2]
+    assert plan_shards([100, 1, 1, 1, 1], 3) == [1, 2, 2]
+    assert plan_shards([5], 4) == [1]
+
+
+@pytest.mark.parametrize("shard_num", [1, 2, 3, 5])
+def test_merge_shards(temp_dir, genome, shard_num):
+    assert count_contig_bases(genome) == [length for _, length in CONTIGS]
+    contig_counts = plan_shards(count_contig_bases(genome), shard_num)
+    shard_paths = [temp_dir / f"shard_{i}.fna" for i in range(len(contig_counts))]
+    faa_paths = [path.with_suffix(".faa") for path in shard_paths]
+    write_shards(genome, shard_paths, contig_counts)
+    for shard_path, faa_path in zip(shard_paths, faa_paths):
+        write_proteins(shard_path, faa_path)
+    merge_shards(faa_paths, contig_counts, temp_dir / "merged.faa")
+
+    with open(genome) as f:
+        assert "".join(path.read_text() for path in shard_paths) == f.read()
+    write_proteins(genome, temp_dir / "expected.faa")
+    with open(temp_dir / "expected.faa") as f1, open(temp_dir / "merged.faa") as f2:
+        assert f2.read() == f1.read()
@@ -0,0 +1,68 @@
+import contextvars
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from biopathpred.cli import run_executable
+from biopathpred.modules.profiler import Profiler, measure_sizes
+
+
+def test_measure_sizes(temp_dir):
+    genome = temp_dir / "sizes.fna"
+    genome.write_text(">contig_1\nACGT\n>contig_2\nACGT\n")
+    proteins = temp_dir / "sizes.faa"
+    proteins.write_text(">contig_1_1\nM\n")
+    hits = temp_dir / "sizes.tsv"
+    hits.write_text("a\tb\nc\td\n")
+
+    sizes = measure_sizes("prodigal", [genome], [proteins])
+    assert sizes == {"input_bytes": genome.stat().st_size,
+                     "output_bytes": proteins.stat().st_size,
+                     "contigs": 2, "proteins": 1}
+    assert measure_sizes("blast", [proteins], [hits])["hits"] == 2
+    # A failed job has no output
+    assert measure_sizes("parse_blast", [hits], [None])["output_bytes"] == 0
+
+
+@pytest.mark.skipif(not Path("/proc/thread-self/io").exists(),
+                    reason="the bytes read and written are read from /proc")
+def test_profiler(temp_dir):
+    profiler = Profiler(temp_dir / ".profile")
+    output = temp_dir / "profiled.txt"
+    command = [sys.executable, "-c",
+               f"open({str(output)!r}, 'w').write('x' * 100000)"]
+
+    with profiler.job("prodigal", [temp_dir / "profiled.fna"]) as record:
+        # The children started from other threads are added to the same job
+        with ThreadPoolExecutor(2) as executor:
+            futures = [executor.submit(contextvars.copy_context().run,
+                                       run_executable, command)
+                       for _ in range(2)]
+            assert all(future.result().returncode == 0 for future in futures)
+        record["outputs"] = [output]
+    with pytest.raises(RuntimeError):
+        with profiler.job("prodigal", [temp_dir / "failed.fna"]):
+            raise RuntimeError
+    # Children run outside a profiled job are not recorded
+    assert run_executable(command).returncode == 0
+
+    records = profiler.records()
+    assert len(records) == 1
+    children = records[0]["children"]
+    assert len(children) == 2
+    assert all(child["write_bytes"] >= 100000 and child["peak_rss_kb"] > 0
+               for child in children)
+    assert records[0]["output_bytes"] == 100000
+
+    report = profiler.report(temp_dir / "profile.json")
+    stage = report["stages"]["prodigal"]
+    assert stage["jobs"] == 1 and stage["genomes"] == 1
+    assert stage["child_write_bytes"] >= 200000
+    assert stage["slowest"][0]["genomes"] == ["profiled"]
+    assert json.loads((temp_dir / "profile.json").read_text()) == report
+
+    profiler.reset()
+    assert not profiler.record_dir.exists()
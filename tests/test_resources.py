@@ -0,0 +1,47 @@
+import pytest
+
+from biopathpred.modules.resources import (GIB, ResourcePlan,
+                                           estimate_diamond_memory,
+                                           parse_memory, split_cpus)
+
+
+def test_parse_memory():
+    assert parse_memory("16G") == 16 * GIB
+    assert parse_memory("512MiB") == 512 * 1024 ** 2
+    assert parse_memory("1.5g") == int(1.5 * GIB)
+    assert parse_memory("1000") == 1000
+    with pytest.raises(ValueError):
+        parse_memory("lots")
+
+
+@pytest.mark.parametrize("cpus,memory", [(1, 2), (16, 64), (16, 8), (64, 16)])
+def test_resource_plan(cpus, memory):
+    plan = ResourcePlan(cpus, memory * GIB)
+    diamond_memory = estimate_diamond_memory(plan.diamond_block_size,
+                                             plan.diamond_index_chunks)
+
+    assert 1 <= plan.diamond_jobs * plan.diamond_threads <= cpus
+    assert 1 <= plan.prodigal_workers <= cpus
+    assert 1 <= plan.python_workers <= cpus
+    assert plan.diamond_jobs == 1 or plan.diamond_jobs * diamond_memory <= memory * GIB
+
+
+@pytest.mark.parametrize("cpus,memory,shards", [(3, 8, 1), (8, 32, 1), (16, 64, 4),
+                                                (64, 256, 8), (32, 8, 2)])
+def test_streaming_resource_plan(cpus, memory, shards):
+    plan = ResourcePlan(cpus, memory * GIB, streaming=True, prodigal_shards=shards)
+
+    # The modules run at the same time, so they share the CPUs
+    assert (plan.prodigal_workers * plan.prodigal_threads
+            + plan.diamond_jobs * plan.diamond_threads
+            + plan.python_workers) <= cpus
+    assert plan.prodigal_threads <= shards
+    assert min(plan.prodigal_workers, plan.diamond_jobs, plan.python_workers) >= 1
+
+
+def test_split_cpus():
+    shares = {"a": 0.5, "b": 0.3, "c": 0.2}
+    assert split_cpus(10, shares) == {"a": 5, "b": 3, "c": 2}
+    assert sum(split_cpus(7, shares).values()) == 7
+    # Each module gets at least one CPU
+    assert split_cpus(2, shares) == {"a": 1, "b": 1, "c": 1}
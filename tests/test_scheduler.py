@@ -0,0 +1,35 @@
+import pytest
+
+from biopathpred.modules.scheduler import Stage, StreamingScheduler
+
+
+def add_one(x):
+    return x + 1
+
+
+def drop_odd(x):
+    return x if x % 2 == 0 else None
+
+
+def fail_on_three(x):
+    if x == 3:
+        raise ValueError("three")
+    return x
+
+
+def test_streaming_scheduler():
+    stages = [Stage("add", add_one, workers=3, queue_size=1),
+              Stage("drop", drop_odd, workers=2, executor="process"),
+              Stage("double", lambda x: 2 * x, workers=1)]
+    scheduler = StreamingScheduler(stages, process_workers=2, progress=False)
+    result = scheduler.run(range(20))
+
+    assert sorted(result) == [2 * x for x in range(1, 21) if x % 2 == 0]
+
+
+def test_streaming_scheduler_error():
+    stages = [Stage("fail", fail_on_three, workers=2),
+              Stage("add", add_one, workers=2)]
+    scheduler = StreamingScheduler(stages, progress=False)
+    with pytest.raises(ValueError):
+        scheduler.run(range(10))
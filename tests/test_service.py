@@ -0,0 +1,159 @@
+import http.client
+import json
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from biopathpred.modules.result_summary import Result
+from biopathpred.modules.parse_blastp_xml import parse_blast_iterparse
+from biopathpred.modules.service import (ScoringService, ServiceBusy,
+                                         Submission, detect_sequence_type,
+                                         make_server, prodigal_headers)
+
+RESULT_PATH = Path(__file__).parent / "test_data/mapping_analysis/test_data/species1.txt"
+XML_PATH = Path(__file__).parent / "test_data/match_enzyme/GCF_example.xml"
+
+
+def test_detect_sequence_type():
+    assert detect_sequence_type(b">contig_1\nACGTNacgt\n") == "genome"
+    assert detect_sequence_type(b">protein_1\nMKVLAAGIT\n") == "protein"
+
+
+def test_prodigal_headers(temp_dir):
+    fasta = (b">WP_000001.1 IaaM tryptophan monooxygenase\nMKVL\nAAG*\n"
+             b">contig_1_1 # 3 # 11 # -1 # ID=1_1\nMKV\n>\nMK\n")
+    assert prodigal_headers(fasta) == (
+        b">WP_000001.1 # 1 # 7 # 1 # IaaM tryptophan monooxygenase\nMKVL\nAAG*\n"
+        b">contig_1_1 # 3 # 11 # -1 # ID=1_1\nMKV\n>protein_3 # 1 # 2 # 1 # \nMK\n")
+
+    # The blast parsers read the rewritten headers
+    header = prodigal_headers(b">WP_000001.1 IaaM tryptophan monooxygenase\nMKV\n")
+    xml_path = temp_dir / "protein_submission.xml"
+    xml_path.write_text(re.sub("<Iteration_query-def>.*</Iteration_query-def>",
+                               f"<Iteration_query-def>{header[1:].decode().splitlines()[0]}"
+                               "</Iteration_query-def>", XML_PATH.read_text()))
+    output_path = temp_dir / "protein_submission.csv"
+    parse_blast_iterparse(xml_path, output_path)
+    rows = output_path.read_text().splitlines()[1:]
+    assert rows and all(row.startswith("WP_000001.1,1,3,") for row in rows)
+
+
+def test_scoring_service(temp_dir):
+    output_dir = temp_dir / "service_outputs"
+    output_dir.mkdir()
+    batches = []
+
+    def score_batch(submissions):
+        batches.append([submission.sequence_type for submission in submissions])
+        outputs = []
+        for submission in submissions:
+            if b"empty" in submission.path.read_bytes():
+                outputs.append(None)
+                continue
+            output = output_dir / f"{submission.path.stem}.txt"
+            shutil.copy(RESULT_PATH, output)
+            outputs.append(output)
+        return outputs
+
+    input_dir = temp_dir / "service_submissions"
+    input_dir.mkdir()
+    service = ScoringService(score_batch, target="iaa", batch_size=4, batch_wait=0.5)
+    server = make_server(service, input_dir, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def request(method, path, body=None):
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        data = json.loads(response.read())
+        connection.close()
+        return response.status, data
+
+    try:
+        # The submissions that arrive together are scored in one batch
+        with ThreadPoolExecutor(3) as executor:
+            responses = list(executor.map(
+                lambda body: request("POST", "/score?name=g", body),
+                [b">contig\nACGT\n", b">contig\nACGT\n", b">protein\nMKV\n"]))
+        expected = Result(RESULT_PATH)
+        assert [status for status, _ in responses] == [200, 200, 200]
+        status, data = responses[0]
+        assert data["compounds"] == expected.compound_dict
+        assert data["enzymes"] == expected.enzyme_dict
+        assert data["prediction"] == expected.compound_dict["iaa"]
+        assert sorted(batches[0]) == ["genome", "genome", "protein"]
+        assert all(data["batch"] == 3 for _, data in responses)
+
+        assert request("POST", "/score?type=protein", b">empty\nMKV\n")[0] == 422
+        assert request("POST", "/score", b"not a fasta file")[0] == 400
+        assert request("POST", "/score?type=rna", b">contig\nACGU\n")[0] == 400
+        assert request("GET", "/health") == (200, {"status": "ok", "queued": 0, "scored": 4})
+        assert request("GET", "/missing")[0] == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+    # The submitted and output files are removed
+    assert not list(input_dir.iterdir())
+    assert not list(output_dir.iterdir())
+
+
+def test_scoring_service_errors(temp_dir):
+    input_dir = temp_dir / "service_errors"
+    input_dir.mkdir()
+
+    def score_batch(submissions):
+        if b"exit" in submissions[0].path.read_bytes():
+            # An executable failed
+            raise SystemExit
+        return [ValueError("Bad genome")]
+
+    service = ScoringService(score_batch, target="iaa", batch_size=1, batch_wait=0)
+    server = make_server(service, input_dir, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for fasta, error in ((b">exit\nACGT\n", "ScoringError: Scoring failed: SystemExit"),
+                             (b">contig\nACGT\n", "ValueError: Bad genome")):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+            connection.request("POST", "/score", body=fasta)
+            response = connection.getresponse()
+            assert (response.status, json.loads(response.read())) == (500, {"error": error})
+            connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_scoring_service_timeout(temp_dir):
+    input_dir = temp_dir / "service_timeout"
+    input_dir.mkdir()
+    release = threading.Event()
+
+    def score_batch(submissions):
+        release.wait()
+        return [None] * len(submissions)
+
+    service = ScoringService(score_batch, target="iaa", batch_wait=0, timeout=0.2)
+    server = make_server(service, input_dir, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        connection.request("POST", "/score", body=b">contig\nACGT\n")
+        # A wedged batch does not hold the request forever
+        assert connection.getresponse().status == 504
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        release.set()
+        service.close()
+
+    # The submissions made once the service is closing are refused
+    with pytest.raises(ServiceBusy):
+        service.submit(Submission("late", b">contig\nACGT\n", input_dir))
+    assert not list(input_dir.iterdir())
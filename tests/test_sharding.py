@@ -0,0 +1,20 @@
+import pytest
+
+from biopathpred.modules.sharding import genome_shard, in_shard, parse_shard
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for shard in ["0/4", "5/4", "2", "a/b"]:
+        with pytest.raises(ValueError):
+            parse_shard(shard)
+
+
+def test_genome_shard():
+    genomes = [f"GCF_{i:09d}.1_genomic" for i in range(200)]
+    shards = [genome_shard(f"{genome}.fna", 4) for genome in genomes]
+    assert set(shards) == {1, 2, 3, 4}
+    # A genome is in the same shard in the output folder of every module
+    assert shards == [genome_shard(f"prodigal/{genome}.faa.gz", 4) for genome in genomes]
+    assert shards == [genome_shard(f"/other/node/{genome}.txt", 4) for genome in genomes]
+    assert sum(in_shard(f"{genome}.fna", (1, 4)) for genome in genomes) == shards.count(1)
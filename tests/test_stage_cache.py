@@ -0,0 +1,24 @@
+from biopathpred.modules.stage_cache import StageCache
+
+
+def test_stage_cache(temp_dir):
+    cache = StageCache(temp_dir / ".cache")
+    genome = temp_dir / "genome.fna"
+    genome.write_text(">contig\nACGT\n")
+    artifact = temp_dir / "prodigal" / "genome.faa"
+    artifact.parent.mkdir()
+    artifact.write_text(">contig_1\nM\n")
+
+    key = cache.stage_key("prodigal", cache.input_key(genome), {})
+    assert not cache.is_fresh(artifact, key)
+    cache.record(artifact, key)
+    assert cache.is_fresh(artifact, key)
+    # The key of a recorded artifact is chained to the next stage
+    assert cache.input_key(artifact) == key
+    assert not cache.is_fresh(artifact, cache.stage_key("prodigal", key, {}))
+
+    genome.write_text(">contig\nACGA\n")
+    assert cache.stage_key("prodigal", cache.input_key(genome), {}) != key
+
+    cache.invalidate(artifact)
+    assert not cache.is_fresh(artifact, key)
@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from biopathpred.modules.match_enzyme import start_match_enzyme
+from biopathpred.modules.parse_blastp_xml import parse_blast_iterparse
+from biopathpred.modules.table_io import (HIT_SCHEMA, apply_hit_schema,
+                                          check_table_format,
+                                          parse_blast_table, read_table,
+                                          write_table)
+
+XML_PATH = Path("tests/test_data/match_enzyme/GCF_example.xml")
+
+
+def test_apply_hit_schema(temp_dir):
+    parse_blast_table(XML_PATH, temp_dir / "parse_blast.csv", parser=parse_blast_iterparse)
+    data = read_table(temp_dir / "parse_blast.csv")
+    typed = apply_hit_schema(data)
+
+    assert list(typed.columns) == list(data.columns)
+    assert {column: str(dtype) for column, dtype in typed.dtypes.items()} == HIT_SCHEMA
+    assert typed["enzyme_id"].isna().sum() == (data["enzyme_id"] == "-").sum()
+    assert read_table(temp_dir / "parse_blast.csv", columns=["identity"]).columns.tolist() \
+        == ["identity"]
+
+
+def test_check_table_format():
+    check_table_format("csv")
+    with pytest.raises(ValueError):
+        check_table_format("xlsx")
+
+
+@pytest.mark.parametrize("format", ["parquet", "feather"])
+def test_columnar_roundtrip(temp_dir, format):
+    pytest.importorskip("pyarrow")
+    parse_blast_table(XML_PATH, temp_dir / "parse_blast.csv", parser=parse_blast_iterparse)
+    parse_blast_table(XML_PATH, temp_dir / f"parse_blast.{format}", parser=parse_blast_iterparse)
+
+    data = read_table(temp_dir / f"parse_blast.{format}")
+    pd.testing.assert_frame_equal(data, apply_hit_schema(read_table(temp_dir / "parse_blast.csv")))
+
+    write_table(data, temp_dir / f"copy.{format}")
+    pd.testing.assert_frame_equal(read_table(temp_dir / f"copy.{format}"), data)
+
+    start_match_enzyme(temp_dir / "parse_blast.csv", temp_dir / "expected.txt",
+                       model="prob", verbose=False)
+    start_match_enzyme(temp_dir / f"parse_blast.{format}", temp_dir / "result.txt",
+                       model="prob", verbose=False)
+    with open(temp_dir / "expected.txt") as f1, open(temp_dir / "result.txt") as f2:
+        assert f2.read() == f1.read()
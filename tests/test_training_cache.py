@@ -0,0 +1,40 @@
+from biopathpred.modules.compression import copy_file
+from biopathpred.modules.training_cache import TrainingCache, load_taxa
+
+
+def test_training_cache(temp_dir):
+    genome_dir = temp_dir / "training_genomes"
+    genome_dir.mkdir()
+    (genome_dir / "GCF_1.fna").write_text(">contig_1\nATGAAA\n")
+    copy_file(genome_dir / "GCF_1.fna", genome_dir / "GCF_1_copy.fna.gz")
+    (genome_dir / "GCF_2.fna").write_text(">contig_1\nATGCCC\n")
+    (genome_dir / "GCF_3.fna").write_text(">contig_1\nATGGGG\n")
+    (genome_dir / "GCF_4.fna").write_text(">contig_1\nATGTTT\n")
+    (genome_dir / "taxa.tsv").write_text("# genome\ttaxon\nGCF_3.fna.gz\tBacillus cereus\n"
+                                         "GCF_4\tBacillus cereus\n")
+    cache = TrainingCache(temp_dir / "training", temp_dir / "training_stats",
+                          taxa=load_taxa(genome_dir / "taxa.tsv"))
+    cache.reset_statistics()
+
+    training_path, hit = cache.lookup(genome_dir / "GCF_1.fna")
+    assert not hit and training_path.parent.name == "genome"
+    temporary_path = cache.temporary_path(training_path)
+    assert not temporary_path.exists()
+    temporary_path.write_text("trained")
+    cache.store(temporary_path, training_path)
+
+    # The same content is a hit, compressed or not
+    assert cache.lookup(genome_dir / "GCF_1_copy.fna.gz") == (training_path, True)
+    assert not cache.lookup(genome_dir / "GCF_2.fna")[1]
+
+    # The genomes of a taxon share one training file
+    taxon_path, hit = cache.lookup(genome_dir / "GCF_3.fna")
+    assert not hit and taxon_path.name == "Bacillus_cereus.trn"
+    temporary_path = cache.temporary_path(taxon_path)
+    temporary_path.write_text("trained")
+    cache.store(temporary_path, taxon_path)
+    assert cache.lookup(genome_dir / "GCF_4.fna") == (taxon_path, True)
+
+    assert cache.statistics() == (2, 3)
+    cache.reset_statistics()
+    assert cache.statistics() == (0, 0)